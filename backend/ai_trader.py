@@ -6,12 +6,12 @@ import os
 import json
 from pathlib import Path
 from dotenv import load_dotenv
-import pandas as pd
 from datetime import datetime
-import google.generativeai as genai
-from openai import OpenAI
 import time
 from okx_executor import OKXExecutor
+from flow_rollup import FlowRollup, rollup_path
+from instrumentation import record_llm
+import json_store
 from notifier import notify_trade_execution, notify_rejection_alert, notify_cycle_summary, escape_html # Notification System
 
 # Load environment variables
@@ -20,11 +20,24 @@ load_dotenv()
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 BASE_URL = "https://api.deepseek.com"
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
 
-# Initialize Client
-client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=BASE_URL)
+# LLM SDKs are imported and configured on first use (they dominate this module's import time)
+_llm_client = None
+
+def get_llm_client():
+    """Shared DeepSeek (OpenAI SDK) client."""
+    global _llm_client
+    if _llm_client is None:
+        from openai import OpenAI
+        _llm_client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=BASE_URL)
+    return _llm_client
+
+def get_gemini_model(name):
+    import google.generativeai as genai
+    if GEMINI_API_KEY:
+        genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel(name)
+
 VERSION = "2026.03.25.1225" # Code version for tracking deployment status
 
 # Paths
@@ -83,8 +96,7 @@ class TradeMemory:
             # Keep last 50 trades
             if len(history) > 50: history = history[-50:]
                 
-            with open(AGENT_MEMORY_PATH, "w") as f:
-                json.dump(history, f, indent=2)
+            json_store.write_json(AGENT_MEMORY_PATH, history)
             print(f"🧠 Logged trade memory for {symbol}")
             
         except Exception as e:
@@ -101,8 +113,8 @@ class TradeMemory:
         # 1. Get the absolute latest thought/reflection from the DB (even if HOLD/WAIT)
         try:
             from db_client import db
-            history_db = db.get_data("agent_decision_log", [])
-            if history_db and isinstance(history_db, list) and len(history_db) > 0:
+            history_db = db.query("agent_decision_log", sort=[("timestamp", -1)], limit=1)
+            if history_db:
                 latest_decision = history_db[0]
                 latest_time = latest_decision.get("timestamp", "Unknown Time")
                 reflection = latest_decision.get("context_analysis", {}).get("reflection", {}).get("en", "")
@@ -181,6 +193,21 @@ class TradeMemory:
 
 memory = TradeMemory()
 WHALE_DATA_PATH = BASE_DIR.parent / "frontend/data/whale_analysis.json" # [NEW]
+WHALE_GUARD_WINDOW_SECONDS = 24 * 3600  # Flow window checked by the Whale Dump Guard
+
+_flow_rollups = {}
+
+def whale_flow_window(symbol, seconds):
+    """
+    Whale flow aggregates for the last `seconds`, summed from crypto_brain's 15-min rollup buckets.
+    Returns None for chains without a rollup (only ETH/SOL have whale data).
+    """
+    key = symbol.lower()
+    if key not in _flow_rollups:
+        path = rollup_path(key)
+        _flow_rollups[key] = FlowRollup(path) if os.path.exists(path) else None
+    rollup = _flow_rollups[key]
+    return rollup.window(seconds) if rollup is not None and len(rollup) else None
 
 # ------------------------------------------------------------------------
 # INVALIDATION ENGINE — 指标字典 & 认错条件执行器
@@ -611,7 +638,8 @@ def get_portfolio_state(executor=None):
             # Fetch historical DB to map original invalidation rules
             try:
                 from db_client import db
-                history_db = db.get_data("agent_decisions", [])
+                history_db = db.query("agent_decisions", sort=[("timestamp", -1)],
+                                      projection=["new_opportunities", "actions"])
             except Exception:
                 history_db = []
                 
@@ -664,19 +692,15 @@ def get_portfolio_state(executor=None):
             # Save this real-time state to file so daily_report.py and frontend can see it
             try:
                 # Retain initial_equity and start_time if they exist
-                if PORTFOLIO_PATH.exists():
-                    try:
-                        with open(PORTFOLIO_PATH, "r") as f:
-                            old_state = json.load(f)
-                        if "initial_equity" in old_state:
-                            state["initial_equity"] = old_state["initial_equity"]
-                        if "start_time" in old_state:
-                            state["start_time"] = old_state["start_time"]
-                    except Exception:
-                        pass
+                old_state = json_store.read_json(PORTFOLIO_PATH, {})
+                if isinstance(old_state, dict):
+                    if "initial_equity" in old_state:
+                        state["initial_equity"] = old_state["initial_equity"]
+                    if "start_time" in old_state:
+                        state["start_time"] = old_state["start_time"]
                 
-                with open(PORTFOLIO_PATH, "w") as f:
-                    json.dump(state, f, indent=2)
+                # Coalesced with the other portfolio_state writes of this cycle
+                json_store.write_json_later(PORTFOLIO_PATH, state)
                 print("✅ Real-time portfolio state saved to file.")
             except Exception as e:
                 print(f"⚠️ Failed to save portfolio state: {e}")
@@ -686,10 +710,10 @@ def get_portfolio_state(executor=None):
         except Exception as e:
             print(f"⚠️ Failed to fetch real portfolio from executor: {e}")
     
-    # Fallback to static file
-    if PORTFOLIO_PATH.exists():
-        with open(PORTFOLIO_PATH, "r") as f:
-            return f.read()
+    # Fallback to static file (or its pending write)
+    saved_state = json_store.read_json(PORTFOLIO_PATH)
+    if saved_state is not None:
+        return json.dumps(saved_state, indent=2)
     else:
         # Default mock state
         mock_state = {
@@ -699,10 +723,11 @@ def get_portfolio_state(executor=None):
         }
         return json.dumps(mock_state, indent=2)
 
-def get_whale_data():
-    """Reads the latest whale_analysis from MongoDB (Primary) or local JSON (Fallback)"""
-    from db_client import db
-    data = db.get_data("whale_analysis", default_value={})
+def get_whale_data(data=None):
+    """Formats whale_analysis (passed in by the pipeline, else read from MongoDB)"""
+    if data is None:
+        from db_client import db
+        data = db.get_data("whale_analysis", default_value={})
     
     if not data:
         return "No Whale Data Available.", {}
@@ -1178,6 +1203,12 @@ def validate_and_enforce_decision(decision, whale_data_obj, whale_context, fear_
         s_data = whale_data_obj.get(symbol.lower(), {}).get('stats_24h', {})
         t_flow = s_data.get('token_net_flow')
         st_flow = s_data.get('stablecoin_net_flow')
+        try:
+            flows = whale_flow_window(symbol, WHALE_GUARD_WINDOW_SECONDS)
+            if flows:
+                t_flow, st_flow = flows["token_net_flow"], flows["stablecoin_net_flow"]
+        except Exception as rollup_err:
+            print(f"⚠️ Flow rollup unavailable for {symbol}: {rollup_err}")
         
         # Guard against None values
         t_flow_val = float(t_flow) if t_flow is not None and t_flow != "N/A" else 0.0
@@ -1340,9 +1371,14 @@ def validate_and_enforce_decision(decision, whale_data_obj, whale_context, fear_
     decision["rejection_report"] = rejection_report
     return decision
 
-def run_agent():
+def run_agent(whale_data=None, qlib_payload=None):
+    """
+    One decision cycle. whale_data / qlib_payload are the in-memory outputs of crypto_brain and
+    inference_qlib_model when run by the in-process pipeline; None reads them from DB / disk.
+    """
     print("🤖 Activating Agent Dolores (Whale Edition)...")
-    
+    _flow_rollups.clear()  # crypto_brain rewrote the rollups this cycle
+
     # Initialize Executor (Shadow Mode by default)
     # TODO: Set shadow_mode=False via env var for REAL TRADING later
     executor = OKXExecutor()
@@ -1350,10 +1386,13 @@ def run_agent():
     # 1. Load Qlib Payload (Live Check)
     qlib_payload_obj = {}
     qlib_stale_warning = ""
-    if PAYLOAD_PATH.exists():
+    if qlib_payload is not None or PAYLOAD_PATH.exists():
         try:
-            with open(PAYLOAD_PATH, "r") as f:
-                qlib_payload_obj = json.load(f)
+            if qlib_payload is not None:
+                qlib_payload_obj = qlib_payload
+            else:
+                with open(PAYLOAD_PATH, "r") as f:
+                    qlib_payload_obj = json.load(f)
             
             # Check for staleness (e.g., more than 24h old)
             as_of_str = qlib_payload_obj.get("as_of", "2000-01-01")
@@ -1370,7 +1409,7 @@ def run_agent():
     # and other injections.
     
     # 2. Get Analysis Context (Consolidated from Brain)
-    whale_context, whale_data_obj = get_whale_data()
+    whale_context, whale_data_obj = get_whale_data(whale_data)
     
     # Extract sub-contexts from whale_data_obj if needed, but get_whale_data already returns the string
     news_context = "" # News is now part of whale_context or injected separately
@@ -1466,7 +1505,7 @@ def run_agent():
             try:
                 print(f"🤔 Dolores is thinking... (Attempt {attempt+1}/{MAX_RETRIES}, Timeout: 120s)")
                 
-                response = client.chat.completions.create(
+                response = get_llm_client().chat.completions.create(
                     model="deepseek-chat",
                     messages=[
                         {"role": "system", "content": final_prompt},
@@ -1478,6 +1517,9 @@ def run_agent():
                     timeout=120
                 )
                 
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    record_llm("deepseek", usage.prompt_tokens, usage.completion_tokens, getattr(usage, "prompt_cache_hit_tokens", 0))
                 content = response.choices[0].message.content
                 # Parse JSON
                 decision = json.loads(content)
@@ -1490,13 +1532,17 @@ def run_agent():
                     print("🔄 DeepSeek failing... Falling back to Gemini Pro...")
                     try:
                         # Fallback to Gemini 2.5
-                        model = genai.GenerativeModel('gemini-2.5-pro')
+                        model = get_gemini_model('gemini-2.5-pro')
                         prompt_with_instructions = final_prompt + "\n\nUser request: Analyze the market reality (Whales vs Retail). Detect traps. Generate trading actions.\nIMPORTANT: Output MUST be a valid JSON object matching the requested schema. DO NOT wrap the output in markdown code blocks."
                         
                         gemini_res = model.generate_content(
                             prompt_with_instructions,
                             generation_config={"response_mime_type": "application/json"}
                         )
+                        usage = getattr(gemini_res, "usage_metadata", None)
+                        if usage is not None:
+                            record_llm("gemini", usage.prompt_token_count, usage.candidates_token_count,
+                                       getattr(usage, "cached_content_token_count", 0))
                         content = gemini_res.text
                         decision = json.loads(content)
                         break
@@ -1624,31 +1670,20 @@ def run_agent():
                     print(f"⚠️ Executor returned no order_id for {symbol} ({action_type}). Skipping notification.")
         
         # Save decision log
-        try:
-            from db_client import db
-            # Use 'agent_decisions' (online collection) instead of local log
-            history = db.get_data("agent_decisions", [])
-            if not isinstance(history, list):
-                history = [history] if history else []
-        except Exception as e:
-            print(f"⚠️ Failed to load history from DB: {e}")
-            history = []
-        
         # Add timestamp (Force overwrite with local time UTC+8)
         import datetime as dt
         utc_now = dt.datetime.utcnow()
         beijing_time = utc_now + dt.timedelta(hours=8)
         decision["timestamp"] = beijing_time.strftime("%Y-%m-%d %H:%M:%S")
-            
-        history.insert(0, decision)
-        history = history[:50]
         
         print(f"💾 Saving decision log to DB (agent_decisions)")
         try:
-            from db_client import db
-            db.save_data("agent_decisions", history)
+            from db_client import db, time_ordered_id
+            decision["id"] = time_ordered_id()  # upsert key (timestamps repeat within a second)
+            # Use 'agent_decisions' (online collection) instead of local log; keep the newest 50
+            db.append_data("agent_decisions", [decision], keep=50)
             # Backup to local log just in case
-            db.save_data("agent_decision_log", history)
+            db.append_data("agent_decision_log", [decision], keep=50)
             print("✅ Decision Log Saved Successfully!")
             
             # 🔔 SEND CYCLE SUMMARY & REJECTIONS
@@ -0,0 +1,65 @@
+"""
+Pre-serialized API response bodies.
+Each key holds the compact JSON bytes, their gzip encoding and a content hash (ETag) built once
+per data change, so polling endpoints only compare an ETag or copy bytes from memory.
+Entries are rebuilt when they are published (e.g. on a DB save), when their source file changes
+(mtime), or after a TTL as a safety net for writes made by other processes.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_TTL = 60  # seconds, for entries without a source file
+
+
+class CachedBody:
+    __slots__ = ("body", "gzipped", "etag", "built_at", "source_mtime")
+
+    def __init__(self, payload, source_mtime=None):
+        self.body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+        self.gzipped = gzip.compress(self.body, compresslevel=6)
+        self.etag = hashlib.sha1(self.body).hexdigest()[:20]
+        self.built_at = time.monotonic()
+        self.source_mtime = source_mtime
+
+
+class ResponseCache:
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def publish(self, key, payload, source_mtime=None):
+        """Serialize payload as the current body of `key`. Returns the CachedBody."""
+        entry = CachedBody(payload, source_mtime)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get(self, key, build, source_path=None, ttl=None):
+        """
+        Current body of `key`, rebuilt from build() if missing or stale.
+        source_path: entry is stale once the file's mtime changes (no TTL then).
+        build() may raise (e.g. FileNotFoundError); nothing is cached in that case.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if source_path is not None:
+            mtime = os.path.getmtime(source_path) if os.path.exists(source_path) else None
+            if entry is not None and entry.source_mtime == mtime:
+                return entry
+            return self.publish(key, build(), mtime)
+        if entry is not None and time.monotonic() - entry.built_at < (self.ttl if ttl is None else ttl):
+            return entry
+        return self.publish(key, build())
+
+
+# Shared by the Flask handlers and the pipeline hooks in run_loop
+api_responses = ResponseCache()
@@ -0,0 +1,150 @@
+import os
+import tempfile
+import threading
+import numpy as np
+from pathlib import Path
+import instrumentation
+
+# Local candle cache shared by market_data and update_qlib_data
+STORE_DIR = Path(__file__).resolve().parent / "qlib_data" / "candles"
+MAX_STORED_ROWS = 2000   # Per (instId, bar). 2000 x 4H is ~333 days
+PAGE_LIMIT = 300         # OKX max rows per /market/candles call
+
+# OKX candle row: [ts, o, h, l, c, vol, volCcy, volCcyQuote, confirm]
+N_COLS = 9
+TS, CONFIRM = 0, 8
+
+# One lock per file for the whole process: every CandleStore instance (market_data's client,
+# update_qlib_data, ...) serializes its read-modify-write of a given file on the same lock
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+def _file_lock(path):
+    with _file_locks_guard:
+        return _file_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class CandleStore:
+    """
+    On-disk OHLCV store keyed by (instId, bar), one memory-mapped .npy file per key.
+    Only confirmed candles are persisted. Each read tops the store up with candles newer than
+    the last stored timestamp (OKX `before` cursor), so a warm cycle costs one small request
+    per key instead of re-downloading the whole window.
+    """
+    def __init__(self, client, root=STORE_DIR):
+        self.client = client  # Anything with OKXDataClient._request
+        self.root = Path(root)
+
+    def _path(self, inst_id, bar):
+        return self.root / f"{inst_id}_{bar}.npy"
+
+    def _load(self, inst_id, bar):
+        path = self._path(inst_id, bar)
+        if not path.exists():
+            return np.empty((0, N_COLS))
+        try:
+            return np.load(path, mmap_mode="r")
+        except Exception as e:
+            print(f"⚠️ Candle store unreadable for {inst_id} {bar}: {e}. Rebuilding.")
+            return np.empty((0, N_COLS))
+
+    def _save(self, inst_id, bar, arr):
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(inst_id, bar)
+        # Unique temp file: concurrent writers (e.g. another process) never share one
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=f".{path.stem}.", suffix=".tmp.npy")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(arr))
+            os.replace(tmp, path)  # Atomic: readers never see a half-written file
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _page(self, inst_id, bar, after=None, before=None):
+        params = {"instId": inst_id, "bar": bar, "limit": str(PAGE_LIMIT)}
+        if after is not None:
+            params["after"] = str(int(after))
+        if before is not None:
+            params["before"] = str(int(before))
+        return self.client._request("GET", "/api/v5/market/candles", params)
+
+    def _fetch_latest(self, inst_id, bar, limit):
+        """Cold start: page backwards from now until `limit` candles are collected (newest first)."""
+        rows = []
+        after = None
+        while len(rows) < limit:
+            page = self._page(inst_id, bar, after=after)
+            if not page:
+                break
+            rows.extend(page)
+            if len(page) < PAGE_LIMIT:
+                break
+            after = page[-1][0]
+        return rows[:limit]
+
+    def _fetch_newer(self, inst_id, bar, since_ts):
+        """Warm start: every candle newer than since_ts (newest first), paging back until caught up."""
+        rows = []
+        after = None
+        while True:
+            page = self._page(inst_id, bar, after=after, before=since_ts)
+            if page is None:
+                return None
+            rows.extend(page)
+            if len(page) < PAGE_LIMIT:
+                break
+            after = page[-1][0]
+        return rows
+
+    @staticmethod
+    def _to_array(rows):
+        if not rows:
+            return np.empty((0, N_COLS))
+        arr = np.array([r[:N_COLS] for r in rows], dtype=float)
+        return arr[np.argsort(arr[:, TS], kind="stable")]
+
+    @staticmethod
+    def _to_rows(arr):
+        """Array (oldest first) -> OKX REST format (newest first, string fields)."""
+        rows = []
+        for r in arr[::-1].tolist():
+            rows.append([str(int(r[TS]))] + [repr(x) for x in r[1:CONFIRM]] + [str(int(r[CONFIRM]))])
+        return rows
+
+    def get_candles(self, inst_id, bar, limit):
+        """
+        Return the latest `limit` candles (including the live, unconfirmed one) in the same shape as
+        GET /api/v5/market/candles: newest first, string fields. Falls back to the stored copy if OKX
+        is unreachable.
+        """
+        with _file_lock(self._path(inst_id, bar)):
+            stored = self._load(inst_id, bar)
+
+            # The live candle is never stored, so `limit - 1` confirmed rows are a full window
+            if len(stored) + 1 < limit:
+                instrumentation.count("candle_store.miss")
+                fresh = self._to_array(self._fetch_latest(inst_id, bar, limit))
+            else:
+                instrumentation.count("candle_store.hit")
+                fetched = self._fetch_newer(inst_id, bar, stored[-1, TS])
+                if fetched is None:
+                    print(f"⚠️ Candle top-up failed for {inst_id} {bar}. Serving stored copy.")
+                fresh = self._to_array(fetched)
+
+            if len(fresh):
+                # New rows win on overlapping timestamps
+                keep = stored[stored[:, TS] < fresh[0, TS]] if len(stored) else stored
+                merged = np.concatenate([keep, fresh])
+            else:
+                merged = np.asarray(stored)
+
+            confirmed = merged[merged[:, CONFIRM] == 1][-MAX_STORED_ROWS:]
+            if len(confirmed) and (len(confirmed) != len(stored) or confirmed[-1, TS] != stored[-1, TS]):
+                try:
+                    self._save(inst_id, bar, confirmed)
+                except Exception as e:
+                    print(f"⚠️ Failed to persist candles for {inst_id} {bar}: {e}")
+
+            return self._to_rows(merged[-limit:])
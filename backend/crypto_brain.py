@@ -2,11 +2,22 @@ import os
 import json
 import time
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime
 import news_fetcher
 from macro_history import MacroHistory
 from dotenv import load_dotenv
 from moralis import evm_api
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import ETHERSCAN_RATE_LIMITER, KeyPool
+from price_cache import PriceCache
+from tx_window import TxWindow
+import flow_kernel
+from flow_rollup import FlowRollup, rollup_path
+from stage_dag import Stage, run_dag
+import instrumentation
+from instrumentation import record_llm
+from http_transport import api_transport
+import json_store
 
 
 # Load environment variables
@@ -19,19 +30,12 @@ MORALIS_API_KEY = os.getenv("MORALIS_API_KEY")
 MORALIS_API_KEY_2 = os.getenv("MORALIS_API_KEY_2") 
 ETHERSCAN_API_KEY = os.getenv("ETHERSCAN_API_KEY")
 
-# Key Rotation Logic
+# Moralis Key Pool: requests are spread over every key by remaining budget
 API_KEYS = [k for k in [MORALIS_API_KEY_2, MORALIS_API_KEY] if k]
-CURRENT_KEY_IDX = 0
-
-def get_current_key():
-    if not API_KEYS: return None
-    return API_KEYS[CURRENT_KEY_IDX % len(API_KEYS)]
-
-def rotate_key():
-    global CURRENT_KEY_IDX
-    print(f"DEBUG: Switching API Key from index {CURRENT_KEY_IDX}...")
-    CURRENT_KEY_IDX = (CURRENT_KEY_IDX + 1) % len(API_KEYS)
-    print(f"DEBUG: New API Key index: {CURRENT_KEY_IDX}")
+MORALIS_RATE_PER_KEY = 5        # req/s per key
+MORALIS_RATE_LIMIT_COOLDOWN = 10  # s, after a 429
+MORALIS_QUOTA_COOLDOWN = 3600     # s, after a 401 (daily compute units exhausted)
+MORALIS_KEYS = KeyPool(API_KEYS, MORALIS_RATE_PER_KEY)
 
 
 # Configuration
@@ -39,6 +43,26 @@ MIN_VALUE_USD = 50000  # ETH Threshold
 MIN_VALUE_USD_SOL = 5000 # SOL Threshold (Reverted to filter noise)
 CHAIN = "eth"
 
+# Flow analysis windows (seconds; None = everything in the 7d tx window)
+ANALYSIS_WINDOWS = {"7d": None, "24h": 24 * 3600}
+
+# Published flow rollup windows (answered from 15-min buckets, see flow_rollup)
+ROLLUP_WINDOWS = {"1h": 3600, "4h": 4 * 3600, "24h": 24 * 3600, "7d": 7 * 24 * 3600}
+
+# Per-stage timeouts (seconds) of the concurrent fetch phase in main()
+FETCH_TIMEOUTS = {
+    "macro_news": 300, "eth_scan": 600, "sol_scan": 600, "fear_greed": 60,
+    "markets": 180, "liquidations": 120, "defillama": 60
+}
+LIQUIDATION_SYMBOLS = ["ETH", "SOL", "BTC", "BNB", "DOGE"]
+
+# Rolling 7d whale tx windows (persisted between runs as columnar .npz, see tx_window)
+ETH_WINDOW_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eth_tx_window.npz")
+SOL_WINDOW_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sol_tx_window.npz")
+
+# Latest txs per chain published in whale_analysis.json / the global snapshot (full window stays in the .npz)
+TOP_TXS_API_LIMIT = 100
+
 # Solana Configuration
 SOLANA_TOKENS = {
     "SOL": "So11111111111111111111111111111111111111112", # Wrapped SOL
@@ -102,11 +126,20 @@ TOKEN_DECIMALS = {
     "LINK": 18
 }
 
-def get_token_price(address):
+# Price Cache: stablecoins are pegged (set to {} to price them live), volatile tokens expire sooner
+STABLECOIN_PEGS = {"USDT": 1.0, "USDC": 1.0}
+PRICE_TTL = 300  # seconds
+PRICE_TTLS = {"SHIB": 60, "PEPE": 60, "BONK": 60, "WIF": 60}
+
+def _fetch_token_price(address):
     """Fetch token price in USD from Moralis."""
     try:
+        api_key = MORALIS_KEYS.acquire()
+        if api_key is None:
+            print(f"Error fetching price for {address}: no Moralis key available")
+            return 0
         result = evm_api.token.get_token_price(
-            api_key=MORALIS_API_KEY,
+            api_key=api_key,
             params={"address": address, "chain": CHAIN}
             # Moralis SDK doesn't easily expose timeout param in this method wrapper?
             # It seems evm_api uses requests under the hood but might not pass kwargs.
@@ -117,112 +150,262 @@ def get_token_price(address):
         print(f"Error fetching price for {address}: {e}")
         return 0
 
-def fetch_large_transfers():
-    """Fetch recent large transfers for tracked tokens (ETH)."""
+def _fetch_token_prices(addresses):
+    """Bulk ERC20 prices in one Moralis request: {address: usdPrice}."""
+    api_key = MORALIS_KEYS.acquire()
+    if api_key is None:
+        return {}
+    result = evm_api.token.get_multiple_token_prices(
+        api_key=api_key,
+        body={"tokens": [{"token_address": address} for address in addresses]},
+        params={"chain": CHAIN}
+    )
+    return {item["tokenAddress"].lower(): item.get("usdPrice") or 0 for item in result if item.get("tokenAddress")}
+
+EVM_PRICES = PriceCache(_fetch_token_price, _fetch_token_prices, ttl=PRICE_TTL, ttls=PRICE_TTLS, pegs=STABLECOIN_PEGS)
+
+def get_token_price(address, symbol=None):
+    """Token price in USD (cached; pegged for stablecoins when symbol is given)."""
+    return EVM_PRICES.get(address, symbol)
+
+# Etherscan incremental ingestion
+ETHERSCAN_URL = "https://api.etherscan.io/v2/api"
+ETHERSCAN_PAGE_SIZE = 1000
+ETHERSCAN_MAX_PAGES = 10  # Per token per cycle; a longer backlog is picked up next cycle
+ETHERSCAN_MAX_LAG = 3600  # seconds; a cursor still further behind after MAX_PAGES jumps to the latest page
+ETHERSCAN_CURSOR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "etherscan_cursors.json")
+
+
+def load_cursors(path):
+    """
+    Per-token ingestion cursors.
+    Etherscan: {contract: {"block": int, "seen": ["hash:logIndex", ...]}}
+    Solana:    {mint: {"ts": blockTimestamp, "seen": [tx hash, ...]}}
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Cursors unreadable at {path} ({e}). Starting from the latest data.")
+        return {}
+
+
+def save_cursors(path, cursors):
+    json_store.write_json(path, cursors)
+
+
+def _etherscan_tokentx(address, **params):
+    """One tokentx page. Returns the result list ([] when there is nothing new) or None on error."""
+    query = {
+        "chainid": "1",
+        "module": "account",
+        "action": "tokentx",
+        "contractaddress": address,
+        "apikey": ETHERSCAN_API_KEY,
+        **params
+    }
+    # Use 'tokentx' endpoint: https://docs.etherscan.io/api-endpoints/accounts#get-a-list-of-erc20-token-transfer-events-by-address-on-ethereum
+    # Testing showed it works for the contract when address is omitted (see debug_etherscan.py).
+    ETHERSCAN_RATE_LIMITER.acquire()
+    response = api_transport.get(ETHERSCAN_URL, params=query, timeout=(5, 30))
+    data = response.json()
+    if data.get("status") == "1" and isinstance(data.get("result"), list):
+        return data["result"]
+    if data.get("message") == "No transactions found":
+        return []
+    print(f"Etherscan error for {address}: {data.get('message')} {data.get('result')}")
+    return None
+
+
+def _transfer_key(tx):
+    return f"{tx['hash']}:{tx.get('logIndex', '')}"
+
+
+def fetch_token_transfers(symbol, address, cursor=None):
+    """
+    Raw tokentx rows for one contract, oldest first, plus the advanced cursor.
+    With a cursor, only blocks >= cursor["block"] are requested (ascending, paginated until caught up);
+    rows already seen at the cursor block are skipped. Without one (first run) only the latest page is
+    read to seed the cursor. Returns (None, cursor) if Etherscan failed before anything was read.
+    If the page cap is hit while still more than ETHERSCAN_MAX_LAG behind (busy tokens like USDT can
+    outpace MAX_PAGES per cycle), the cursor is reseeded from the latest page and the gap is logged,
+    so published flows never drift further and further into the past.
+    """
+    if cursor is None:
+        # Dynamic Offset: 300 for stablecoins as we use DefiLlama for main flow data now.
+        rows = _etherscan_tokentx(address, page=1, offset=300 if symbol in STABLECOINS else 100, sort="desc")
+        if not rows:
+            return rows, cursor
+        rows.reverse()
+        block = int(rows[-1]["blockNumber"])
+        seen = [_transfer_key(tx) for tx in rows if int(tx["blockNumber"]) == block]
+        return rows, {"block": block, "seen": seen}
+
+    block = int(cursor["block"])
+    seen = set(cursor.get("seen", []))
+    rows = []
+    page = 1
+    for _ in range(ETHERSCAN_MAX_PAGES):
+        result = _etherscan_tokentx(address, startblock=block, page=page, offset=ETHERSCAN_PAGE_SIZE, sort="asc")
+        if result is None:
+            if not rows:
+                return None, cursor
+            break
+        rows.extend(tx for tx in result if _transfer_key(tx) not in seen)
+        if not result:
+            break
+
+        last_block = int(result[-1]["blockNumber"])
+        if last_block == block:
+            # Whole page inside one block: stay on it and move to the next page
+            seen.update(_transfer_key(tx) for tx in result)
+            page += 1
+        else:
+            # startblock is inclusive, so remember what we already have from the new cursor block
+            block = last_block
+            seen = {_transfer_key(tx) for tx in result if int(tx["blockNumber"]) == block}
+            page = 1
+
+        if len(result) < ETHERSCAN_PAGE_SIZE:
+            break
+    else:
+        # Page cap hit with more to read
+        lag = time.time() - int(result[-1]["timeStamp"])
+        if lag > ETHERSCAN_MAX_LAG:
+            latest, latest_cursor = fetch_token_transfers(symbol, address)
+            if latest_cursor is not None:
+                print(f"⚠️ {symbol}: cursor {lag / 3600:.1f}h behind after {ETHERSCAN_MAX_PAGES} pages. "
+                      f"Skipping blocks {block}-{latest_cursor['block']} and resuming from the latest page.")
+                have = {_transfer_key(tx) for tx in rows}
+                rows.extend(tx for tx in latest if _transfer_key(tx) not in have)
+                return rows, latest_cursor
+
+    if len(rows) or int(cursor["block"]) != block:
+        print(f"   {symbol}: {len(rows)} new transfers up to block {block}")
+    return rows, {"block": block, "seen": sorted(seen)}
+
+
+def _parse_etherscan_transfer(tx, symbol, price):
+    """Etherscan tokentx row -> whale transfer dict, or None below MIN_VALUE_USD."""
+    # Etherscan result fields:
+    # timeStamp, hash, from, to, value, tokenDecimal
+    decimals = int(tx.get("tokenDecimal", TOKEN_DECIMALS.get(symbol, 18)))
+    amount = float(tx["value"]) / (10 ** decimals)
+    amount_usd = amount * price
+
+    # Filter Whales
+    if amount_usd < MIN_VALUE_USD:
+        return None
+
+    from_addr = tx["from"].lower()
+    to_addr = tx["to"].lower()
+
+    # Use lower() for lookup just in case, though keys should be lower
+    from_label = EXCHANGES.get(from_addr, from_addr[:6] + "...")
+    to_label = EXCHANGES.get(to_addr, to_addr[:6] + "...")
+
+    is_exchange_in = to_addr in EXCHANGES
+    is_exchange_out = from_addr in EXCHANGES
+
+    signal = "NEUTRAL"
+    if symbol in STABLECOINS:
+        if is_exchange_in: signal = "BULLISH_INFLOW"
+        if is_exchange_out: signal = "BEARISH_OUTFLOW"
+    else:
+        if is_exchange_in: signal = "BEARISH_INFLOW"
+        if is_exchange_out: signal = "BULLISH_OUTFLOW"
+
+    # Convert Etherscan timestamp (epoch str) to ISO
+    ts_epoch = int(tx["timeStamp"])
+    ts_iso = datetime.utcfromtimestamp(ts_epoch).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    return {
+        "hash": tx["hash"],
+        "timestamp": ts_iso,
+        "symbol": symbol,
+        "amount": amount,
+        "amount_usd": amount_usd,
+        "from": from_addr,
+        "to": to_addr,
+        "from_label": from_label,
+        "to_label": to_label,
+        "signal": signal,
+        "chain": "ETH"
+    }
+
+
+def _scan_token(symbol, address, cursor):
+    """Price + new transfers for one ETH token. Returns (whale transfers, advanced cursor or None)."""
+    print(f"Scanning {symbol} via Etherscan...")
+    transfers = []
+    try:
+        # 1. Get Token Price (Still use Moralis for Price)
+        price = get_token_price(address, symbol)
+        if price == 0:
+            print(f"Skipping {symbol} due to missing price.")
+            return transfers, None
+
+        # 2. Get new Transfers via Etherscan (cursor is only advanced on success)
+        try:
+            rows, cursor = fetch_token_transfers(symbol, address, cursor)
+        except Exception as e:
+            print(f"Error fetching Etherscan for {symbol}: {e}")
+            return transfers, None
+        if rows is None:
+            return transfers, None
+
+        for tx in rows:
+            try:
+                transfer = _parse_etherscan_transfer(tx, symbol, price)
+                if transfer:
+                    transfers.append(transfer)
+            except Exception as e:
+                print(f"Error parsing tx {tx.get('hash')}: {e}")
+                continue
+
+    except Exception as e:
+        print(f"Error processing {symbol}: {e}")
+        return transfers, None
+
+    return transfers, cursor
+
+
+def fetch_large_transfers(cursors=None):
+    """
+    Fetch large transfers for tracked tokens (ETH) since the last cycle.
+    cursors: dict from load_cursors(ETHERSCAN_CURSOR_FILE), advanced in place. The caller persists it
+    with save_cursors() once the transfers are saved, so a crash never skips blocks.
+    Without cursors only the latest page per token is read.
+    """
     # Ensure global EXCHANGES keys are lowercase for matching
     global EXCHANGES
     EXCHANGES = {k.lower(): v for k, v in EXCHANGES.items()}
-    
-    all_transfers = []
-    
+    if cursors is None:
+        cursors = {}
+
     print("Fetching data from Etherscan (Transfer Events)...")
-    
-    # Use Etherscan V2 API
-    etherscan_url = "https://api.etherscan.io/v2/api"
-    
-    for symbol, address in TOKENS.items():
-        print(f"Scanning {symbol} via Etherscan...")
-        try:
-            # 1. Get Token Price (Still use Moralis for Price)
-            price = get_token_price(address)
-            if price == 0: 
-                print(f"Skipping {symbol} due to missing price.")
-                continue
-            
-            # 2. Get Transfers via Etherscan
-            # Use 'tokentx' endpoint: https://docs.etherscan.io/api-endpoints/accounts#get-a-list-of-erc20-token-transfer-events-by-address-on-ethereum
-            # Although docs say it filters by 'address', testing showed it works for contractaddress only if address is omitted or same.
-            # Actually, standard way for Contract Events is getLogs, but tokentx is parsed.
-            # My test 'debug_etherscan.py' confirmed tokentx works for the contract.
-
-            params = {
-                "chainid": "1",
-                "module": "account",
-                "action": "tokentx",
-                "contractaddress": address,
-                "page": 1,
-                # Dynamic Offset: Reverted to 300 as we use DefiLlama for main flow data now.
-                "offset": 300 if symbol in STABLECOINS else 100,
-                "sort": "desc",
-                "apikey": ETHERSCAN_API_KEY
-            }
 
-            try:
-                response = requests.get(etherscan_url, params=params, timeout=(5, 30))
-                data = response.json()
-                
-                if data["status"] == "1" and isinstance(data["result"], list):
-                    for tx in data["result"]:
-                        # Etherscan result fields: 
-                        # timeStamp, hash, from, to, value, tokenDecimal
-                        
-                        try:
-                            decimals = int(tx.get("tokenDecimal", TOKEN_DECIMALS.get(symbol, 18)))
-                            amount = float(tx["value"]) / (10 ** decimals)
-                            amount_usd = amount * price
-                            
-                            # Filter Whales
-                            if amount_usd >= MIN_VALUE_USD:
-                                from_addr = tx["from"].lower()
-                                to_addr = tx["to"].lower()
-                                
-                                # Use lower() for lookup just in case, though keys should be lower
-                                from_label = EXCHANGES.get(from_addr, from_addr[:6] + "...")
-                                to_label = EXCHANGES.get(to_addr, to_addr[:6] + "...")
-                                
-                                is_exchange_in = to_addr in EXCHANGES
-                                is_exchange_out = from_addr in EXCHANGES
-                                
-                                signal = "NEUTRAL"
-                                if symbol in STABLECOINS:
-                                    if is_exchange_in: signal = "BULLISH_INFLOW"
-                                    if is_exchange_out: signal = "BEARISH_OUTFLOW"
-                                else:
-                                    if is_exchange_in: signal = "BEARISH_INFLOW"
-                                    if is_exchange_out: signal = "BULLISH_OUTFLOW"
-
-                                # Convert Etherscan timestamp (epoch str) to ISO
-                                ts_epoch = int(tx["timeStamp"])
-                                ts_iso = datetime.utcfromtimestamp(ts_epoch).strftime("%Y-%m-%dT%H:%M:%S.000Z")
-
-                                all_transfers.append({
-                                    "hash": tx["hash"],
-                                    "timestamp": ts_iso,
-                                    "symbol": symbol,
-                                    "amount": amount,
-                                    "amount_usd": amount_usd,
-                                    "from": from_addr,
-                                    "to": to_addr,
-                                    "from_label": from_label,
-                                    "to_label": to_label,
-                                    "signal": signal,
-                                    "chain": "ETH"
-                                })
-                        except Exception as e:
-                            print(f"Error parsing tx {tx.get('hash')}: {e}")
-                            continue
-                            
-                else:
-                    print(f"Etherscan error/empty for {symbol}: {data.get('message')}")
-                    
-            except Exception as e:
-                print(f"Error fetching Etherscan for {symbol}: {e}")
+    # Warm the price cache with one bulk request; _scan_token then reads it without blocking
+    EVM_PRICES.get_many(TOKENS)
+
+    # Tokens are scanned concurrently; Etherscan/Moralis quotas are enforced by the shared limiters
+    with ThreadPoolExecutor(max_workers=len(TOKENS)) as pool:
+        futures = {
+            symbol: instrumentation.submit(pool, _scan_token, symbol, address, cursors.get(address))
+            for symbol, address in TOKENS.items()
+        }
+        scans = {symbol: future.result() for symbol, future in futures.items()}
+
+    # Collected in TOKENS order so the output does not depend on which scan finished first
+    all_transfers = []
+    for symbol, address in TOKENS.items():
+        transfers, cursor = scans[symbol]
+        if cursor is not None:
+            cursors[address] = cursor
+        all_transfers.extend(transfers)
 
-        except Exception as e:
-            print(f"Error processing {symbol}: {e}")
-            
-        # Rate limiting: Etherscan free tier is 5 calls/sec, so strict sleep not needed but good for safety
-        time.sleep(0.2)
     # Deduplication and Loop Detection
     cleaned_transfers = []
     seen_txs = {} # Map (hash, symbol, amount) -> index in cleaned_transfers
@@ -257,137 +440,195 @@ def fetch_large_transfers():
     all_transfers.sort(key=lambda x: x["timestamp"], reverse=True)
     return all_transfers
 
-def get_solana_price(address):
+SOLANA_CURSOR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solana_cursors.json")
+SOLANA_MAX_PAGES = 10  # ~1000 swaps per token per cycle
+
+
+def _moralis_request(method, url, **kwargs):
+    """
+    Request on the Moralis Solana gateway using the key with the most remaining budget.
+    A key answering 401/429 is benched and the request moves to the next key.
+    Returns the decoded JSON, or None if every key is exhausted.
+    """
+    for _ in range(len(API_KEYS) + 1):
+        key = MORALIS_KEYS.acquire()
+        if key is None:
+            print("⚠️ All Moralis keys are over quota.")
+            return None
+        response = api_transport.request(method, url, headers={"X-API-Key": key}, timeout=(5, 10), **kwargs)
+        if response.status_code in [401, 429]:
+            print(f"SOL API Quota hit on key #{API_KEYS.index(key)}. Benching it...")
+            MORALIS_KEYS.bench(key, MORALIS_QUOTA_COOLDOWN if response.status_code == 401 else MORALIS_RATE_LIMIT_COOLDOWN)
+            continue
+        return response.json()
+    return None
+
+def _fetch_solana_price(address):
     """Fetch Solana token price in USD."""
     try:
         # Use Moralis Token API for price
-        # Use Moralis Token API for price
-        url = f"https://solana-gateway.moralis.io/token/mainnet/{address}/price"
-        headers = {"X-API-Key": get_current_key()}
-        response = requests.get(url, headers=headers, timeout=(5, 10))
-        data = response.json()
-        return data.get("usdPrice", 0)
+        data = _moralis_request("GET", f"https://solana-gateway.moralis.io/token/mainnet/{address}/price")
+        return (data or {}).get("usdPrice", 0)
     except Exception as e:
         print(f"Error fetching price for {address}: {e}")
         return 0
 
-def fetch_solana_swaps():
-    """Fetch large swaps for Solana tokens."""
-    all_swaps = []
-    
-    headers = {
-        "X-API-Key": get_current_key()
+def _fetch_solana_prices(addresses):
+    """Bulk Solana token prices in one Moralis request: {address: usdPrice}."""
+    data = _moralis_request("POST", "https://solana-gateway.moralis.io/token/mainnet/prices", json={"addresses": addresses})
+    if not isinstance(data, list):
+        return {}
+    return {item["tokenAddress"]: item.get("usdPrice") or 0 for item in data if item.get("tokenAddress")}
+
+SOL_PRICES = PriceCache(_fetch_solana_price, _fetch_solana_prices, ttl=PRICE_TTL, ttls=PRICE_TTLS, pegs=STABLECOIN_PEGS)
+
+def get_solana_price(address, symbol=None):
+    """Solana token price in USD (cached; pegged for stablecoins when symbol is given)."""
+    return SOL_PRICES.get(address, symbol)
+
+def _parse_solana_swap(swap, symbol, address, price):
+    """Moralis swap -> whale transfer dict, or None if it does not involve our token / is too small."""
+    # Determine which side is our token
+    bought_addr = swap["bought"]["address"]
+    sold_addr = swap["sold"]["address"]
+
+    if bought_addr == address:
+        # User BOUGHT our token (Inflow to Wallet = Outflow from Pool)
+        # Logic: Buy = Bullish = Outflow (from exchange/pool perspective)
+        raw_amount = float(swap["bought"]["amount"])
+        signal = "BULLISH_OUTFLOW" 
+        if symbol in ["USDC", "USDT"]:
+            # Buying USDC = Selling Token = Bearish? No, this is just receiving USDC.
+            # If we are tracking USDC, and user BOUGHT USDC (swapped token for USDC), that is selling the token.
+            # So USDC Inflow to Wallet = Cash Out = Bearish Outflow?
+            # Wait, for Stablecoins:
+            # In to Exchange = Buy Power (Bullish Inflow)
+            # Out from Exchange = Cash Out (Bearish Outflow)
+            # Here: User Wallet receives USDC. This is "Out from Pool". 
+            # So it's "Cash Out" -> BEARISH_OUTFLOW.
+            signal = "BEARISH_OUTFLOW" 
+
+    elif sold_addr == address:
+        # User SOLD our token (Outflow from Wallet = Inflow to Pool)
+        # Logic: Sell = Bearish = Inflow (to exchange/pool perspective)
+        raw_amount = float(swap["sold"]["amount"])
+        signal = "BEARISH_INFLOW"
+        if symbol in ["USDC", "USDT"]:
+            # Selling USDC = Buying Token = Bullish.
+            # User sends USDC to Pool.
+            # In to Pool = Buy Power -> BULLISH_INFLOW.
+            signal = "BULLISH_INFLOW" 
+    else:
+        return None
+
+    # Calculate USD Value Manually
+    amount_usd = raw_amount * price
+
+    # Fallback to API value if manual calc is 0
+    if amount_usd == 0:
+        amount_usd = float(swap.get("totalValueUsd", 0))
+
+    if amount_usd < MIN_VALUE_USD_SOL:
+        return None
+
+    # Format for frontend
+    return {
+        "hash": swap["transactionHash"],
+        "timestamp": swap["blockTimestamp"],
+        "symbol": symbol,
+        "amount": raw_amount,
+        "amount_usd": amount_usd,
+        "from": swap["walletAddress"],
+        "to": swap["pairAddress"],
+        "from_label": swap["walletAddress"][:6] + "...",
+        "to_label": swap.get("exchangeName", "DEX"),
+        "signal": signal,
+        "chain": "SOL"
     }
-    
-    # Pre-fetch prices
-    prices = {}
-    for symbol, address in SOLANA_TOKENS.items():
-        prices[symbol] = get_solana_price(address)
-        print(f"Price of {symbol}: ${prices[symbol]:.4f}")
-    
-    for symbol, address in SOLANA_TOKENS.items():
-        print(f"Scanning Solana {symbol}...")
-        try:
-            url = f"https://solana-gateway.moralis.io/token/mainnet/{address}/swaps"
-            params = {
-                "limit": 100, 
-            }
-            
-            # Fetch 10 pages (~1000 txs) to capture more history given Solana's high throughput
-            # This is a trade-off: more API calls vs better data coverage
-            for _ in range(10):
-                # Retry loop for SOL requests
-                max_retries = len(API_KEYS) + 1
-                response = None
-                for attempt in range(max_retries):
-                    # Update header with potentially new key
-                    headers["X-API-Key"] = get_current_key()
-                    response = requests.get(url, headers=headers, params=params, timeout=(5, 10))
-                    
-                    if response.status_code in [401, 429]:
-                         print(f"SOL API Quota hit. Rotating...")
-                         rotate_key()
-                         continue
-                    else:
+
+def _scan_solana_token(symbol, address, price, cursor):
+    """
+    Page one token's swaps (newest first) until reaching the last ingested cursor.
+    Returns (whale swaps, advanced cursor or None if nothing was read).
+    """
+    print(f"Scanning Solana {symbol}...")
+    url = f"https://solana-gateway.moralis.io/token/mainnet/{address}/swaps"
+    params = {"limit": 100}
+    seen = set(cursor["seen"]) if cursor else set()
+    swaps = []
+    newest = None
+    caught_up = False
+
+    try:
+        for _ in range(SOLANA_MAX_PAGES):
+            data = _moralis_request("GET", url, params=params)
+            if not data or "result" not in data:
+                if cursor:
+                    # Keep the old cursor so the gap is re-read next cycle
+                    return swaps, None
+                break
+
+            for swap in data["result"]:
+                ts = swap["blockTimestamp"]
+                if newest is None:
+                    newest = {"ts": ts, "seen": []}
+                if ts == newest["ts"]:
+                    newest["seen"].append(swap["transactionHash"])
+
+                if cursor:
+                    if ts < cursor["ts"]:
+                        caught_up = True
                         break
-                
-                if not response: break
-                
-                data = response.json()
-                
-                if "result" in data:
-                    for swap in data["result"]:
-                        # Determine which side is our token
-                        bought_addr = swap["bought"]["address"]
-                        sold_addr = swap["sold"]["address"]
-                        
-                        if bought_addr == address:
-                            # User BOUGHT our token (Inflow to Wallet = Outflow from Pool)
-                            # Logic: Buy = Bullish = Outflow (from exchange/pool perspective)
-                            raw_amount = float(swap["bought"]["amount"])
-                            signal = "BULLISH_OUTFLOW" 
-                            if symbol in ["USDC", "USDT"]:
-                                # Buying USDC = Selling Token = Bearish? No, this is just receiving USDC.
-                                # If we are tracking USDC, and user BOUGHT USDC (swapped token for USDC), that is selling the token.
-                                # So USDC Inflow to Wallet = Cash Out = Bearish Outflow?
-                                # Wait, for Stablecoins:
-                                # In to Exchange = Buy Power (Bullish Inflow)
-                                # Out from Exchange = Cash Out (Bearish Outflow)
-                                # Here: User Wallet receives USDC. This is "Out from Pool". 
-                                # So it's "Cash Out" -> BEARISH_OUTFLOW.
-                                signal = "BEARISH_OUTFLOW" 
-                                
-                        elif sold_addr == address:
-                            # User SOLD our token (Outflow from Wallet = Inflow to Pool)
-                            # Logic: Sell = Bearish = Inflow (to exchange/pool perspective)
-                            raw_amount = float(swap["sold"]["amount"])
-                            signal = "BEARISH_INFLOW"
-                            if symbol in ["USDC", "USDT"]:
-                                # Selling USDC = Buying Token = Bullish.
-                                # User sends USDC to Pool.
-                                # In to Pool = Buy Power -> BULLISH_INFLOW.
-                                signal = "BULLISH_INFLOW" 
-                        else:
-                            continue
-
-                        # Calculate USD Value Manually
-                        price = prices.get(symbol, 0)
-                        amount_usd = raw_amount * price
-                        
-                        # Fallback to API value if manual calc is 0
-                        if amount_usd == 0:
-                            amount_usd = float(swap.get("totalValueUsd", 0))
-
-                        if amount_usd < MIN_VALUE_USD_SOL:
-                            continue
-                            
-                        # Format for frontend
-                        all_swaps.append({
-                            "hash": swap["transactionHash"],
-                            "timestamp": swap["blockTimestamp"],
-                            "symbol": symbol,
-                            "amount": raw_amount,
-                            "amount_usd": amount_usd,
-                            "from": swap["walletAddress"],
-                            "to": swap["pairAddress"], 
-                            "from_label": swap["walletAddress"][:6] + "...",
-                            "to_label": swap.get("exchangeName", "DEX"),
-                            "signal": signal,
-                            "chain": "SOL"
-                        })
-                
-                # Pagination
-                if "cursor" in data and data["cursor"]:
-                    params["cursor"] = data["cursor"]
-                else:
-                    break
-                    
-        except Exception as e:
-            print(f"Error fetching Solana {symbol}: {e}")
-        
-        # Rate limiting: Sleep 1s between tokens 
-        time.sleep(1)
-            
+                    if ts == cursor["ts"] and swap["transactionHash"] in seen:
+                        continue
+
+                parsed = _parse_solana_swap(swap, symbol, address, price)
+                if parsed:
+                    swaps.append(parsed)
+
+            # Pagination
+            if caught_up or not data.get("cursor"):
+                break
+            params["cursor"] = data["cursor"]
+
+    except Exception as e:
+        print(f"Error fetching Solana {symbol}: {e}")
+        return swaps, None
+
+    if newest and cursor and newest["ts"] == cursor["ts"]:
+        newest["seen"] = sorted(seen | set(newest["seen"]))
+    return swaps, newest
+
+def fetch_solana_swaps(cursors=None):
+    """
+    Fetch large swaps for Solana tokens since the last cycle.
+    All SOLANA_TOKENS are priced and paged concurrently; requests are spread over the Moralis key pool.
+    cursors: dict from load_cursors(SOLANA_CURSOR_FILE), advanced in place (persisted by the caller).
+    """
+    if cursors is None:
+        cursors = {}
+
+    # Pre-fetch prices (one bulk request for every cache miss)
+    prices = SOL_PRICES.get_many(SOLANA_TOKENS)
+    for symbol, price in prices.items():
+        print(f"Price of {symbol}: ${price:.4f}")
+
+    with ThreadPoolExecutor(max_workers=len(SOLANA_TOKENS)) as pool:
+        futures = {
+            symbol: instrumentation.submit(pool, _scan_solana_token, symbol, address, prices[symbol], cursors.get(address))
+            for symbol, address in SOLANA_TOKENS.items()
+        }
+        scans = {symbol: future.result() for symbol, future in futures.items()}
+
+    all_swaps = []
+    for symbol, address in SOLANA_TOKENS.items():
+        swaps, cursor = scans[symbol]
+        if cursor is not None:
+            cursors[address] = cursor
+        all_swaps.extend(swaps)
+
+    print(f"Moralis key budget left: {MORALIS_KEYS.remaining()}")
+
     # Sort by time desc
     all_swaps.sort(key=lambda x: x["timestamp"], reverse=True)
     return all_swaps
@@ -396,7 +637,7 @@ def fetch_defillama_global_flows():
     """Fetch global stablecoin market cap change (24h) from DefiLlama."""
     try:
         url = "https://stablecoins.llama.fi/stablecoins?includePrices=true"
-        response = requests.get(url, timeout=(5, 10))
+        response = api_transport.get(url, timeout=(5, 10))
         data = response.json()
         
         total_change = 0
@@ -429,7 +670,7 @@ def fetch_fear_greed_index():
     """Fetch Bitcoin Fear & Greed Index from alternative.me (Today + Yesterday for change)."""
     try:
         url = "https://api.alternative.me/fng/?limit=2"
-        response = requests.get(url, timeout=(5, 10))
+        response = api_transport.get(url, timeout=(5, 10))
         data = response.json()
         
         if "data" in data and len(data["data"]) > 0:
@@ -463,79 +704,31 @@ import market_data
 def merge_and_filter_txs(new_txs, old_txs):
     """
     Merge new and old transactions, remove duplicates, and keep only those from the last 7 days.
+    One-shot TxWindow; main() keeps persistent windows instead.
     """
-    # 1. Deduplicate using (hash, symbol) as key to avoid overwriting multi-leg DEX swaps
-    merged_map = {}
-    
-    # Add old first
-    for tx in old_txs:
-        # Provide fallback to just "hash" string if key is just string from old storage
-        key = (tx['hash'], tx.get('symbol', 'UNKNOWN')) if isinstance(tx, dict) else tx
-        merged_map[key] = tx
-        
-    # Add new (overwrite if exists)
-    for tx in new_txs:
-        key = (tx['hash'], tx.get('symbol', 'UNKNOWN'))
-        merged_map[key] = tx
-        
-    all_txs = list(merged_map.values())
-    
-    # 2. Filter last 7 days (168 hours)
-    # Use timezone-aware UTC for everything
-    from datetime import timezone
-    now_utc = datetime.now(timezone.utc)
-    cutoff_time = now_utc - timedelta(hours=168)
-    
-    filtered_txs = []
-    
-    for tx in all_txs:
-        try:
-            # Handle timestamp parsing
-            ts_str = tx['timestamp']
-            
-            # Robust ISO parsing
-            if ts_str.endswith('Z'):
-                ts_str = ts_str[:-1]
-                # If Z was present, it's UTC.
-                if "." in ts_str:
-                     tx_time = datetime.strptime(ts_str, "%Y-%m-%dT%H:%M:%S.%f")
-                else:
-                     tx_time = datetime.strptime(ts_str, "%Y-%m-%dT%H:%M:%S")
-                # Make it aware
-                tx_time = tx_time.replace(tzinfo=timezone.utc)
-            else:
-                 # Assume it's UTC if missing Z (common in our script), but let's be safe
-                 # If using .fromisoformat() in py3.7+, better, but manual is safer here
-                 if "." in ts_str:
-                     tx_time = datetime.strptime(ts_str, "%Y-%m-%dT%H:%M:%S.%f")
-                 else:
-                     tx_time = datetime.strptime(ts_str, "%Y-%m-%dT%H:%M:%S")
-                 
-                 # Force UTC if naive
-                 if tx_time.tzinfo is None:
-                     tx_time = tx_time.replace(tzinfo=timezone.utc)
+    window = TxWindow()
+    window.add(old_txs)
+    window.add(new_txs)  # New overwrite old on the same (hash, symbol)
+    window.evict()
+    return window.latest()
 
-            if tx_time > cutoff_time:
-                filtered_txs.append(tx)
-        except Exception as e:
-            # print(f"Date error: {e}")
-            # Ensure we don't drop data on parser error, default to keep or check manually?
-            # Safer to keep if unsure? Or drop? 
-            # If we drop, we lose history. If we keep, we might have effective duplicates if parser fails.
-            # Let's try to keep recent-ish looking strings or just fail safe.
-            filtered_txs.append(tx) 
 
-    # 3. Sort by timestamp descending
-    filtered_txs.sort(key=lambda x: x['timestamp'], reverse=True)
-    return filtered_txs
+def market_signal_scores(market_metrics):
+    """Signal score table for the current market context (Patch 1: BEARISH_INFLOW separation)."""
+    market_metrics = market_metrics or {}
+    # If Volume is high or OI is up, it's real selling (-2), otherwise it might be hedging (-1)
+    is_real_dump = (market_metrics.get("volume_ratio", 1.0) >= 1.5) or (market_metrics.get("delta_oi_24h_percent", 0) > 2.0)
+    return flow_kernel.signal_scores(is_real_dump)
 
 
-def analyze_transfers_v1(transfers, market_metrics, target_symbol="UNKNOWN"):
+def analyze_transfers_v1(transfers, market_metrics, target_symbol="UNKNOWN", windows=None, epochs=None):
     """
     Strategy V1 Analysis:
     Combines Chain Transfers (Intent) + Market Data (Confirmation).
     Calculates Sentiment Score and Confidence Score.
     Target Symbol is specifically checked to avoid meme coin pollution.
+    windows: {name: seconds or None}, default ANALYSIS_WINDOWS. Returns {"stats_<name>": stats}.
+    epochs: optional pre-parsed timestamps aligned with transfers (skips ISO parsing).
     """
     
     # ... stats init ...
@@ -552,20 +745,13 @@ def analyze_transfers_v1(transfers, market_metrics, target_symbol="UNKNOWN"):
             "top_whale": {"address": "N/A", "volume": 0, "label": "N/A"}
         }
 
-    stats_7d = init_stats()
-    stats_24h = init_stats()
+    if windows is None:
+        windows = ANALYSIS_WINDOWS
+    stats = {name: init_stats() for name in windows}
 
     if not transfers:
-        return {"stats_7d": stats_7d, "stats_24h": stats_24h}
+        return {f"stats_{name}": st for name, st in stats.items()}
 
-    cutoff_24h = datetime.utcnow() - timedelta(hours=24)
-
-    # Accumulators
-    acc_7d = {"w_score": 0, "total_w": 0, "stable": 0, "token": 0, "whales": set(), "vols": {}, "sum_vol": 0, "cnt": 0}
-    acc_24h = {"w_score": 0, "total_w": 0, "stable": 0, "token": 0, "whales": set(), "vols": {}, "sum_vol": 0, "cnt": 0}
-
-    import math
-    
     # Market Context for Scoring Adjustments
     if not market_metrics:
         market_metrics = {"volume_ratio": 1.0, "delta_oi_24h_percent": 0, "funding_rate": 0, "oi_trend": "FLAT"}
@@ -575,57 +761,12 @@ def analyze_transfers_v1(transfers, market_metrics, target_symbol="UNKNOWN"):
     funding = market_metrics.get("funding_rate", 0)
 
     # --- Transfer Scoring Logic ---
-    for tx in transfers:
-        symbol = tx["symbol"]
-        amount_usd = tx["amount_usd"]
-        signal = tx["signal"]
-        
-        # Isolation logic removed: We want to capture flow for ALL tokens tracked on the chain (e.g. WETH, SHIB, LINK on Ethereum).
-        # 1. Base Score
-        score = 0
-        if signal == "BULLISH_INFLOW": score = 2
-        elif signal == "BULLISH_OUTFLOW": score = 1
-        elif signal == "BEARISH_OUTFLOW": score = -1
-        elif signal == "BEARISH_INFLOW":
-            # Patch 1: BEARISH_INFLOW Separation
-            # If Volume is high or OI is up, it's real selling (-2)
-            # Otherwise it might be hedging (-1)
-            is_real_dump = (vol_ratio >= 1.5) or (oi_delta > 2.0)
-            score = -2 if is_real_dump else -1
-            
-        # Patch 2: Square Root gives big whales much stronger emphasis than Log10
-        # E.g. $10k => 100 weight. $10M => 3162 weight.
-        weight = math.sqrt(amount_usd) if amount_usd > 0 else 0
-
-        # Update Helper
-        def update(acc):
-            acc["cnt"] += 1
-            acc["sum_vol"] += amount_usd
-            acc["whales"].add(tx["from"])
-            acc["vols"][tx["from"]] = acc["vols"].get(tx["from"], 0) + amount_usd
-            
-            acc["w_score"] += score * weight
-            acc["total_w"] += weight
-            
-            if symbol in STABLECOINS:
-                if signal == "BULLISH_INFLOW": acc["stable"] += amount_usd
-                elif signal == "BEARISH_OUTFLOW": acc["stable"] -= amount_usd
-            else:
-                if signal == "BEARISH_INFLOW": acc["token"] -= amount_usd
-                elif signal == "BULLISH_OUTFLOW": acc["token"] += amount_usd
+    # Flow is captured for ALL tokens tracked on the chain (e.g. WETH, SHIB, LINK on Ethereum).
+    scores = market_signal_scores(market_metrics)
 
-        # 7d Update
-        update(acc_7d)
-        
-        # 24h Update
-        # Parse text time
-        try:
-            ts_str = tx["timestamp"].replace("Z", "")
-            if "." in ts_str: t = datetime.strptime(ts_str, "%Y-%m-%dT%H:%M:%S.%f")
-            else: t = datetime.strptime(ts_str, "%Y-%m-%dT%H:%M:%S")
-            if t > cutoff_24h:
-                update(acc_24h)
-        except: pass
+    # All windows aggregated in one vectorized pass (sqrt(amount_usd) weights, see flow_kernel)
+    cols = flow_kernel.build_columns(transfers, STABLECOINS, epochs)
+    accs = flow_kernel.aggregate_windows(cols, windows, scores)
 
     # --- Confidence Score Logic (Fusion) ---
     def calc_confidence(sentiment_score):
@@ -700,18 +841,18 @@ def analyze_transfers_v1(transfers, market_metrics, target_symbol="UNKNOWN"):
         
         stats["stablecoin_net_flow"] = acc["stable"]
         stats["token_net_flow"] = acc["token"]
-        stats["whale_count"] = len(acc["whales"])
+        stats["whale_count"] = acc["whale_count"]
         stats["total_volume"] = acc["sum_vol"]
         if acc["cnt"] > 0: stats["avg_tx_size"] = acc["sum_vol"] / acc["cnt"]
         
-        if acc["vols"]:
-            top = max(acc["vols"], key=acc["vols"].get)
-            stats["top_whale"] = {"address": top, "volume": acc["vols"][top], "label": top[:6]+"..."}
+        if acc["top_whale"]:
+            top, volume = acc["top_whale"]
+            stats["top_whale"] = {"address": top, "volume": volume, "label": top[:6]+"..."}
 
-    finalize(acc_7d, stats_7d)
-    finalize(acc_24h, stats_24h)
+    for name in windows:
+        finalize(accs[name], stats[name])
     
-    return {"stats_7d": stats_7d, "stats_24h": stats_24h}
+    return {f"stats_{name}": st for name, st in stats.items()}
 
 
 import news_fetcher
@@ -1029,8 +1170,10 @@ def _call_ai_with_fallback(prompt, system_prompt="You are a professional crypto
                 "stream": False,
                 "response_format": {"type": "json_object"}
             }
-            res = requests.post(url, headers=headers, json=payload, timeout=(10, 60))
+            res = api_transport.post(url, headers=headers, json=payload, timeout=(10, 60))
             if res.status_code == 200:
+                usage = res.json().get("usage") or {}
+                record_llm("deepseek", usage.get("prompt_tokens"), usage.get("completion_tokens"), usage.get("prompt_cache_hit_tokens"))
                 text = res.json()["choices"][0]["message"]["content"].strip()
                 import re
                 match = re.search(r'\{.*\}', text, re.DOTALL)
@@ -1055,8 +1198,10 @@ def _call_ai_with_fallback(prompt, system_prompt="You are a professional crypto
                     "response_mime_type": "application/json"
                 }
             }
-            res = requests.post(url, headers=headers, json=payload, timeout=(10, 60))
+            res = api_transport.post(url, headers=headers, json=payload, timeout=(10, 60))
             if res.status_code == 200:
+                usage = res.json().get("usageMetadata") or {}
+                record_llm("gemini", usage.get("promptTokenCount"), usage.get("candidatesTokenCount"), usage.get("cachedContentTokenCount"))
                 text = res.json()["candidates"][0]["content"]["parts"][0]["text"].strip()
                 import re
                 match = re.search(r'\{.*\}', text, re.DOTALL)
@@ -1154,23 +1299,17 @@ def translate_news_data(news_data):
         
     return news_data
 
-def main():
-    print("DEBUG: Entering crypto_brain.main()...")
-    
-    # 1. Setup Directories
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    output_file = os.path.join(base_dir, "../frontend/data/whale_analysis.json")
-    
-    history_data = {}
-    if os.path.exists(output_file):
-        try:
-            with open(output_file, "r") as f:
-                history_data = json.load(f)
-        except Exception as e:
-            print(f"Error loading history: {e}")
+_macro_history = None
 
-    # 2. Fetch News & Macro Data (Layer 1 & 2)
-    print("\n=== LAYER 1 & 2: GLOBAL MACRO & NEWS ===")
+def get_macro_history(data_dir):
+    """MacroHistory (time series file + collection), created on first use."""
+    global _macro_history
+    if _macro_history is None:
+        _macro_history = MacroHistory(data_dir)
+    return _macro_history
+
+def fetch_macro_and_news(base_dir):
+    """Layer 1 & 2: macro snapshot (with local 5d history) and translated news. Returns (macro_data, news_data)."""
     try:
         print("Fetching Macro Data (Fed, Liquidity)...")
         macro_data = {
@@ -1182,7 +1321,7 @@ def main():
         # --- Macro History Persistence ---
         try:
              data_dir_path = os.path.join(base_dir, "../frontend/data")
-             mh = MacroHistory(data_dir_path)
+             mh = get_macro_history(data_dir_path)
              mh.add_snapshot(
                  macro_data.get("fed_futures", {}), 
                  macro_data.get("japan_macro", {}), 
@@ -1216,64 +1355,112 @@ def main():
         traceback.print_exc()
         macro_data = {}
         news_data = {}
+    return macro_data, news_data
 
-    # 3. Fetch Whale Data (Layer 3)
-    print("\n=== LAYER 3: WHALE & MARKET REALITY ===")
-    
-    print("Fetching data from Moralis (ETH)...")
-    new_eth_transfers = fetch_large_transfers()
+def main():
+    print("DEBUG: Entering crypto_brain.main()...")
     
-    print("Fetching data from Moralis (SOL)...")
-    new_sol_transfers = fetch_solana_swaps()
+    # 1. Setup Directories
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    output_file = os.path.join(base_dir, "../frontend/data/whale_analysis.json")
     
-    print("Fetching Fear & Greed Index...")
-    fear_greed = fetch_fear_greed_index()
+    history_data = {}
+    if os.path.exists(output_file):
+        try:
+            with open(output_file, "r") as f:
+                history_data = json.load(f)
+        except Exception as e:
+            print(f"Error loading history: {e}")
+
+    # 2-4. Independent fetches run concurrently: macro & news (Layer 1 & 2), whale scans,
+    # Fear & Greed, OKX metrics, liquidations (Layer 3) and DefiLlama flows
+    print("\n=== LAYER 1-3: MACRO, NEWS, WHALE & MARKET REALITY (concurrent) ===")
+
+    def scan(cursor_file, window_file, fetch):
+        # Cursors are loaded inside the stage: a timed-out scan can never advance the saved ones.
+        # Without its window (e.g. a restart whose data pull missed it) a cursor would skip the
+        # window's history, so start from the latest data instead.
+        cursors = load_cursors(cursor_file) if os.path.exists(window_file) else {}
+        return cursors, fetch(cursors)
+
+    fetch_run = run_dag([
+        Stage("macro_news", lambda _: fetch_macro_and_news(base_dir), timeout=FETCH_TIMEOUTS["macro_news"]),
+        Stage("eth_scan", lambda _: scan(ETHERSCAN_CURSOR_FILE, ETH_WINDOW_FILE, fetch_large_transfers), timeout=FETCH_TIMEOUTS["eth_scan"]),
+        Stage("sol_scan", lambda _: scan(SOLANA_CURSOR_FILE, SOL_WINDOW_FILE, fetch_solana_swaps), timeout=FETCH_TIMEOUTS["sol_scan"]),
+        Stage("fear_greed", lambda _: fetch_fear_greed_index(), timeout=FETCH_TIMEOUTS["fear_greed"]),
+        # All symbols are fetched concurrently under the shared OKX rate budget
+        Stage("markets", lambda _: market_data.get_strategy_metrics_many(["ETH", "SOL", "BTC", "BNB", "DOGE"]),
+              timeout=FETCH_TIMEOUTS["markets"]),
+        Stage("liquidations", lambda _: {
+                  sym: market_data.client.fetch_liquidation_data(f"{sym}-USDT") for sym in LIQUIDATION_SYMBOLS
+              }, timeout=FETCH_TIMEOUTS["liquidations"]),
+        Stage("defillama", lambda _: fetch_defillama_global_flows(), timeout=FETCH_TIMEOUTS["defillama"]),
+    ], name="crypto_brain_fetch")
+
+    macro_data, news_data = fetch_run.output("macro_news", ({}, {}))
+    # A failed/timed-out scan contributes no txs and leaves its cursors where they were
+    eth_cursors, new_eth_transfers = fetch_run.output("eth_scan", (load_cursors(ETHERSCAN_CURSOR_FILE), []))
+    sol_cursors, new_sol_transfers = fetch_run.output("sol_scan", (load_cursors(SOLANA_CURSOR_FILE), []))
+    fear_greed = fetch_run.output("fear_greed", {"value": 50, "value_classification": "Neutral", "change": 0})
     print(f"Fear & Greed: {fear_greed['value']} ({fear_greed['value_classification']})")
     
-    # Merge with History (Keep last 24h/7d deduplicated)
-    old_eth_txs = []
-    if "eth" in history_data and "top_txs" in history_data["eth"]:
-        old_eth_txs = history_data["eth"]["top_txs"]
-        
-    old_sol_txs = []
-    if "sol" in history_data and "top_txs" in history_data["sol"]:
-        old_sol_txs = history_data["sol"]["top_txs"]
-        
-    # Deduplicate logic
-    old_eth_hashes = {tx['hash'] for tx in old_eth_txs}
-    unique_new_eth = [tx for tx in new_eth_transfers if tx['hash'] not in old_eth_hashes]
-    
-    old_sol_hashes = {tx['hash'] for tx in old_sol_txs}
-    unique_new_sol = [tx for tx in new_sol_transfers if tx['hash'] not in old_sol_hashes]
-    
+    # Merge with History: rolling 7d windows (deduplicated by (hash, symbol))
+    eth_window = TxWindow(ETH_WINDOW_FILE)
+    sol_window = TxWindow(SOL_WINDOW_FILE)
+
+    # First run: seed the windows from the last published top_txs
+    if not len(eth_window):
+        eth_window.add(history_data.get("eth", {}).get("top_txs", []))
+    if not len(sol_window):
+        sol_window.add(history_data.get("sol", {}).get("top_txs", []))
+
+    unique_new_eth = eth_window.add(new_eth_transfers)
+    unique_new_sol = sol_window.add(new_sol_transfers)
     print(f"New Unique Tx Found: ETH={len(unique_new_eth)}, SOL={len(unique_new_sol)}")
 
-    eth_transfers = merge_and_filter_txs(new_eth_transfers, old_eth_txs)
-    sol_transfers = merge_and_filter_txs(new_sol_transfers, old_sol_txs)
+    eth_window.evict()
+    sol_window.evict()
+    eth_transfers = eth_window.latest()
+    sol_transfers = sol_window.latest()
+
+    # Flow rollups: fold in only the new txs (a missing rollup is rebuilt from the whole window)
+    eth_rollup = FlowRollup(rollup_path("eth"), STABLECOINS)
+    sol_rollup = FlowRollup(rollup_path("sol"), STABLECOINS)
+    for rollup, window, unique_new in ((eth_rollup, eth_window, unique_new_eth), (sol_rollup, sol_window, unique_new_sol)):
+        if len(rollup):
+            rollup.add(unique_new)
+        else:
+            rollup.add(window.latest(), window.latest_epochs())
     
-    # 4. Fetch Market Data & Analyze
-    print("Fetching Market Data (OKX)...")
-    eth_market = market_data.get_strategy_metrics("ETH")
-    sol_market = market_data.get_strategy_metrics("SOL")
-    btc_market = market_data.get_strategy_metrics("BTC")
-    bnb_market = market_data.get_strategy_metrics("BNB")   # NEW
-    doge_market = market_data.get_strategy_metrics("DOGE") # NEW
+    # 4. Market Data & Analyze
+    # A failed/timed-out stage or symbol degrades to empty metrics instead of aborting the cycle
+    markets = fetch_run.output("markets", {})
+    eth_market = markets.get("ETH") or {}
+    sol_market = markets.get("SOL") or {}
+    btc_market = markets.get("BTC") or {}
+    bnb_market = markets.get("BNB") or {}   # NEW
+    doge_market = markets.get("DOGE") or {} # NEW
     
-    # NEW: Fetch Liquidation Data (The "Pain" Index)
-    print("Fetching Liquidation Data (Market Pain)...")
-    eth_liquidation = market_data.client.fetch_liquidation_data("ETH-USDT")
-    sol_liquidation = market_data.client.fetch_liquidation_data("SOL-USDT")
-    btc_liquidation = market_data.client.fetch_liquidation_data("BTC-USDT")
-    bnb_liquidation = market_data.client.fetch_liquidation_data("BNB-USDT")   # NEW
-    doge_liquidation = market_data.client.fetch_liquidation_data("DOGE-USDT") # NEW
+    # NEW: Liquidation Data (The "Pain" Index)
+    liquidations = fetch_run.output("liquidations", {})
+    eth_liquidation = liquidations.get("ETH", {})
+    sol_liquidation = liquidations.get("SOL", {})
+    btc_liquidation = liquidations.get("BTC", {})
+    bnb_liquidation = liquidations.get("BNB", {})   # NEW
+    doge_liquidation = liquidations.get("DOGE", {}) # NEW
     
     print(f"ETH Liq: Long ${eth_liquidation.get('long_vol_usd',0):.0f} / Short ${eth_liquidation.get('short_vol_usd',0):.0f}")
     print(f"SOL Liq: Long ${sol_liquidation.get('long_vol_usd',0):.0f} / Short ${sol_liquidation.get('short_vol_usd',0):.0f}")
     print(f"BTC Liq: Long ${btc_liquidation.get('long_vol_usd',0):.0f} / Short ${btc_liquidation.get('short_vol_usd',0):.0f}")
 
+    # Which endpoints slowed this cycle down
+    from http_transport import okx_transport
+    okx_transport.print_stats()
+    api_transport.print_stats()
+
     print("Calculating Strategy V1 Metrics...")
-    eth_analysis = analyze_transfers_v1(eth_transfers, eth_market, target_symbol="ETH")
-    sol_analysis = analyze_transfers_v1(sol_transfers, sol_market, target_symbol="SOL")
+    eth_analysis = analyze_transfers_v1(eth_transfers, eth_market, target_symbol="ETH", epochs=eth_window.latest_epochs())
+    sol_analysis = analyze_transfers_v1(sol_transfers, sol_market, target_symbol="SOL", epochs=sol_window.latest_epochs())
     
     # Helper to create dummy analysis for chains without whale data
     def create_dummy_analysis(liq_data):
@@ -1335,8 +1522,7 @@ def main():
     sol_analysis["stats_7d"]["sentiment_score"] = smooth_score("sol", "stats_7d", sol_analysis, history_data)
 
     # [NEW] Inject DefiLlama Macro Flow Data (Global Liquidity)
-    print("Fetching DefiLlama Global Flows...")
-    global_stable_flow = fetch_defillama_global_flows()
+    global_stable_flow = fetch_run.output("defillama", 0)
     if global_stable_flow != 0:
         macro_data["global_stable_flow"] = global_stable_flow
 
@@ -1410,13 +1596,12 @@ def main():
 
             # 3. Add Whale Data
             snapshot_data["whale_scan_data"] = {
-                "eth_transfers": eth_transfers,
-                "sol_swaps": sol_transfers,
+                "eth_transfers": eth_transfers[:TOP_TXS_API_LIMIT],
+                "sol_swaps": sol_transfers[:TOP_TXS_API_LIMIT],
                 "updated_at": datetime.now().isoformat()
             }
 
-            with open(path, "w") as f:
-                json.dump(snapshot_data, f, indent=2)
+            json_store.write_json(path, snapshot_data)
             print(f"✅ Synced fresh data to {path}")
 
         except Exception as e:
@@ -1461,14 +1646,16 @@ def main():
             "stats_24h": eth_analysis["stats_24h"],
             "stats_history": eth_history,
             "market": eth_market,
-            "top_txs": eth_transfers[:1000]
+            "flow_windows": {name: eth_rollup.window(sec, market_signal_scores(eth_market)) for name, sec in ROLLUP_WINDOWS.items()},
+            "top_txs": eth_transfers[:TOP_TXS_API_LIMIT]
         },
         "sol": {
             "stats": sol_analysis["stats_7d"],
             "stats_24h": sol_analysis["stats_24h"],
             "stats_history": sol_history,
             "market": sol_market,
-            "top_txs": sol_transfers[:1000]
+            "flow_windows": {name: sol_rollup.window(sec, market_signal_scores(sol_market)) for name, sec in ROLLUP_WINDOWS.items()},
+            "top_txs": sol_transfers[:TOP_TXS_API_LIMIT]
         },
         "btc": {
             "stats": btc_analysis["stats_24h"],
@@ -1481,10 +1668,17 @@ def main():
     }
 
     try:
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, 'w') as f:
-            json.dump(final_output, f, indent=2)
+        # Same file as the whale_analysis local copy below: the two writes are coalesced into one
+        json_store.write_json_later(output_file, final_output)
         print(f"✅ Analysis saved to {output_file}")
+
+        # Persist the windows, then advance ingestion cursors only once the new transfers are saved
+        eth_window.save()
+        sol_window.save()
+        eth_rollup.save()
+        sol_rollup.save()
+        save_cursors(ETHERSCAN_CURSOR_FILE, eth_cursors)
+        save_cursors(SOLANA_CURSOR_FILE, sol_cursors)
         
         # Sync to DB
         from db_client import db
@@ -1500,6 +1694,7 @@ def main():
             try:
                 from telegram_bot import send_daily_report
                 print(f"Sending Telegram report...")
+                json_store.flush()  # the report reads whale_analysis.json from disk
                 send_daily_report(output_file)
             except Exception as e:
                 print(f"Telegram fail: {e}")
@@ -1531,5 +1726,7 @@ def main():
     else:
         print("No new transactions. Skipping alerts.")
 
+    return final_output
+
 if __name__ == "__main__":
     main()
@@ -23,9 +23,18 @@ FILES_TO_PULL = [
     "frontend/data/trade_history.json",
     "frontend/data/agent_decision_log.json",
     "frontend/data/agent_memory.json",
-    "frontend/data/nav_history.json",
+    "frontend/data/nav_series.f64",
+    "frontend/data/macro_series.f64",
     "frontend/data/portfolio_state.json",
-    "frontend/data/whale_analysis.json"
+    "frontend/data/whale_analysis.json",
+    # Whale ingestion state, so a restart resumes the full 7d windows and rollups.
+    # Windows/rollups come before the cursors: a cursor must never be ahead of its window.
+    "backend/eth_tx_window.npz",
+    "backend/sol_tx_window.npz",
+    "backend/eth_flow_rollup.npz",
+    "backend/sol_flow_rollup.npz",
+    "backend/etherscan_cursors.json",
+    "backend/solana_cursors.json"
 ]
 
 def pull_file(file_path):
@@ -24,9 +24,18 @@ FILES_TO_SYNC = [
     "frontend/data/whale_analysis.json",
     "frontend/data/trade_history.json",
     "frontend/data/portfolio_state.json",
-    "frontend/data/nav_history.json",
+    "frontend/data/nav_series.f64",
+    "frontend/data/macro_series.f64",
     "frontend/data/agent_decision_log.json",
     "frontend/data/agent_memory.json",
+    # Whale ingestion state, so a restart resumes the full 7d windows and rollups.
+    # Windows/rollups come before the cursors: a cursor must never be ahead of its window.
+    "backend/eth_tx_window.npz",
+    "backend/sol_tx_window.npz",
+    "backend/eth_flow_rollup.npz",
+    "backend/sol_flow_rollup.npz",
+    "backend/etherscan_cursors.json",
+    "backend/solana_cursors.json",
     "backend/qlib_data/model_latest.pkl"
 ]
 
@@ -1,111 +1,442 @@
+import copy
 import os
-import json
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import threading
+import time
+import uuid
 from datetime import datetime
 from dotenv import load_dotenv
-import certifi
+import instrumentation
+import json_store
 
 load_dotenv()
 
+# Natural key of each list collection: documents are upserted by it instead of rewriting the collection.
+# Decisions get a time_ordered_id() ("timestamp" has second precision, so it is not unique); documents
+# written before that have no "id" and are left alone by key-based writes.
+NATURAL_KEYS = {
+    "trade_history": "id",
+    "nav_history": "timestamp",
+    "agent_decisions": "id",
+    "agent_decision_log": "id",
+}
+# Local copies of these are kept newest first (the others are chronological)
+NEWEST_FIRST = {"agent_decisions", "agent_decision_log"}
+# Time field used by query(time_range=...)
+TIME_FIELDS = {
+    "trade_history": "exitTime",
+    "nav_history": "timestamp",
+    "agent_decisions": "timestamp",
+    "agent_decision_log": "timestamp",
+}
+# Read-through cache TTL (seconds) of MongoDB reads per collection. Writes made through this client
+# invalidate immediately; the TTL only bounds staleness from other writers (other processes, scripts).
+CACHE_TTLS = {
+    "portfolio_state": 30,
+    "whale_analysis": 300,
+    "agent_decisions": 300,
+    "agent_decision_log": 300,
+    "trade_history": 300,
+    "nav_history": 300,
+}
+DEFAULT_CACHE_TTL = 60
+# Single-field indexes created once per connection
+INDEXES = {
+    "trade_history": ["id", "exitTime"],
+    "nav_history": ["timestamp"],
+    "agent_decisions": ["id", "timestamp"],
+    "agent_decision_log": ["id", "timestamp"],
+}
+
+
+def time_ordered_id():
+    """Unique id that sorts by creation time (microsecond timestamp + random suffix)."""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+
+
+def _matches(doc, match):
+    """Local evaluation of a MongoDB filter (equality, $exists, $gt/$gte/$lt/$lte, $in/$nin)."""
+    for field, cond in match.items():
+        value = doc.get(field)
+        if not isinstance(cond, dict):
+            if value != cond:
+                return False
+            continue
+        for op, arg in cond.items():
+            try:
+                ok = {
+                    "$exists": lambda: (field in doc) == bool(arg),
+                    "$gt": lambda: value is not None and value > arg,
+                    "$gte": lambda: value is not None and value >= arg,
+                    "$lt": lambda: value is not None and value < arg,
+                    "$lte": lambda: value is not None and value <= arg,
+                    "$in": lambda: value in arg,
+                    "$nin": lambda: value not in arg,
+                    "$ne": lambda: value != arg,
+                }[op]()
+            except TypeError:  # e.g. str vs number
+                ok = False
+            if not ok:
+                return False
+    return True
+
 class DBClient:
+    """
+    MongoDB-backed store with local JSON fallback.
+    The connection (pymongo import + ping) is made lazily on first use, so importing this module
+    never blocks on the network; the first DB access pays the connection cost once.
+    MongoDB reads go through a process-local cache (see CACHE_TTLS), invalidated by every write.
+    """
     def __init__(self):
         self.uri = os.getenv("MONGODB_URI")
-        self.client = None
-        self.db = None
-        self.is_connected = False
-        
-        if self.uri and "mongodb+srv://<" not in self.uri and "<password>" not in self.uri:
-            try:
-                # Disable SSL warnings for local dev sometimes, but SRV needs it
-                self.client = MongoClient(self.uri, serverSelectionTimeoutMS=5000, tlsCAFile=certifi.where())
-                # Verify connection
-                self.client.admin.command('ping')
-                self.db = self.client.whale_watcher # Database name
-                self.is_connected = True
-                print("✅ [MongoDB] Safely connected to Cloud Database!")
-            except Exception as e:
-                print(f"⚠️ [MongoDB] Connection Failed: {e}. Falling back to local JSON.")
-        else:
-            print("⚠️ [MongoDB] Missing or invalid MONGODB_URI. Falling back to local JSON files.")
+        self._client = None
+        self._db = None
+        self._connected = False
+        self._connect_attempted = False
+        self._connect_lock = threading.Lock()
+        self._connect_thread = None
+        self._save_listeners = []
+        self._cache = {}        # (collection, *args) -> (expires_at, value)
+        self._generations = {}  # collection -> write count, so a read racing a write is not cached
+        self._cache_lock = threading.Lock()
+        self.cache_stats = {}   # collection -> {"hit": n, "miss": n}
+
+    def add_save_listener(self, fn):
+        """fn(collection_name, data) is called after every save_data (e.g. to refresh API responses)."""
+        self._save_listeners.append(fn)
+
+    def connect_async(self):
+        """Start connecting in a background thread (no-op once started)."""
+        with self._connect_lock:
+            if self._connect_attempted or self._connect_thread is not None:
+                return
+            self._connect_thread = threading.Thread(target=self.connect, name="mongo-connect", daemon=True)
+        self._connect_thread.start()
+
+    def connect(self, wait=True):
+        """
+        Connect once (thread-safe). Returns True if MongoDB is usable.
+        wait=False never blocks: while the connection is still being made it starts it in the
+        background (if needed) and returns False, so the caller can serve the local copy.
+        """
+        if self._connect_attempted:
+            return self._connected
+        if not wait:
+            self.connect_async()
+            return False
+        with self._connect_lock:
+            if self._connect_attempted:
+                return self._connected
+            if self.uri and "mongodb+srv://<" not in self.uri and "<password>" not in self.uri:
+                try:
+                    from pymongo import MongoClient
+                    import certifi
+                    # Disable SSL warnings for local dev sometimes, but SRV needs it
+                    client = MongoClient(self.uri, serverSelectionTimeoutMS=5000, tlsCAFile=certifi.where())
+                    # Verify connection
+                    client.admin.command('ping')
+                    self._client = client
+                    self._db = client.whale_watcher # Database name
+                    self._connected = True
+                    print("✅ [MongoDB] Safely connected to Cloud Database!")
+                    self._ensure_indexes()
+                except Exception as e:
+                    print(f"⚠️ [MongoDB] Connection Failed: {e}. Falling back to local JSON.")
+            else:
+                print("⚠️ [MongoDB] Missing or invalid MONGODB_URI. Falling back to local JSON files.")
+            self._connect_attempted = True
+        return self._connected
+
+    @property
+    def is_connected(self):
+        return self.connect()
+
+    @property
+    def client(self):
+        self.connect()
+        return self._client
+
+    @property
+    def db(self):
+        self.connect()
+        return self._db
 
     def _get_local_path(self, collection_name):
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         return os.path.join(base_dir, "frontend", "data", f"{collection_name}.json")
 
+    def _ensure_indexes(self):
+        """create_index is idempotent (no-op when the index exists)."""
+        try:
+            for collection_name, fields in INDEXES.items():
+                for field in fields:
+                    self._db[collection_name].create_index(field)
+        except Exception as e:
+            print(f"⚠️ [MongoDB] Index creation failed: {e}")
+
+    # --- Read-through cache ---
+    def _cached(self, collection_name, key, fetch):
+        """
+        Cached result of fetch() (a MongoDB read), including empty results. None from fetch means
+        "fall back to local" and is not cached. Callers get a deep copy, so mutating it never alters the cache.
+        """
+        full_key = (collection_name,) + key
+        with self._cache_lock:
+            entry = self._cache.get(full_key)
+            generation = self._generations.get(collection_name, 0)
+            stats = self.cache_stats.setdefault(collection_name, {"hit": 0, "miss": 0})
+            hit = entry is not None and entry[0] > time.monotonic()
+            stats["hit" if hit else "miss"] += 1
+        instrumentation.count("db_cache.hit" if hit else "db_cache.miss")
+        if hit:
+            return copy.deepcopy(entry[1])
+
+        value = fetch()
+        if value is None:
+            return None
+        with self._cache_lock:
+            if self._generations.get(collection_name, 0) == generation:
+                ttl = CACHE_TTLS.get(collection_name, DEFAULT_CACHE_TTL)
+                self._cache[full_key] = (time.monotonic() + ttl, value)
+        return copy.deepcopy(value)
+
+    def invalidate(self, collection_name):
+        """Drop every cached read of a collection (called on each write)."""
+        with self._cache_lock:
+            self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+            for key in [k for k in self._cache if k[0] == collection_name]:
+                del self._cache[key]
+
     # --- Read / Get ---
-    def get_data(self, collection_name, default_value=None):
+    def get_data(self, collection_name, default_value=None, wait=True):
+        """wait=False: read the local copy instead of blocking while MongoDB is still connecting (API handlers)."""
         if default_value is None:
             default_value = [] if collection_name != "portfolio_state" else {}
 
-        if self.is_connected:
+        if self.connect(wait=wait):
             try:
-                collection = self.db[collection_name]
-                if collection_name in ["portfolio_state", "whale_analysis"]:
-                    # Fetch the latest state document
-                    doc = collection.find_one({"_id": "current_state"})
-                    if doc:
-                        doc.pop("_id", None)
-                        return doc
-                    # If MongoDB is empty for this, fall through to local fallback
-                else:
-                    # Logs, nav history, trade history are arrays of documents
-                    cursor = collection.find({}, {"_id": 0})
-                    if collection_name in ["agent_decision_log", "agent_decisions"]:
-                        cursor = cursor.sort("timestamp", -1) # newest first
-                    
-                    data = list(cursor)
-                    if data:
-                        return data
-                    # If empty list, fall through to local fallback
+                data = self._cached(collection_name, ("get",), lambda: self._fetch(collection_name))
+                if data is not None:
+                    return data
             except Exception as e:
                 print(f"⚠️ [MongoDB Fetch Error] {collection_name}: {e}. Falling back to local.")
         
         # Fallback to local
-        path = self._get_local_path(collection_name)
-        if os.path.exists(path):
+        data = self._read_local(collection_name)
+        return default_value if data is None else data
+
+    def _fetch(self, collection_name):
+        """Whole collection from MongoDB (possibly empty); None when a state document is missing."""
+        collection = self.db[collection_name]
+        if collection_name in ["portfolio_state", "whale_analysis"]:
+            # Fetch the latest state document
+            doc = collection.find_one({"_id": "current_state"})
+            if doc:
+                doc.pop("_id", None)
+                return doc
+            # If MongoDB is empty for this, fall through to local fallback
+            return None
+        # Logs, nav history, trade history are arrays of documents
+        cursor = collection.find({}, {"_id": 0})
+        if collection_name in ["agent_decision_log", "agent_decisions"]:
+            cursor = cursor.sort("timestamp", -1) # newest first
+        return list(cursor)
+
+    def query(self, collection_name, match=None, sort=None, limit=None, skip=0, projection=None,
+              time_range=None, wait=True):
+        """
+        Filtered read of a list collection, evaluated by MongoDB (indexed) or on the local copy.
+        match: MongoDB filter (see _matches for what the local fallback supports)
+        sort: [(field, 1 | -1), ...]; projection: list of fields to return
+        time_range: (start, end) on TIME_FIELDS[collection_name], start inclusive, end exclusive,
+        either may be None. Values compare as stored (ISO-like strings).
+        The local copy is only used when MongoDB is unavailable or the query fails.
+        """
+        match = dict(match or {})
+        if time_range:
+            start, end = time_range
+            bounds = {}
+            if start is not None:
+                bounds["$gte"] = start
+            if end is not None:
+                bounds["$lt"] = end
+            if bounds:
+                match[TIME_FIELDS[collection_name]] = bounds
+
+        def fetch():
+            fields = {"_id": 0, **{f: 1 for f in projection}} if projection else {"_id": 0}
+            cursor = self.db[collection_name].find(match, fields)
+            if sort:
+                cursor = cursor.sort(sort)
+            if skip:
+                cursor = cursor.skip(skip)
+            if limit:
+                cursor = cursor.limit(limit)
+            return list(cursor)
+
+        if self.connect(wait=wait):
             try:
-                with open(path, "r") as f:
-                    return json.load(f)
-            except:
-                pass
-        return default_value
+                key = ("query", repr((match, sort, limit, skip, projection)))
+                data = self._cached(collection_name, key, fetch)
+                if data is not None:
+                    return data
+            except Exception as e:
+                print(f"⚠️ [MongoDB Query Error] {collection_name}: {e}. Falling back to local.")
+
+        data = self._read_local(collection_name)
+        if not isinstance(data, list):
+            return []
+        data = [doc for doc in data if _matches(doc, match)] if match else list(data)
+        for field, direction in reversed(sort or []):
+            data.sort(key=lambda doc: (doc.get(field) is not None, doc.get(field)), reverse=direction < 0)
+        data = data[skip:skip + limit] if limit else data[skip:]
+        if projection:
+            data = [{f: doc[f] for f in projection if f in doc} for doc in data]
+        return data
+
+    def count(self, collection_name, match=None, wait=True):
+        """Number of documents matching `match` (count_documents, or on the local copy)."""
+        match = match or {}
+        if self.connect(wait=wait):
+            try:
+                return self._cached(collection_name, ("count", repr(match)),
+                                    lambda: self.db[collection_name].count_documents(match))
+            except Exception as e:
+                print(f"⚠️ [MongoDB Query Error] {collection_name}: {e}. Falling back to local.")
+        data = self._read_local(collection_name)
+        if not isinstance(data, list):
+            return 0
+        return sum(1 for doc in data if _matches(doc, match))
 
     # --- Write / Save ---
-    def save_data(self, collection_name, data):
-        # 1. Always save to local json as backup / fast read for frontend
-        path = self._get_local_path(collection_name)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
+    def _write_local(self, collection_name, data):
+        # Atomic and coalesced: several saves of one collection within a cycle hit the disk once
         try:
-            with open(path, "w") as f:
-                json.dump(data, f, indent=2)
+            json_store.write_json_later(self._get_local_path(collection_name), data)
         except Exception as e:
             print(f"⚠️ Failed to write local json {collection_name}: {e}")
 
+    def _read_local(self, collection_name):
+        return json_store.read_json(self._get_local_path(collection_name))
+
+    def get_local_data(self, collection_name, default_value=None):
+        """The local JSON copy only (e.g. restored by data_pull), whatever MongoDB holds."""
+        data = self._read_local(collection_name)
+        return default_value if data is None else data
+
+    def _notify(self, collection_name, data):
+        for fn in self._save_listeners:
+            try:
+                fn(collection_name, data)
+            except Exception as e:
+                print(f"⚠️ Save listener failed for {collection_name}: {e}")
+
+    @staticmethod
+    def _bulk_upsert(collection, items, key):
+        """One unordered bulk_write of ReplaceOne(upsert) per item, matched on the natural key."""
+        from pymongo import ReplaceOne
+        ops = []
+        for item in items:
+            doc = {k: v for k, v in item.items() if k != "_id"}
+            ops.append(ReplaceOne({key: doc[key]}, doc, upsert=True))
+        if ops:
+            collection.bulk_write(ops, ordered=False)
+
+    def save_data(self, collection_name, data):
+        """
+        Replace the whole collection with `data`. For list collections prefer append_data /
+        upsert_by_key, which only write the changed documents.
+        """
+        # 1. Always save to local json as backup / fast read for frontend
+        self._write_local(collection_name, data)
+
         # 2. Sync to MongoDB if connected
         if self.is_connected:
             try:
                 collection = self.db[collection_name]
+                key = NATURAL_KEYS.get(collection_name)
                 if collection_name == "portfolio_state":
                     # Update a single master document
                     data["_id"] = "current_state" 
                     collection.replace_one({"_id": "current_state"}, data, upsert=True)
-                else:
-                    # For arrays (logs, history), if we pass the whole array, we'd need to clear and insert
-                    # Or better: just replace everything. Since array sizes are small right now.
-                    # A better way for large arrays is to use insert_one when a new log arrives, 
-                    # but since the current architecture dumps the whole list, we drop and insert many.
-                    if isinstance(data, list) and len(data) > 0:
-                        collection.delete_many({})
-                        # MongoDB modification: Ensure no internal `_id` conflicts
-                        safe_data = []
-                        for item in data:
-                            safe_item = item.copy()
-                            safe_item.pop("_id", None)
-                            safe_data.append(safe_item)
-                        collection.insert_many(safe_data)
+                elif key and isinstance(data, list) and len(data) > 0:
+                    # Upsert every document, then drop the ones no longer present.
+                    # Readers never see the collection empty (no delete-all + re-insert window).
+                    # Documents without the key are neither written nor deleted.
+                    items = [item for item in data if key in item]
+                    if len(items) < len(data):
+                        print(f"⚠️ [MongoDB] {collection_name}: {len(data) - len(items)} documents without '{key}' were not synced")
+                    if items:
+                        self._bulk_upsert(collection, items, key)
+                        collection.delete_many({key: {"$exists": True, "$nin": [item[key] for item in items]}})
+                elif isinstance(data, list) and len(data) > 0:
+                    # Collections without a natural key: drop and re-insert
+                    collection.delete_many({})
+                    # MongoDB modification: Ensure no internal `_id` conflicts
+                    safe_data = []
+                    for item in data:
+                        safe_item = item.copy()
+                        safe_item.pop("_id", None)
+                        safe_data.append(safe_item)
+                    collection.insert_many(safe_data)
             except Exception as e:
                 print(f"⚠️ [MongoDB Sync Error] {collection_name}: {e}")
+            self.invalidate(collection_name)
+
+        # 3. Notify listeners
+        self._notify(collection_name, data)
+
+    def upsert_by_key(self, collection_name, items, key=None, keep=None):
+        """
+        Insert or replace `items` (matched on `key`, default NATURAL_KEYS[collection_name]).
+        MongoDB only receives these documents (one unordered bulk_write), so the cost scales with
+        the change, not with the collection. keep: trim to the newest `keep` documents (MongoDB is
+        trimmed by TIME_FIELDS[collection_name] when there is one, else by key).
+        Returns the updated local list.
+        """
+        key = key or NATURAL_KEYS[collection_name]
+        items = [item for item in items if key in item]
+        newest_first = collection_name in NEWEST_FIRST
+
+        # 1. Merge into the local copy (seeded from the DB once if the file is missing)
+        local = self._read_local(collection_name)
+        if not isinstance(local, list):
+            local = self.get_data(collection_name, [])
+            if not isinstance(local, list):
+                local = [local] if local else []
+        positions = {doc.get(key): i for i, doc in enumerate(local)}
+        new_items = {}
+        for item in items:
+            if item[key] in positions:
+                local[positions[item[key]]] = item
+            else:
+                new_items[item[key]] = item
+        new_items = list(new_items.values())
+        local = new_items[::-1] + local if newest_first else local + new_items
+        trim_field = TIME_FIELDS.get(collection_name, key)
+        oldest_kept = None
+        if keep and len(local) > keep:
+            local = local[:keep] if newest_first else local[-keep:]
+            oldest_kept = (local[-1] if newest_first else local[0]).get(trim_field)
+        self._write_local(collection_name, local)
+
+        # 2. Write only the changed documents to MongoDB
+        if items and self.is_connected:
+            try:
+                collection = self.db[collection_name]
+                self._bulk_upsert(collection, items, key)
+                if oldest_kept is not None:
+                    collection.delete_many({trim_field: {"$lt": oldest_kept}})
+            except Exception as e:
+                print(f"⚠️ [MongoDB Sync Error] {collection_name}: {e}")
+            self.invalidate(collection_name)
+
+        # 3. Notify listeners
+        self._notify(collection_name, local)
+        return local
+
+    def append_data(self, collection_name, items, keep=None):
+        """Append new documents (e.g. one NAV point or one trade); see upsert_by_key."""
+        return self.upsert_by_key(collection_name, items, keep=keep)
 
 # Singleton Instance
 db = DBClient()
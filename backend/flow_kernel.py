@@ -0,0 +1,100 @@
+"""
+Columnar whale-flow aggregation used by crypto_brain.analyze_transfers_v1.
+Transfers are converted once into NumPy columns (amount, signal code, epoch, stable flag, interned
+sender id), then every window is reduced in the same vectorized pass: sums are one matrix product
+against the window membership mask, per-whale volumes are one bincount.
+"""
+import time
+import numpy as np
+from tx_window import to_epoch
+
+SIGNALS = ("NEUTRAL", "BULLISH_INFLOW", "BULLISH_OUTFLOW", "BEARISH_INFLOW", "BEARISH_OUTFLOW")
+SIGNAL_CODES = {name: code for code, name in enumerate(SIGNALS)}
+NEUTRAL, BULLISH_INFLOW, BULLISH_OUTFLOW, BEARISH_INFLOW, BEARISH_OUTFLOW = range(len(SIGNALS))
+
+
+def signal_scores(is_real_dump=False):
+    """
+    Per-signal-code score table.
+    BEARISH_INFLOW is real selling (-2) when volume/OI confirm it, otherwise it might be hedging (-1).
+    """
+    scores = np.zeros(len(SIGNALS))
+    scores[BULLISH_INFLOW] = 2
+    scores[BULLISH_OUTFLOW] = 1
+    scores[BEARISH_OUTFLOW] = -1
+    scores[BEARISH_INFLOW] = -2 if is_real_dump else -1
+    return scores
+
+
+def build_columns(transfers, stablecoins, epochs=None):
+    """
+    transfers: list of tx dicts (amount_usd, signal, timestamp, symbol, from).
+    epochs: optional pre-parsed epoch seconds aligned with transfers (e.g. TxWindow.latest_epochs()).
+    Returns a dict of aligned arrays plus `addresses` (sender id -> address, first-seen order).
+    Unparseable timestamps get epoch -1 (they only count in windows without a cutoff).
+    """
+    ids = {}
+    stable = set(stablecoins)
+    return {
+        "amount": np.fromiter((tx["amount_usd"] for tx in transfers), float, len(transfers)),
+        "signal": np.fromiter((SIGNAL_CODES.get(tx["signal"], NEUTRAL) for tx in transfers), np.int8, len(transfers)),
+        "epoch": np.asarray(epochs, np.int64) if epochs is not None else
+                 np.fromiter((to_epoch(tx.get("timestamp")) or -1 for tx in transfers), np.int64, len(transfers)),
+        "is_stable": np.fromiter((tx["symbol"] in stable for tx in transfers), bool, len(transfers)),
+        "whale": np.fromiter((ids.setdefault(tx["from"], len(ids)) for tx in transfers), np.int64, len(transfers)),
+        "addresses": list(ids)
+    }
+
+
+def aggregate_windows(cols, windows, scores, now=None):
+    """
+    Reduce every window in one pass.
+    windows: {name: seconds or None (no cutoff)}; scores: per-signal-code score array (len(SIGNALS)).
+    Returns {name: {"w_score", "total_w", "stable", "token", "sum_vol", "cnt", "whale_count", "top_whale"}}
+    where top_whale is (address, volume) or None.
+    """
+    now = time.time() if now is None else now
+    names = list(windows)
+    amount, signal, whale = cols["amount"], cols["signal"], cols["whale"]
+    n_whales = len(cols["addresses"])
+
+    # (n_windows, n_tx) membership; cutoff is exclusive like the old `t > cutoff`
+    mask = np.vstack([
+        np.ones(len(amount), bool) if windows[name] is None else cols["epoch"] > now - windows[name]
+        for name in names
+    ]) if names else np.zeros((0, len(amount)), bool)
+
+    # Square root gives big whales much stronger emphasis than log10
+    weight = np.sqrt(np.where(amount > 0, amount, 0.0))
+    is_stable = cols["is_stable"]
+    stable_flow = np.where(is_stable & (signal == BULLISH_INFLOW), amount, 0.0) \
+        - np.where(is_stable & (signal == BEARISH_OUTFLOW), amount, 0.0)
+    token_flow = np.where(~is_stable & (signal == BULLISH_OUTFLOW), amount, 0.0) \
+        - np.where(~is_stable & (signal == BEARISH_INFLOW), amount, 0.0)
+
+    features = np.vstack([
+        np.asarray(scores, float)[signal] * weight, weight, stable_flow, token_flow, amount, np.ones(len(amount))
+    ])
+    sums = mask.astype(float) @ features.T  # (n_windows, 6)
+
+    # Per-window, per-whale volume and tx count in one bincount each
+    win_idx, tx_idx = np.nonzero(mask)
+    flat = win_idx * n_whales + whale[tx_idx]
+    size = len(names) * n_whales
+    vols = np.bincount(flat, weights=amount[tx_idx], minlength=size).reshape(len(names), n_whales)
+    seen = np.bincount(flat, minlength=size).reshape(len(names), n_whales) > 0
+
+    out = {}
+    for w, name in enumerate(names):
+        top = None
+        if seen[w].any():
+            # First-seen whale wins ties (same as max() over an insertion-ordered dict)
+            row = np.where(seen[w], vols[w], -np.inf)
+            best = int(np.argmax(row))
+            top = (cols["addresses"][best], float(vols[w, best]))
+        w_score, total_w, stable, token, sum_vol, cnt = sums[w].tolist()
+        out[name] = {
+            "w_score": w_score, "total_w": total_w, "stable": stable, "token": token,
+            "sum_vol": sum_vol, "cnt": int(cnt), "whale_count": int(seen[w].sum()), "top_whale": top
+        }
+    return out
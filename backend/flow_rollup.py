@@ -0,0 +1,119 @@
+"""
+Incrementally materialized whale-flow rollups.
+Each chain keeps fixed-size time buckets (15 min by default, 7 days retained in a ring) holding
+summed weights per signal, stablecoin/token in/out flow, volume and tx count. New txs are folded in
+as they arrive; any window is answered by summing the buckets it covers, so a query costs
+microseconds no matter how many raw txs are behind it.
+"""
+import os
+import time
+import numpy as np
+import flow_kernel
+import json_store
+
+BUCKET_SECONDS = 15 * 60
+RETENTION_SECONDS = 7 * 24 * 3600
+ROLLUP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Per-bucket columns: sqrt(amount) weight per signal code, then flows, volume and count
+FEATURES = tuple(f"w_{name.lower()}" for name in flow_kernel.SIGNALS) + (
+    "stable_in", "stable_out", "token_in", "token_out", "volume", "count"
+)
+N_SIGNALS = len(flow_kernel.SIGNALS)
+STABLE_IN, STABLE_OUT, TOKEN_IN, TOKEN_OUT, VOLUME, COUNT = range(N_SIGNALS, len(FEATURES))
+
+# Base signal scores (analyze_transfers_v1 without market context)
+DEFAULT_SCORES = flow_kernel.signal_scores()
+
+
+def rollup_path(chain):
+    """Shared location of a chain's rollup (written by crypto_brain, read by ai_trader)."""
+    return os.path.join(ROLLUP_DIR, f"{chain.lower()}_flow_rollup.npz")
+
+
+class FlowRollup:
+    """
+    Ring of time buckets for one chain.
+    add() folds in new txs (callers pass each tx once); window() sums the buckets covering
+    the last `seconds`, rounded out to whole buckets. Read-only users can omit stablecoins.
+    """
+    def __init__(self, path=None, stablecoins=(), bucket_seconds=BUCKET_SECONDS, retention_seconds=RETENTION_SECONDS):
+        self.stablecoins = stablecoins
+        self.path = path
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = retention_seconds // bucket_seconds + 1
+        self.ids = np.full(self.n_buckets, -1, dtype=np.int64)  # bucket number held by each slot
+        self.values = np.zeros((self.n_buckets, len(FEATURES)))
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        """Number of populated buckets."""
+        return int((self.ids >= 0).sum())
+
+    def _load(self):
+        try:
+            with np.load(self.path) as data:
+                if int(data["bucket_seconds"]) == self.bucket_seconds and data["values"].shape == self.values.shape:
+                    self.ids = data["ids"].copy()
+                    self.values = data["values"].copy()
+                else:
+                    print(f"⚠️ Flow rollup layout changed at {self.path}. Rebuilding.")
+        except Exception as e:
+            print(f"⚠️ Failed to load flow rollup {self.path}: {e}")
+
+    def save(self):
+        with json_store.atomic_write(self.path) as f:
+            np.savez(f, ids=self.ids, values=self.values, bucket_seconds=self.bucket_seconds)
+
+    def add(self, transfers, epochs=None, now=None):
+        """Fold new txs into their buckets. Txs older than the retention ring are ignored. Returns how many were added."""
+        if not len(transfers):
+            return 0
+        cols = flow_kernel.build_columns(transfers, self.stablecoins, epochs)
+        now = time.time() if now is None else now
+        current = int(now // self.bucket_seconds)
+        buckets = cols["epoch"] // self.bucket_seconds
+        keep = (cols["epoch"] >= 0) & (buckets > current - self.n_buckets)
+        if not keep.any():
+            return 0
+        buckets = buckets[keep]
+        slots = buckets % self.n_buckets
+
+        # Recycle slots still holding an expired bucket (ring wrap-around)
+        for slot, bucket in zip(*np.unique(np.stack([slots, buckets]), axis=1)):
+            if self.ids[slot] < bucket:
+                self.ids[slot] = bucket
+                self.values[slot] = 0.0
+        fresh = self.ids[slots] == buckets
+        slots = slots[fresh]
+
+        amount, signal, is_stable = cols["amount"][keep][fresh], cols["signal"][keep][fresh], cols["is_stable"][keep][fresh]
+        rows = np.zeros((len(slots), len(FEATURES)))
+        rows[np.arange(len(slots)), signal] = np.sqrt(np.where(amount > 0, amount, 0.0))
+        rows[:, STABLE_IN] = np.where(is_stable & (signal == flow_kernel.BULLISH_INFLOW), amount, 0.0)
+        rows[:, STABLE_OUT] = np.where(is_stable & (signal == flow_kernel.BEARISH_OUTFLOW), amount, 0.0)
+        rows[:, TOKEN_IN] = np.where(~is_stable & (signal == flow_kernel.BEARISH_INFLOW), amount, 0.0)
+        rows[:, TOKEN_OUT] = np.where(~is_stable & (signal == flow_kernel.BULLISH_OUTFLOW), amount, 0.0)
+        rows[:, VOLUME] = amount
+        rows[:, COUNT] = 1.0
+        np.add.at(self.values, slots, rows)
+        return len(slots)
+
+    def window(self, seconds, scores=DEFAULT_SCORES, now=None):
+        """Aggregates over the last `seconds`: net flows, weighted sentiment, volume and tx count."""
+        now = time.time() if now is None else now
+        current = int(now // self.bucket_seconds)
+        start = int((now - seconds) // self.bucket_seconds)
+        live = (self.ids >= start) & (self.ids <= current)
+        total = self.values[live].sum(axis=0)
+
+        weights = total[:N_SIGNALS]
+        total_w = weights.sum()
+        return {
+            "stablecoin_net_flow": float(total[STABLE_IN] - total[STABLE_OUT]),
+            "token_net_flow": float(total[TOKEN_OUT] - total[TOKEN_IN]),
+            "sentiment_score": float(np.dot(scores, weights) / total_w) if total_w > 0 else 0.0,
+            "total_volume": float(total[VOLUME]),
+            "tx_count": int(total[COUNT])
+        }
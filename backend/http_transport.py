@@ -0,0 +1,92 @@
+import time
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import instrumentation
+
+
+class HTTPTransport:
+    """
+    Shared keep-alive HTTP layer: one pooled requests.Session per process, retry/backoff on
+    429/5xx for idempotent methods, and per-endpoint latency counters (also billed to the current
+    instrumentation stage). POSTs (order placement) are never retried automatically to avoid duplicate orders.
+    """
+    def __init__(self, pool_maxsize=16, retries=3, backoff_factor=0.5):
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _record(self, key, elapsed, ok):
+        with self._stats_lock:
+            s = self._stats.setdefault(key, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            s["count"] += 1
+            s["total_ms"] += elapsed * 1000
+            s["max_ms"] = max(s["max_ms"], elapsed * 1000)
+            if not ok:
+                s["errors"] += 1
+
+    def request(self, method, url, **kwargs):
+        parts = urlsplit(url)
+        key = f"{method} {parts.netloc}{parts.path}"
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            self._record(key, elapsed, response is not None and response.status_code < 400)
+            instrumentation.record_response(
+                url, elapsed, response,
+                request_body=response.request.body if response is not None else None,
+                stream=kwargs.get("stream", False)
+            )
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """Per-endpoint counters: {"GET host/path": {count, errors, avg_ms, max_ms}}."""
+        with self._stats_lock:
+            return {
+                key: {
+                    "count": s["count"],
+                    "errors": s["errors"],
+                    "avg_ms": round(s["total_ms"] / s["count"], 1) if s["count"] else 0.0,
+                    "max_ms": round(s["max_ms"], 1)
+                }
+                for key, s in self._stats.items()
+            }
+
+    def print_stats(self, top=10):
+        """Print the slowest endpoints by average latency."""
+        rows = sorted(self.stats().items(), key=lambda kv: kv[1]["avg_ms"], reverse=True)[:top]
+        if not rows:
+            return
+        print("📡 HTTP endpoint latency (slowest first):")
+        for key, s in rows:
+            print(f"   {key}: n={s['count']} err={s['errors']} avg={s['avg_ms']}ms max={s['max_ms']}ms")
+
+
+# Shared transport for every OKX caller (OKXDataClient, OKXExecutor)
+okx_transport = HTTPTransport()
+
+# Third-party APIs of the pipeline (Etherscan, DefiLlama, DeepSeek, ...); callers keep their own retry logic
+api_transport = HTTPTransport(retries=0)
@@ -0,0 +1,357 @@
+"""
+Vectorized multi-asset indicator engine.
+Takes a stacked OHLCV array of shape (5, n_symbols, n_bars) and computes every technical
+indicator for all symbols in one pass. This is the single definition used by both the live
+strategy metrics (technical_analysis.add_all_indicators) and the Qlib feature update.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# scipy.signal.lfilter (False if scipy is missing), resolved on first use: scipy.signal takes ~1s to import
+_lfilter = None
+
+
+def _get_lfilter():
+    global _lfilter
+    if _lfilter is None:
+        try:
+            from scipy.signal import lfilter  # Ships with scikit-learn; loop fallback below if missing
+            _lfilter = lfilter
+        except ImportError:
+            _lfilter = False
+    return _lfilter
+
+OHLCV_FIELDS = ("open", "high", "low", "close", "volume")
+
+# Indicator columns written back onto the DataFrame by add_all_indicators (used by get_signal_history)
+FRAME_COLUMNS = (
+    "sma_50", "sma_200", "ema_9", "rsi_14",
+    "macd_line", "signal_line", "macd_hist",
+    "bb_mid", "bb_std", "bb_upper", "bb_lower", "bb_pct_b", "bb_width", "bb_trend",
+    "tr", "atr_14", "natr", "upper_wick_ratio", "lower_wick_ratio",
+    "p_di", "n_di", "adx_14", "price_percentile_20",
+    "vol_ma_20", "vol_std_20", "vol_ratio_20", "vol_zscore_20",
+    "buy_stars", "sell_stars"
+)
+
+# Engine key -> Qlib feature column (multi_coin_features.csv schema)
+QLIB_COLUMN_MAP = {
+    "ret": "ret",
+    "log_return": "log_return",
+    "ma_5": "ma_5",
+    "bb_mid": "ma_20",
+    "ma_60": "ma_60",
+    "ma_cross": "ma_cross",
+    "momentum_12": "momentum_12",
+    "macd_line": "macd",
+    "signal_line": "macd_signal",
+    "macd_hist": "macd_hist",
+    "bb_width": "bb_width_20",
+    "bb_pct_b": "bb_pos_20",
+    "volatility_20": "volatility_20",
+    "rsi_14": "rsi_14",
+    "vol_ma_20": "volume_ma_20",
+    "vol_ratio_20": "rel_volume_20",
+    "price_percentile_20": "price_position_20",
+}
+# The Qlib model was trained with atr_14 as a 14-bar simple mean of True Range (not Wilder's EWM)
+# and with buy_stars / sell_stars always 0. qlib_features keeps those definitions until it is retrained.
+QLIB_ZERO_COLUMNS = ("buy_stars", "sell_stars")
+
+
+# --- Primitives (all operate along axis 1 = time) ---
+
+def _ewm(x, alpha):
+    """Equivalent of pandas .ewm(alpha=alpha, adjust=False).mean() per row, NaN-aware."""
+    valid = ~np.isnan(x)
+    started = np.maximum.accumulate(valid, axis=1)
+
+    # Fast path: only leading NaNs -> linear recursive filter
+    lfilter = _get_lfilter()
+    if lfilter and np.array_equal(valid, started):
+        first = x[np.arange(x.shape[0]), valid.argmax(axis=1)]
+        filled = np.where(started, x, first[:, None])
+        out = lfilter([alpha], [1.0, alpha - 1.0], filled, axis=1, zi=((1 - alpha) * first)[:, None])[0]
+        out[~started] = np.nan
+        return out
+
+    out = np.empty_like(x)
+    prev = np.full(x.shape[0], np.nan)
+    for t in range(x.shape[1]):
+        xt = x[:, t]
+        step = np.where(np.isnan(xt), prev, alpha * xt + (1 - alpha) * prev)
+        prev = np.where(np.isnan(prev), xt, step)
+        out[:, t] = prev
+    return out
+
+
+def _rolling(x, window, fn, **kwargs):
+    """Full-window rolling reduction (pandas rolling(window) with min_periods=window)."""
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] >= window:
+        out[:, window - 1:] = fn(sliding_window_view(x, window, axis=1), axis=-1, **kwargs)
+    return out
+
+
+def _shift(x, n=1):
+    out = np.full(x.shape, np.nan)
+    out[:, n:] = x[:, :-n]
+    return out
+
+
+def _nonzero(x, fill):
+    return np.where(x == 0, fill, x)
+
+
+def stack_ohlcv(frames):
+    """
+    Stack per-symbol OHLCV into one (5, n_symbols, n_bars) float array.
+    frames: list of DataFrames (oldest first) with open/high/low/close/volume columns.
+    Shorter histories are left-padded with NaN so the latest bar is aligned at index -1.
+    """
+    n_bars = max((len(f) for f in frames), default=0)
+    ohlcv = np.full((len(OHLCV_FIELDS), len(frames), n_bars), np.nan)
+    for i, frame in enumerate(frames):
+        if len(frame):
+            for j, field in enumerate(OHLCV_FIELDS):
+                ohlcv[j, i, n_bars - len(frame):] = frame[field].to_numpy(dtype=float)
+    return ohlcv
+
+
+def compute_indicators(ohlcv):
+    """
+    Compute all indicators for every symbol at once.
+    Returns {name: ndarray (n_symbols, n_bars)}.
+    """
+    o, h, l, c, v = (np.asarray(a, dtype=float) for a in ohlcv)
+    ind = {}
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 1. EMAs & SMAs
+        ind["sma_50"] = _rolling(c, 50, np.mean)
+        ind["sma_200"] = _rolling(c, 200, np.mean)
+        ind["ema_9"] = _ewm(c, 2 / 10)
+        ind["ma_5"] = _rolling(c, 5, np.mean)
+        ind["ma_60"] = _rolling(c, 60, np.mean)
+
+        # Returns / Momentum
+        prev_c = _shift(c)
+        ind["ret"] = c / prev_c - 1
+        ind["log_return"] = np.log(c / prev_c)
+        ind["momentum_12"] = c / _shift(c, 12) - 1
+
+        # 2. RSI (14), Wilder's smoothing
+        delta = c - prev_c
+        rol_up = _ewm(np.clip(delta, 0, None), 1 / 14)
+        rol_down = _ewm(-np.clip(delta, None, 0), 1 / 14)
+        ind["rsi_14"] = 100.0 - (100.0 / (1.0 + rol_up / rol_down))
+
+        # 3. MACD (12, 26, 9)
+        ind["macd_line"] = _ewm(c, 2 / 13) - _ewm(c, 2 / 27)
+        ind["signal_line"] = _ewm(ind["macd_line"], 2 / 10)
+        ind["macd_hist"] = ind["macd_line"] - ind["signal_line"]
+
+        # 4. Bollinger Bands (20, 2)
+        mid = _rolling(c, 20, np.mean)
+        std = _rolling(c, 20, np.std, ddof=1)
+        ind["bb_mid"] = mid
+        ind["bb_std"] = std
+        ind["bb_upper"] = mid + std * 2
+        ind["bb_lower"] = mid - std * 2
+        ind["bb_pct_b"] = (c - ind["bb_lower"]) / (ind["bb_upper"] - ind["bb_lower"])
+        ind["bb_width"] = (ind["bb_upper"] - ind["bb_lower"]) / mid
+        ind["bb_trend"] = np.where((mid - _shift(mid, 3)) > 0, 1, -1)
+        ind["volatility_20"] = std / mid
+        ind["ma_cross"] = np.where(ind["ma_5"] > mid, 1, -1)
+
+        # 5. ATR (14), Wilder's smoothing of True Range
+        tr = np.fmax(np.fmax(np.abs(h - l), np.abs(h - prev_c)), np.abs(l - prev_c))
+        ind["tr"] = tr
+        ind["atr_14"] = _ewm(tr, 1 / 14)
+        ind["natr"] = (ind["atr_14"] / c) * 100
+
+        # 5.1 Candle Shape (Wick Ratios)
+        full_range = _nonzero(h - l, 1e-9)
+        ind["upper_wick_ratio"] = (h - np.maximum(o, c)) / full_range
+        ind["lower_wick_ratio"] = (np.minimum(o, c) - l) / full_range
+
+        # 6. ADX (14)
+        up_move = h - _shift(h)
+        down_move = _shift(l) - l
+        pdm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+        ndm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+        tr_ema = _nonzero(ind["atr_14"], 1e-9)
+        ind["p_di"] = 100 * (_ewm(pdm, 1 / 14) / tr_ema)
+        ind["n_di"] = 100 * (_ewm(ndm, 1 / 14) / tr_ema)
+        di_sum = _nonzero(ind["p_di"] + ind["n_di"], 1e-9)
+        ind["adx_14"] = _ewm(100 * np.abs(ind["p_di"] - ind["n_di"]) / di_sum, 1 / 14)
+
+        # 7. Price Percentile (min-max over 20 bars)
+        roll_min = _rolling(l, 20, np.min)
+        roll_max = _rolling(h, 20, np.max)
+        ind["price_percentile_20"] = (c - roll_min) / _nonzero(roll_max - roll_min, 1)
+
+        # 8. Volume Anomalies (20)
+        ind["vol_ma_20"] = _rolling(v, 20, np.mean)
+        ind["vol_std_20"] = _rolling(v, 20, np.std, ddof=1)
+        ind["vol_ratio_20"] = v / ind["vol_ma_20"]
+        ind["vol_zscore_20"] = (v - ind["vol_ma_20"]) / (ind["vol_std_20"] + 1e-9)
+
+    # --- Star Signals ---
+    pct, vol_ratio, rsi, adx = ind["price_percentile_20"], ind["vol_ratio_20"], ind["rsi_14"], ind["adx_14"]
+    low_high_mask = (pct < 0.10) & (vol_ratio > 2.0)
+    high_high_mask = (pct > 0.90) & (vol_ratio > 2.0)
+    adx_up_trend = (ind["p_di"] > ind["n_di"]) & (adx > 40)
+    adx_down_trend = (ind["n_di"] > ind["p_di"]) & (adx > 40)
+    ind["buy_stars"] = (rsi < 30).astype(int) + low_high_mask.astype(int) + adx_down_trend.astype(int)
+    ind["sell_stars"] = (rsi > 70).astype(int) + high_high_mask.astype(int) + adx_up_trend.astype(int)
+
+    return ind
+
+
+# Indicators whose latest value feeds the summary dict
+LATEST_KEYS = (
+    "sma_50", "sma_200", "macd_line", "signal_line", "macd_hist", "adx_14", "p_di", "n_di",
+    "rsi_14", "bb_pct_b", "bb_width", "bb_trend", "atr_14", "natr",
+    "price_percentile_20", "vol_ratio_20", "vol_zscore_20", "upper_wick_ratio", "lower_wick_ratio",
+    "buy_stars", "sell_stars"
+)
+
+
+def summarize(last, h, l, c, n, natr_avg_30d):
+    """
+    Build the add_all_indicators result dict.
+    last: {key: latest value} for LATEST_KEYS. h/l/c: recent bars (oldest first, at least the last 7).
+    n: number of bars seen. Raises ValueError if a critical indicator is NaN on the latest candle.
+    """
+    if n == 0:
+        raise ValueError("Cannot extract technicals: DataFrame is empty.")
+
+    def get_strict(key):
+        val = last[key]
+        if np.isnan(val):
+            raise ValueError(f"Indicator '{key}' is NaN in the latest candle. Calculation incomplete.")
+        return float(val)
+
+    close = float(c[-1])
+    pct, vol_ratio = last["price_percentile_20"], last["vol_ratio_20"]
+
+    return {
+        # Trend
+        "price_close": close,
+        "sma_50": get_strict("sma_50"),
+        "sma_200": get_strict("sma_200"),
+        "macd_line": get_strict("macd_line"),
+        "signal_line": get_strict("signal_line"),
+        "macd_hist": get_strict("macd_hist"),
+        "adx_14": get_strict("adx_14"),
+        "p_di": get_strict("p_di"),
+        "n_di": get_strict("n_di"),
+
+        # Momentum / Osc
+        "rsi_14": get_strict("rsi_14"),
+
+        # Volatility / Bands
+        "bb_pct_b": get_strict("bb_pct_b"),
+        "bb_width": get_strict("bb_width"),
+        "bb_trend": "UP" if last["bb_trend"] > 0 else "DOWN",
+        "atr_14": get_strict("atr_14"),
+        "natr_percent": get_strict("natr"),
+        "natr_avg_30d": float(natr_avg_30d),
+
+        # Context / Rank / Signals
+        "price_rank_20": get_strict("price_percentile_20") * 100,
+        "vol_ratio_20": get_strict("vol_ratio_20"),
+        "vol_zscore_20": get_strict("vol_zscore_20"),
+
+        # Candle Shape
+        "upper_wick_ratio": get_strict("upper_wick_ratio"),
+        "lower_wick_ratio": get_strict("lower_wick_ratio"),
+
+        # Recent Closed History
+        "last_closed_close": float(c[-2]) if n >= 2 else close,
+        "last_closed_high": float(h[-2]) if n >= 2 else float(h[-1]),
+        "last_closed_low": float(l[-2]) if n >= 2 else float(l[-1]),
+        "prev_5_high": float(np.nanmax(h[-7:-2])) if n >= 7 else float(h[-1]),
+        "prev_5_low": float(np.nanmin(l[-7:-2])) if n >= 7 else float(l[-1]),
+        "prev_5_closes": [float(x) for x in c[-7:-2]] if n >= 7 else [],
+
+        # Star Signals
+        "signal_low_high_vol": bool(pct < 0.10 and vol_ratio > 2.0),
+        "signal_high_high_vol": bool(pct > 0.90 and vol_ratio > 2.0),
+        "buy_stars": int(last["buy_stars"]),
+        "sell_stars": int(last["sell_stars"])
+    }
+
+
+def latest_values(ind, ohlcv, i):
+    """Latest-bar summary for symbol row `i` (the dict returned by add_all_indicators)."""
+    h, l, c = (np.asarray(ohlcv[j][i], dtype=float) for j in (1, 2, 3))
+    n = int((~np.isnan(c)).sum())
+    natr = ind["natr"][i]
+    natr_avg_30d = np.nanmean(natr[-180:] if n >= 180 else natr) if n else np.nan
+    last = {key: ind[key][i, -1] for key in LATEST_KEYS}
+    return summarize(last, h[-7:], l[-7:], c[-7:], n, natr_avg_30d)
+
+
+def qlib_features(ind, ohlcv, i):
+    """Qlib feature columns for symbol row `i`: {qlib_column: 1-D array over bars}."""
+    features = {col: ind[key][i] for key, col in QLIB_COLUMN_MAP.items()}
+    atr = _rolling(ind["tr"][i:i + 1], 14, np.mean)[0]
+    features["atr_14"] = atr
+    features["natr_14"] = (atr / np.asarray(ohlcv[3][i], dtype=float)) * 100
+    for col in QLIB_ZERO_COLUMNS:
+        features[col] = np.zeros(len(atr), dtype=int)
+    return features
+
+
+def seeded_rsi(closes, period=14):
+    """
+    Latest Wilder RSI seeded with the average of the first deltas (the 1D regime RSI definition).
+    closes: 1-D array, oldest first. Returns 50.0 on short history and 100.0 if the seed window has no losses.
+    """
+    closes = np.asarray(closes, dtype=float)
+    if len(closes) < period + 1:
+        return 50.0
+
+    deltas = np.diff(closes)
+    seed = deltas[:period + 1]
+    up0 = seed[seed >= 0].sum() / period
+    down0 = -seed[seed < 0].sum() / period
+    if down0 == 0:
+        return 100.0
+
+    # Wilder smoothing is an EWM with alpha = 1/period started from the seed averages
+    tail = deltas[period - 1:]
+    gains = np.concatenate([[up0], np.maximum(tail, 0.0)])
+    losses = np.concatenate([[down0], np.maximum(-tail, 0.0)])
+    up, down = _ewm(np.vstack([gains, losses]), 1.0 / period)[:, -1]
+
+    rs = 100.0 if down == 0 else up / down
+    return float(100.0 - 100.0 / (1.0 + rs))
+
+
+def _seeded_rsi_loop(closes, period=14):
+    """Previous per-bar loop of seeded_rsi, kept as the reference for the parity check in indicator_state."""
+    prices = np.asarray(closes, dtype=float)
+    if len(prices) < period + 1:
+        return 50.0
+
+    deltas = np.diff(prices)
+    seed = deltas[:period + 1]
+    up = seed[seed >= 0].sum() / period
+    down = -seed[seed < 0].sum() / period
+    if down == 0:
+        return 100.0
+    rs = up / down
+    rsi = np.zeros_like(prices)
+    rsi[:period] = 100. - 100. / (1. + rs)
+
+    for i in range(period, len(prices)):
+        delta = deltas[i - 1]
+        upval, downval = (delta, 0.) if delta > 0 else (0., -delta)
+        up = (up * (period - 1) + upval) / period
+        down = (down * (period - 1) + downval) / period
+        rs = 100.0 if down == 0 else up / down
+        rsi[i] = 100. - 100. / (1. + rs)
+    return float(rsi[-1])
@@ -0,0 +1,373 @@
+"""
+Streaming (incremental) counterpart of indicator_engine for a single instrument.
+Keeps EMA accumulators, ring buffers for the rolling windows and the previous candle, so a new
+candle costs O(1) instead of recomputing 500 bars. Output matches indicator_engine.latest_values;
+the last HISTORY_WINDOW bars are kept for technical_analysis.get_signal_history.
+"""
+import copy
+import json
+import os
+from collections import deque
+import numpy as np
+import pandas as pd
+import json_store
+from indicator_engine import summarize
+from technical_analysis import get_signal_history
+
+NAN = float("nan")
+
+# Ring buffer sizes
+CLOSE_WINDOW = 200   # sma_200 (also covers sma_50 / bb 20)
+RANGE_WINDOW = 20    # price percentile, volume stats
+NATR_WINDOW = 180    # natr_avg_30d
+RECENT_WINDOW = 7    # last_closed_* / prev_5_*
+MID_WINDOW = 4       # bb_trend compares bb_mid with 3 bars ago
+HISTORY_WINDOW = 60  # history_60d
+
+# Per-bar values kept for get_signal_history (same column names as the add_all_indicators frame)
+HISTORY_COLUMNS = ("ts", "close", "volume", "rsi_14", "adx_14", "natr", "atr_14",
+                   "vol_ratio_20", "price_percentile_20", "buy_stars", "sell_stars")
+
+EMA_KEYS = ("ema_9", "ema_12", "ema_26", "macd_signal", "rsi_up", "rsi_down", "atr", "pdm", "ndm", "adx")
+BUFFERS = {
+    "close": CLOSE_WINDOW, "high": RANGE_WINDOW, "low": RANGE_WINDOW, "volume": RANGE_WINDOW,
+    "natr": NATR_WINDOW, "bb_mid": MID_WINDOW,
+    "recent_high": RECENT_WINDOW, "recent_low": RECENT_WINDOW, "recent_close": RECENT_WINDOW
+}
+
+
+def _ema(prev, x, alpha):
+    if np.isnan(x):
+        return prev
+    return x if prev is None else alpha * x + (1 - alpha) * prev
+
+
+def _window(buf, size, fn, **kwargs):
+    if len(buf) < size:
+        return NAN
+    return float(fn(np.fromiter(buf, float, len(buf))[-size:], **kwargs))
+
+
+class IndicatorState:
+    """
+    Incremental indicator state for one instrument.
+    Feed confirmed candles oldest-first with update(); use preview() for the live (unconfirmed)
+    candle so it can be refreshed every minute without being committed into the state.
+    """
+    def __init__(self):
+        self.n = 0
+        self.last_ts = None
+        self.prev = None  # previous candle: {"high", "low", "close"}
+        self.ema = {key: None for key in EMA_KEYS}
+        self.buf = {key: deque(maxlen=size) for key, size in BUFFERS.items()}
+        self.history = deque(maxlen=HISTORY_WINDOW)  # rows of HISTORY_COLUMNS, oldest first
+        self.last = None  # raw indicator values of the last committed candle
+
+    @classmethod
+    def from_candles(cls, rows):
+        """Warm up from OKX candle rows (newest first, as returned by /market/candles). Confirmed rows only."""
+        state = cls()
+        state.catch_up(rows)
+        return state
+
+    def catch_up(self, rows):
+        """
+        Fold in confirmed OKX rows (newest first) that closed after last_ts.
+        Returns the number of candles committed.
+        """
+        added = 0
+        for row in reversed(rows):
+            if str(row[8]) == "1" and (self.last_ts is None or int(row[0]) > self.last_ts):
+                self.last = self._advance(row)
+                added += 1
+        return added
+
+    def update(self, candle):
+        """
+        Commit one closed candle and return the latest-values dict.
+        candle: OKX row [ts, o, h, l, c, vol, volCcy, volCcyQuote, ...] (volume = volCcyQuote)
+        or a dict with ts/open/high/low/close/volume.
+        Raises ValueError while indicators are still warming up (same as the batch path);
+        the candle is committed either way.
+        """
+        self.last = self._advance(candle)
+        return self._summary(self.last)
+
+    def _advance(self, candle):
+        """Fold one candle into the accumulators and return the raw latest indicator values."""
+        if isinstance(candle, dict):
+            ts, o, h, l, c, v = (candle.get("ts"), *(float(candle[k]) for k in ("open", "high", "low", "close", "volume")))
+        else:
+            ts, o, h, l, c, v = candle[0], float(candle[1]), float(candle[2]), float(candle[3]), float(candle[4]), float(candle[7])
+
+        self.n += 1
+        self.last_ts = int(ts) if ts is not None else self.last_ts
+        ema, buf = self.ema, self.buf
+        prev_c = self.prev["close"] if self.prev else NAN
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            buf["close"].append(c)
+            buf["high"].append(h)
+            buf["low"].append(l)
+            buf["volume"].append(v)
+            buf["recent_high"].append(h)
+            buf["recent_low"].append(l)
+            buf["recent_close"].append(c)
+
+            # EMAs / MACD
+            ema["ema_9"] = _ema(ema["ema_9"], c, 2 / 10)
+            ema["ema_12"] = _ema(ema["ema_12"], c, 2 / 13)
+            ema["ema_26"] = _ema(ema["ema_26"], c, 2 / 27)
+            macd_line = ema["ema_12"] - ema["ema_26"]
+            ema["macd_signal"] = _ema(ema["macd_signal"], macd_line, 2 / 10)
+
+            # RSI (Wilder)
+            delta = c - prev_c
+            ema["rsi_up"] = _ema(ema["rsi_up"], max(delta, 0.0) if not np.isnan(delta) else NAN, 1 / 14)
+            ema["rsi_down"] = _ema(ema["rsi_down"], -min(delta, 0.0) if not np.isnan(delta) else NAN, 1 / 14)
+            rsi = NAN
+            if ema["rsi_up"] is not None and ema["rsi_down"] is not None:
+                rsi = float(100.0 - 100.0 / (1.0 + np.float64(ema["rsi_up"]) / ema["rsi_down"]))
+
+            # ATR / ADX
+            tr = float(np.fmax(np.fmax(abs(h - l), abs(h - prev_c)), abs(l - prev_c)))
+            ema["atr"] = _ema(ema["atr"], tr, 1 / 14)
+            up_move = h - self.prev["high"] if self.prev else NAN
+            down_move = self.prev["low"] - l if self.prev else NAN
+            pdm = up_move if (up_move > down_move and up_move > 0) else 0.0
+            ndm = down_move if (down_move > up_move and down_move > 0) else 0.0
+            ema["pdm"] = _ema(ema["pdm"], pdm, 1 / 14)
+            ema["ndm"] = _ema(ema["ndm"], ndm, 1 / 14)
+            tr_ema = ema["atr"] if ema["atr"] != 0 else 1e-9
+            p_di = 100 * (ema["pdm"] / tr_ema)
+            n_di = 100 * (ema["ndm"] / tr_ema)
+            di_sum = (p_di + n_di) if (p_di + n_di) != 0 else 1e-9
+            ema["adx"] = _ema(ema["adx"], 100 * abs(p_di - n_di) / di_sum, 1 / 14)
+            natr = float(np.float64(ema["atr"]) / c * 100)
+            buf["natr"].append(natr)
+
+            # Bollinger (20, 2)
+            mid = _window(buf["close"], 20, np.mean)
+            std = _window(buf["close"], 20, np.std, ddof=1)
+            buf["bb_mid"].append(mid)
+            mid_3_ago = buf["bb_mid"][0] if len(buf["bb_mid"]) == MID_WINDOW else NAN
+            upper, lower = mid + std * 2, mid - std * 2
+
+            # Price percentile / Volume (20)
+            roll_min = _window(buf["low"], 20, np.min)
+            roll_max = _window(buf["high"], 20, np.max)
+            rng = roll_max - roll_min
+            pct = (c - roll_min) / (rng if rng != 0 else 1)
+            vol_ma = _window(buf["volume"], 20, np.mean)
+            vol_std = _window(buf["volume"], 20, np.std, ddof=1)
+            vol_ratio = np.float64(v) / vol_ma
+            full_range = (h - l) if (h - l) != 0 else 1e-9
+
+            last = {
+                "sma_50": _window(buf["close"], 50, np.mean),
+                "sma_200": _window(buf["close"], 200, np.mean),
+                "macd_line": macd_line,
+                "signal_line": ema["macd_signal"],
+                "macd_hist": macd_line - ema["macd_signal"],
+                "adx_14": ema["adx"],
+                "p_di": p_di,
+                "n_di": n_di,
+                "rsi_14": rsi,
+                "bb_pct_b": (c - lower) / np.float64(upper - lower),
+                "bb_width": (upper - lower) / np.float64(mid),
+                "bb_trend": 1 if (mid - mid_3_ago) > 0 else -1,
+                "atr_14": ema["atr"],
+                "natr": natr,
+                "price_percentile_20": pct,
+                "vol_ratio_20": float(vol_ratio),
+                "vol_zscore_20": (v - vol_ma) / (vol_std + 1e-9),
+                "upper_wick_ratio": (h - max(o, c)) / full_range,
+                "lower_wick_ratio": (min(o, c) - l) / full_range
+            }
+
+        adx_up_trend = p_di > n_di and ema["adx"] > 40
+        adx_down_trend = n_di > p_di and ema["adx"] > 40
+        last["buy_stars"] = int(rsi < 30) + int(pct < 0.10 and vol_ratio > 2.0) + int(adx_down_trend)
+        last["sell_stars"] = int(rsi > 70) + int(pct > 0.90 and vol_ratio > 2.0) + int(adx_up_trend)
+
+        self.prev = {"high": h, "low": l, "close": c}
+        self.history.append([str(self.last_ts), c, v] + [float(last[k]) for k in HISTORY_COLUMNS[3:]])
+        return last
+
+    def _summary(self, last):
+        buf = self.buf
+        natr_hist = np.fromiter(buf["natr"], float, len(buf["natr"]))
+        return summarize(
+            last,
+            list(buf["recent_high"]), list(buf["recent_low"]), list(buf["recent_close"]),
+            self.n, np.nanmean(natr_hist)
+        )
+
+    def latest(self):
+        """Latest values as of the last committed candle."""
+        if self.last is None:
+            raise ValueError("Cannot extract technicals: DataFrame is empty.")
+        return self._summary(self.last)
+
+    def with_live(self, candle):
+        """Copy of this state with an unconfirmed candle folded in (this state is left untouched)."""
+        state = copy.deepcopy(self)
+        state.last = state._advance(candle)
+        return state
+
+    def preview(self, candle):
+        """Latest values including an unconfirmed candle, without mutating this state."""
+        return self.with_live(candle).latest()
+
+    def signal_history(self, limit=HISTORY_WINDOW):
+        """get_signal_history over the last `limit` bars (limit <= HISTORY_WINDOW)."""
+        return get_signal_history(pd.DataFrame(list(self.history), columns=HISTORY_COLUMNS), limit=limit)
+
+    # --- Persistence ---
+    def to_dict(self):
+        return {
+            "n": self.n,
+            "last_ts": self.last_ts,
+            "prev": self.prev,
+            "ema": self.ema,
+            "last": self.last,
+            "buf": {key: list(values) for key, values in self.buf.items()},
+            "history": list(self.history)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if "history" not in data:
+            raise ValueError("checkpoint has no signal history (older format)")
+        state = cls()
+        state.n = data["n"]
+        state.last_ts = data["last_ts"]
+        state.prev = data["prev"]
+        state.ema.update(data["ema"])
+        if data.get("last") is not None:
+            state.last = {key: NAN if x is None else x for key, x in data["last"].items()}
+        for key, values in data["buf"].items():
+            if key in state.buf:
+                state.buf[key].extend(NAN if x is None else x for x in values)
+        for row in data["history"]:
+            state.history.append([row[0]] + [NAN if x is None else x for x in row[1:]])
+        return state
+
+    def save(self, path):
+        # NaN may be stored as null (orjson); from_dict restores it
+        json_store.write_json(path, self.to_dict())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+
+if __name__ == "__main__":
+    # Parity check against the full recompute (add_all_indicators + get_signal_history) on recorded
+    # candles, and seeded_rsi against its reference loop. Two replays per series:
+    #   from bar 0:  one state fed every candle, compared with a recompute over all bars so far
+    #   production:  state warmed from a stored window (from_candles) and then updated candle by candle,
+    #                compared with a recompute over the trailing window, like get_market_metrics used to
+    # Both compare the committed candle and the live preview (with_live) at each checkpoint.
+    # python indicator_state.py [candles.npy ...]  (default: every file in the candle store)
+    import glob
+    import sys
+    import time
+    from candle_store import STORE_DIR, CONFIRM, CandleStore
+    from indicator_engine import seeded_rsi, _seeded_rsi_loop
+    from technical_analysis import add_all_indicators
+
+    TOL = 1e-6  # relative
+    CHECKPOINTS = 25
+    WINDOW = 500  # candles fetched per cycle
+
+    series = {}
+    for path in sys.argv[1:] or sorted(glob.glob(str(STORE_DIR / "*.npy"))):
+        arr = np.load(path)
+        series[os.path.basename(path)] = arr[arr[:, CONFIRM] == 1]
+    if not series:
+        print(f"No recorded candles in {STORE_DIR}; using a synthetic series.")
+        rng = np.random.default_rng(0)
+        n = 1500
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+        open_ = close * (1 + rng.normal(0, 0.005, n))
+        high = np.maximum.reduce([open_, close, close * (1 + abs(rng.normal(0, 0.01, n)))])
+        low = np.minimum.reduce([open_, close, close * (1 - abs(rng.normal(0, 0.01, n)))])
+        volume = rng.lognormal(10, 1, n)
+        ts = 1700000000000 + np.arange(n) * 4 * 3600 * 1000
+        series["synthetic"] = np.column_stack([ts, open_, high, low, close, volume, volume, volume, np.ones(n)])
+
+    def full_recompute(rows):
+        """(latest values, history_60d) from OKX rows, oldest first."""
+        df = pd.DataFrame({"ts": [r[0] for r in rows], **{
+            name: [float(r[j]) for r in rows] for name, j in (("open", 1), ("high", 2), ("low", 3), ("close", 4), ("volume", 7))
+        }})
+        latest = add_all_indicators(df)
+        return latest, get_signal_history(df, limit=HISTORY_WINDOW)
+
+    def incremental(state):
+        return state.latest(), state.signal_history()
+
+    def diff(a, b):
+        """Largest relative difference between two results (inf on a structural / non-numeric mismatch)."""
+        if isinstance(b, dict):
+            if not isinstance(a, dict) or a.keys() != b.keys():
+                return float("inf")
+            return max((diff(a[k], b[k]) for k in b), default=0.0)
+        if isinstance(b, (list, tuple)):
+            if not isinstance(a, (list, tuple)) or len(a) != len(b):
+                return float("inf")
+            return max((diff(u, v) for u, v in zip(a, b)), default=0.0)
+        if isinstance(b, float) and isinstance(a, (int, float)) and not isinstance(a, bool):
+            return abs(a - b) / max(1.0, abs(b))
+        return 0.0 if a == b else float("inf")
+
+    def replay(rows, start, window):
+        """Feed rows[start:] into a state warmed on rows[:start]; compare at checkpoints. (worst, checks, s/bar, s/recompute)"""
+        n = len(rows)
+        state = IndicatorState.from_candles(rows[:start][::-1])
+        checkpoints = set(np.linspace(max(start, 250), n - 1, CHECKPOINTS).astype(int).tolist()) if n > start else set()
+        worst, checked, t_inc, t_full = 0.0, 0, 0.0, 0.0
+        for i in range(start, n):
+            expected = None
+            if i in checkpoints:
+                t0 = time.perf_counter()
+                try:
+                    expected = full_recompute(rows[max(0, i + 1 - window) if window else 0:i + 1])
+                except ValueError:  # still warming up
+                    pass
+                t_full += time.perf_counter() - t0
+                if expected is not None:
+                    worst = max(worst, diff(incremental(state.with_live(rows[i])), expected))
+            t0 = time.perf_counter()
+            try:
+                state.update(rows[i])
+            except ValueError:
+                pass
+            t_inc += time.perf_counter() - t0
+            if expected is not None:
+                worst = max(worst, diff(incremental(state), expected))
+                checked += 1
+        return worst, checked, t_inc / max(1, n - start), t_full / max(1, len(checkpoints))
+
+    failed = False
+    for name, arr in series.items():
+        rows = CandleStore._to_rows(arr)[::-1]  # OKX string rows, oldest first
+        n = len(rows)
+        closes = arr[:, 4]
+        rsi_worst = max((abs(seeded_rsi(closes[:k]) - _seeded_rsi_loop(closes[:k]))
+                         for k in range(15, n + 1, max(1, n // 50))), default=0.0)
+        replays = [("from bar 0", replay(rows, 0, None))]
+        # Needs the production window: over a shorter one the recompute's own warm-up (EMAs seeded at
+        # the window start, natr_avg_30d reaching 180 bars back) differs by more than TOL
+        if n > WINDOW + CHECKPOINTS:
+            replays.append((f"production (warm {WINDOW})", replay(rows, WINDOW, WINDOW)))
+        else:
+            print(f"   {name}: {n} bars, production replay needs more than {WINDOW + CHECKPOINTS}")
+        for mode, (worst, checked, per_bar, per_full) in replays:
+            ok = checked > 0 and worst <= TOL and rsi_worst <= TOL
+            failed = failed or not ok
+            print(f"{'✅' if ok else '❌'} {name} [{mode}]: bars={n} checkpoints={checked} max_rel_diff={worst:.2e} "
+                  f"rsi_max_diff={rsi_worst:.2e}  incremental={per_bar * 1e6:.0f}us/bar full={per_full * 1000:.1f}ms/recompute")
+    sys.exit(1 if failed else 0)
@@ -346,6 +346,7 @@ def predict_and_export():
     print(f"\n✅ Payload exported to: {out_path}")
     # Print preview
     print(json.dumps(payload, indent=2)) # Print full payload to show new sections
+    return payload
 
 from market_data import get_strategy_metrics
 
@@ -488,23 +489,33 @@ def fetch_live_context_and_predict():
     print(f"✅ Live Qlib Payload Exported: {current_time}")
     return payload
 
-if __name__ == "__main__":
+def main():
+    """Run inference and return the exported payload (None if nothing was exported)."""
     # If Qlib is not available, go straight to Live Bridge
     if not HAS_QLIB:
         print("⚠️ Qlib not installed on this machine. Running Live Bridge directly...")
-        fetch_live_context_and_predict()
-    else:
-        # Qlib is available — check if the calendar is fresh enough
-        try:
-            cal = D.calendar(start_time="2025-01-01")
-            latest_qlib = cal[-1]
-            
-            # If Qlib is more than 3 days old, force live fetch
-            if (datetime.now() - pd.to_datetime(latest_qlib)).days > 3:
-                print(f"⚠️ Qlib Data is too old ({latest_qlib}). Switching to Live Bridge...")
-                fetch_live_context_and_predict()
-            else:
-                predict_and_export()
-        except Exception as e:
-            print(f"⚠️ Qlib Calendar Check Error: {e}. Falling back to Live Bridge...")
-            fetch_live_context_and_predict()
+        return fetch_live_context_and_predict()
+
+    # Long-lived (in-process) runs: drop Qlib's memory cache so bins dumped by update_qlib_data are seen
+    try:
+        from qlib.data.cache import H
+        H.clear()
+    except Exception as e:
+        print(f"⚠️ Could not reset Qlib cache: {e}")
+
+    # Qlib is available — check if the calendar is fresh enough
+    try:
+        cal = D.calendar(start_time="2025-01-01")
+        latest_qlib = cal[-1]
+
+        # If Qlib is more than 3 days old, force live fetch
+        if (datetime.now() - pd.to_datetime(latest_qlib)).days > 3:
+            print(f"⚠️ Qlib Data is too old ({latest_qlib}). Switching to Live Bridge...")
+            return fetch_live_context_and_predict()
+        return predict_and_export()
+    except Exception as e:
+        print(f"⚠️ Qlib Calendar Check Error: {e}. Falling back to Live Bridge...")
+        return fetch_live_context_and_predict()
+
+if __name__ == "__main__":
+    main()
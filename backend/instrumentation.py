@@ -0,0 +1,232 @@
+"""
+Per-stage instrumentation for the 4H cycle.
+measure(name) wraps a stage and records wall time, CPU time, process RSS, HTTP calls per host
+(count / errors / bytes / latency), LLM token usage and named counters (cache hits etc.).
+The active stage lives in a context variable. Stage DAG threads and tasks started with submit(pool, ...)
+inherit it, so work fanned out by a stage is billed to that stage. Nested stages also add to their
+parents. One compact JSON line per stage is appended to METRICS_FILE.
+
+Nothing is patched: HTTP is recorded by http_transport.HTTPTransport (OKX, Etherscan, DeepSeek, ...).
+Plain requests calls and SDKs with their own HTTP stack (OpenAI SDK, Gemini SDK) only report their
+LLM token usage. RSS is process-wide: stages running concurrently share the same numbers.
+"""
+import contextvars
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+METRICS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline_metrics.jsonl")
+MAX_FILE_BYTES = 5 * 1024 * 1024  # older half is dropped beyond this
+
+_current = contextvars.ContextVar("instrumentation_stage", default=None)
+_cycle_id = None
+_write_lock = threading.Lock()
+
+
+class StageMetrics:
+    """Accumulators of one measured stage (thread-safe)."""
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.path = f"{parent.path}/{name}" if parent else name
+        self.thread = threading.get_ident()
+        self.lock = threading.Lock()
+        self.cpu = 0.0
+        self.http = {}      # host -> {count, errors, bytes_in, bytes_out, total_ms, max_ms}
+        self.llm = {}       # provider -> {calls, prompt_tokens, completion_tokens, cache_hit_tokens}
+        self.counters = {}  # name -> count
+
+    def chain(self):
+        m = self
+        while m is not None:
+            yield m
+            m = m.parent
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KB on Linux (bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def _rss_mb():
+    """Current RSS of the process (Linux); None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+def _add_cpu(metrics, seconds):
+    """Bill CPU time spent on this thread to a stage and every ancestor measured on another thread."""
+    me = threading.get_ident()
+    for m in metrics.chain():
+        if m is metrics or m.thread != me:
+            with m.lock:
+                m.cpu += seconds
+
+
+# --- Recording API (no-ops outside a measured stage) ---
+def record_http(host, elapsed, bytes_in=0, bytes_out=0, ok=True):
+    metrics = _current.get()
+    if metrics is None:
+        return
+    for m in metrics.chain():
+        with m.lock:
+            h = m.http.setdefault(host, {"count": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0, "total_ms": 0.0, "max_ms": 0.0})
+            h["count"] += 1
+            h["errors"] += 0 if ok else 1
+            h["bytes_in"] += bytes_in
+            h["bytes_out"] += bytes_out
+            h["total_ms"] += elapsed * 1000
+            h["max_ms"] = max(h["max_ms"], elapsed * 1000)
+
+
+def record_llm(provider, prompt_tokens=0, completion_tokens=0, cache_hit_tokens=0):
+    metrics = _current.get()
+    if metrics is None:
+        return
+    for m in metrics.chain():
+        with m.lock:
+            u = m.llm.setdefault(provider, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cache_hit_tokens": 0})
+            u["calls"] += 1
+            u["prompt_tokens"] += prompt_tokens or 0
+            u["completion_tokens"] += completion_tokens or 0
+            u["cache_hit_tokens"] += cache_hit_tokens or 0
+
+
+def count(name, n=1):
+    """Bump a named counter (e.g. "price_cache.hit") of the current stage."""
+    metrics = _current.get()
+    if metrics is None:
+        return
+    for m in metrics.chain():
+        with m.lock:
+            m.counters[name] = m.counters.get(name, 0) + n
+
+
+# --- Cycles & stages ---
+def start_cycle():
+    """Tag the following records with a new cycle id (inherited by stage subprocesses via the env)."""
+    global _cycle_id
+    _cycle_id = time.strftime("%Y-%m-%dT%H:%M:%S")
+    os.environ["PIPELINE_CYCLE_ID"] = _cycle_id
+    return _cycle_id
+
+
+def current_cycle():
+    return _cycle_id or os.getenv("PIPELINE_CYCLE_ID")
+
+
+@contextmanager
+def measure(name):
+    """Measure the enclosed block as stage `name` (nested under the current stage, if any)."""
+    metrics = StageMetrics(name, _current.get())
+    token = _current.set(metrics)
+    status = "ok"
+    wall0, cpu0, rss0 = time.perf_counter(), time.thread_time(), _rss_mb()
+    try:
+        yield metrics
+    except BaseException:
+        status = "failed"
+        raise
+    finally:
+        _add_cpu(metrics, time.thread_time() - cpu0)
+        _current.reset(token)
+        rss = _rss_mb()
+        _append({
+            "cycle": current_cycle(),
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "stage": metrics.path,
+            "status": status,
+            "wall_s": round(time.perf_counter() - wall0, 3),
+            "cpu_s": round(metrics.cpu, 3),
+            # Process-wide, not per stage: concurrent stages and threads all count
+            "process_rss_peak_mb": _peak_rss_mb(),
+            "process_rss_delta_mb": round(rss - rss0, 1) if rss is not None and rss0 is not None else None,
+            "http": {
+                host: {**h, "total_ms": round(h["total_ms"], 1), "max_ms": round(h["max_ms"], 1)}
+                for host, h in metrics.http.items()
+            },
+            "llm": metrics.llm,
+            "counters": metrics.counters
+        })
+
+
+def _append(record):
+    line = json.dumps(record, separators=(",", ":"))
+    try:
+        with _write_lock:
+            with open(METRICS_FILE, "a") as f:
+                f.write(line + "\n")
+            if os.path.getsize(METRICS_FILE) > MAX_FILE_BYTES:
+                with open(METRICS_FILE, "r") as f:
+                    lines = f.readlines()
+                tmp = f"{METRICS_FILE}.tmp"
+                with open(tmp, "w") as f:
+                    f.writelines(lines[len(lines) // 2:])
+                os.replace(tmp, METRICS_FILE)
+    except Exception as e:
+        print(f"⚠️ Failed to write stage metrics: {e}")
+
+
+def load_cycles(limit=10):
+    """Records of the last `limit` cycles: [{"cycle": id, "stages": [records...]}], newest first."""
+    if not os.path.exists(METRICS_FILE):
+        return []
+    cycles = {}
+    with open(METRICS_FILE, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            cycles.setdefault(record.get("cycle"), []).append(record)
+    return [{"cycle": cycle, "stages": stages} for cycle, stages in list(cycles.items())[-limit:][::-1]]
+
+
+# --- Hooks: called explicitly by http_transport.HTTPTransport and the pipeline's thread pools ---
+def submit(pool, fn, /, *args, **kwargs):
+    """pool.submit(fn, ...) that runs fn under the current stage and bills its CPU time to it."""
+    metrics = _current.get()
+    if metrics is None:
+        return pool.submit(fn, *args, **kwargs)
+    ctx = contextvars.copy_context()
+
+    def task():
+        cpu0 = time.thread_time()
+        try:
+            return ctx.run(fn, *args, **kwargs)
+        finally:
+            _add_cpu(metrics, time.thread_time() - cpu0)
+    return pool.submit(task)
+
+
+def _body_size(body):
+    if isinstance(body, str):
+        return len(body.encode())
+    return len(body) if isinstance(body, bytes) else 0  # streamed/file bodies are not counted
+
+
+def record_response(url, elapsed, response=None, request_body=None, stream=False):
+    """record_http for a requests call. Streamed bodies are never read here (only Content-Length counts)."""
+    if _current.get() is None:
+        return
+    bytes_in = 0
+    if response is not None:
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit():
+            bytes_in = int(length)
+        elif not stream:
+            bytes_in = len(response.content or b"")
+    record_http(
+        urlsplit(url).netloc, elapsed,
+        bytes_in=bytes_in, bytes_out=_body_size(request_body),
+        ok=response is not None and response.status_code < 400
+    )
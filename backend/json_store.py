@@ -0,0 +1,123 @@
+"""
+Local JSON persistence for frontend/data and friends.
+- write_json: compact serialization (orjson when installed) to a temp file in the same directory,
+  then os.replace, so concurrent readers (Flask threads, the Next.js frontend) never see a torn file.
+- write_json_later: the same, debounced. Repeated writes of one path within FLUSH_DELAY seconds
+  (e.g. portfolio_state several times per cycle) hit the disk once, with the last value.
+- read_json: sees pending (not yet flushed) writes of this process, so reads stay consistent.
+Pending writes are flushed by a timer, by flush() (run_loop calls it before the GitHub sync) and at exit.
+- atomic_write: the same temp file + os.replace for binary writers (np.savez etc.).
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FLUSH_DELAY = 1.0  # seconds
+
+_pending = {}  # path -> serialized bytes
+_lock = threading.Lock()
+_write_lock = threading.Lock()  # one writer at a time, so an older value never lands after a newer one
+_timer = None
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes (NaN stays NaN with the stdlib, becomes null with orjson)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:  # e.g. non-str dict keys
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+
+@contextmanager
+def atomic_write(path):
+    """Binary file object on a unique temp file next to path; replaces path when the block succeeds."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _write_bytes(path, data):
+    with atomic_write(path) as f:
+        f.write(data)
+
+
+def write_json(path, obj):
+    """Atomic write now (supersedes a pending write of the same path)."""
+    path = os.path.abspath(path)
+    data = dumps(obj)
+    with _write_lock:
+        with _lock:
+            _pending.pop(path, None)
+        _write_bytes(path, data)
+
+
+def write_json_later(path, obj):
+    """Atomic write within FLUSH_DELAY seconds. obj is serialized now, so the caller may keep mutating it."""
+    global _timer
+    path = os.path.abspath(path)
+    data = dumps(obj)
+    with _lock:
+        _pending[path] = data
+        if _timer is None:
+            _timer = threading.Timer(FLUSH_DELAY, flush)
+            _timer.daemon = True
+            _timer.start()
+
+
+def read_json(path, default=None):
+    """Parsed content of path (including a pending write). default if missing or unreadable."""
+    path = os.path.abspath(path)
+    with _lock:
+        data = _pending.get(path)
+    try:
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        if orjson is not None:
+            try:
+                return orjson.loads(data)
+            except ValueError:  # NaN written by the stdlib encoder
+                pass
+        return json.loads(data)
+    except (OSError, ValueError):
+        return default
+
+
+def flush():
+    """Write every pending file now."""
+    global _timer
+    with _write_lock:
+        with _lock:
+            pending = dict(_pending)
+            if _timer is not None:
+                _timer.cancel()
+                _timer = None
+        for path, data in pending.items():
+            try:
+                _write_bytes(path, data)
+            except Exception as e:
+                print(f"⚠️ Failed to write {path}: {e}")
+            with _lock:
+                # Keep serving it from memory until it is on disk, unless a newer write came in meanwhile
+                if _pending.get(path) is data:
+                    del _pending[path]
+
+
+atexit.register(flush)
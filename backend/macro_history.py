@@ -1,11 +1,20 @@
 import json
 import os
 from datetime import datetime, timedelta
+from timeseries import TimeSeries
+
+MACRO_FIELDS = ("fed", "fed_rate", "japan", "dxy", "vix", "us10y")
+
 
 class MacroHistory:
+    """
+    Macro snapshots in the "macro_series" time series (MongoDB time-series collection + local columns).
+    The whole history is kept; lookups are binary searches, so there is no pruning.
+    """
     def __init__(self, data_dir):
-        self.filepath = os.path.join(data_dir, "macro_history.json")
-        self.history = self._load()
+        self.filepath = os.path.join(data_dir, "macro_history.json")  # legacy JSON, imported once
+        self.series = TimeSeries("macro_series", MACRO_FIELDS, data_dir)
+        self.series.seed(self._load)
 
     def _load(self):
         if os.path.exists(self.filepath):
@@ -21,13 +30,6 @@ class MacroHistory:
                 return []
         return []
 
-    def save(self):
-        try:
-            with open(self.filepath, "w") as f:
-                json.dump(self.history, f, indent=2)
-        except Exception as e:
-            print(f"⚠️ Failed to save macro history: {e}")
-
     def add_snapshot(self, fed_data, japan_data, liquidity_data):
         """
         Record a snapshot of current macro data.
@@ -41,63 +43,26 @@ class MacroHistory:
             "vix": liquidity_data.get("vix", {}).get("price"),
             "us10y": liquidity_data.get("us10y", {}).get("price")
         }
-        self.history.append(snapshot)
-        self._prune()
-        self.save()
-
-    def _prune(self, max_days=60, max_records=500):
-        """
-        Prune history to prevent unlimited growth.
-        Criteria: Keep last 60 days OR max 500 records.
-        """
-        # 1. Length check
-        if len(self.history) > max_records:
-            self.history = self.history[-max_records:]
-        
-        # 2. Time check (optional, but good for cleanup)
         try:
-            cutoff = datetime.utcnow() - timedelta(days=max_days)
-            filtered = []
-            for item in self.history:
-                try:
-                    ts = datetime.fromisoformat(item["timestamp"])
-                    if ts > cutoff:
-                        filtered.append(item)
-                except:
-                    pass 
-            self.history = filtered
+            self.series.append([snapshot])
         except Exception as e:
-            print(f"⚠️ Pruning failed: {e}")
+            print(f"⚠️ Failed to save macro history: {e}")
+
+    def _closest_record(self, days):
+        """Snapshot closest to 'days' ago, if one lies within +/- 2 days (a reasonable comparison window)."""
+        target_time = datetime.utcnow() - timedelta(days=days)
+        return self.series.nearest(target_time.isoformat(), within=timedelta(days=2).total_seconds())
 
     def get_change_percentage(self, key, current_val, days=5):
         """
         Calculate percentage change compared to 'days' ago.
-        key: 'fed', 'japan', 'dxy', 'vix', 'us_10y'
+        key: 'fed', 'japan', 'dxy', 'vix', 'us10y'
         Returns: percentage float or None
         """
-        if not self.history or current_val is None:
+        if current_val is None:
             return None
 
-        # Find target timestamp
-        target_time = datetime.utcnow() - timedelta(days=days)
-        
-        # Find closest record
-        closest_record = None
-        min_diff = timedelta(days=365)
-        
-        for record in self.history:
-            try:
-                ts = datetime.fromisoformat(record["timestamp"])
-                diff = abs(ts - target_time)
-                
-                # Check if it's within reasonable window (e.g. +/- 2 days) to be valid comparison
-                if diff < timedelta(days=2):
-                     if diff < min_diff:
-                         min_diff = diff
-                         closest_record = record
-            except:
-                continue
-
+        closest_record = self._closest_record(days)
         if closest_record and closest_record.get(key) is not None:
             prev_val = float(closest_record[key])
             if prev_val == 0: return 0.0
@@ -109,29 +74,10 @@ class MacroHistory:
         """
         Calculate absolute change (e.g. for basis points or raw price).
         """
-        pct = self.get_change_percentage(key, current_val, days) 
-        # Wait, reuse logic finding record for DRY
-        # But get_change_percentage returns %. Here we want abs diff.
-        
-        # Copied logic for safety logic:
-        if not self.history or current_val is None:
+        if current_val is None:
             return None
-            
-        target_time = datetime.utcnow() - timedelta(days=days)
-        closest_record = None
-        min_diff = timedelta(days=365)
-        
-        for record in self.history:
-            try:
-                ts = datetime.fromisoformat(record["timestamp"])
-                diff = abs(ts - target_time)
-                if diff < timedelta(days=2):
-                     if diff < min_diff:
-                         min_diff = diff
-                         closest_record = record
-            except:
-                continue
-                
+
+        closest_record = self._closest_record(days)
         if closest_record and closest_record.get(key) is not None:
              # Special case for FED RATE (implied_rate)
              if key == "fed_rate":
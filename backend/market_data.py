@@ -1,17 +1,20 @@
 
 import os
-import requests
 import json
-import time
 import base64
 import hmac
 import hashlib
 import datetime
-import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import numpy as np
-import pandas as pd
-from technical_analysis import add_all_indicators, get_signal_history
+from rate_limiter import OKX_RATE_LIMITER
+from candle_store import CandleStore, STORE_DIR
+from indicator_state import IndicatorState
+from indicator_engine import seeded_rsi
+from http_transport import okx_transport
+import instrumentation
 
 # Load env
 env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.env")
@@ -21,6 +24,7 @@ API_KEY = os.getenv("OKX_API_KEY")
 SECRET_KEY = os.getenv("OKX_SECRET_KEY")
 PASSPHRASE = os.getenv("OKX_PASSPHRASE", "")
 BASE_URL = "https://www.okx.com"
+MAX_FETCH_WORKERS = 16 # Thread pool size for get_strategy_metrics_many (pacing is done by OKX_RATE_LIMITER)
 
 class OKXDataClient:
     def __init__(self):
@@ -28,6 +32,9 @@ class OKXDataClient:
         self.secret_key = SECRET_KEY
         self.passphrase = PASSPHRASE
         self.base_url = BASE_URL
+        self.candle_store = CandleStore(self)
+        self.indicator_states = {}  # (instId, bar) -> IndicatorState
+        self._indicator_lock = threading.Lock()  # metrics threads and live polls share the states
         
     def _get_timestamp(self):
         # Format: ISO 8601 with milliseconds, e.g. 2020-12-08T09:08:57.715Z
@@ -62,10 +69,13 @@ class OKXDataClient:
             "Content-Type": "application/json"
         }
         
+        # Global pacing across all threads (OKX limit: 20 req/2s)
+        OKX_RATE_LIMITER.acquire()
+
         try:
             url = self.base_url + request_path
             # print(f"DEBUG: Requesting {url}")
-            r = requests.request(method, url, headers=headers, timeout=(5, 20))
+            r = okx_transport.request(method, url, headers=headers, timeout=(5, 20))
             
             if r.status_code != 200:
                 print(f"Error {r.status_code}: {r.text}")
@@ -83,46 +93,43 @@ class OKXDataClient:
             return None
 
     def calculate_rsi(self, prices, period=14):
-        """Calculate RSI from a list of prices."""
-        prices = np.array(prices)
-        if len(prices) < period + 1:
-            return 50.0
-        
-        deltas = np.diff(prices)
-        seed = deltas[:period+1]
-        up = seed[seed >= 0].sum()/period
-        down = -seed[seed < 0].sum()/period
-        
-        if down == 0: return 100.0
-        rs = up/down
-        rsi = np.zeros_like(prices)
-        rsi[:period] = 100. - 100./(1. + rs)
-
-        for i in range(period, len(prices)):
-            delta = deltas[i-1]
-            if delta > 0:
-                upval = delta
-                downval = 0.
-            else:
-                upval = 0.
-                downval = -delta
+        """Calculate RSI from a list of prices (latest value)."""
+        return seeded_rsi(prices, period)
 
-            up = (up * (period - 1) + upval) / period
-            down = (down * (period - 1) + downval) / period
-            
-            if down == 0: rs = 100.0
-            else: rs = up/down
-            
-            rsi[i] = 100. - 100./(1. + rs)
-            
-        return float(rsi[-1])
+    def _metric_requests(self, symbol):
+        """
+        The independent OKX calls behind get_market_metrics, keyed by name.
+        Values are zero-arg callables so they can be run serially or fanned out on a pool.
+        """
+        inst_id = f"{symbol}-USDT-SWAP"
+
+        def get(endpoint, params):
+            return lambda: self._request("GET", endpoint, params)
+
+        return {
+            "ticker": get("/api/v5/market/ticker", {"instId": inst_id}),
+            # 500 4H candles (approx 83 days) to cover >60 days context + SMA200, served from the local store
+            "candles_4h": lambda: self.candle_store.get_candles(inst_id, "4H", 500),
+            "funding": get("/api/v5/public/funding-rate", {"instId": inst_id}),
+            "funding_history": get("/api/v5/public/funding-rate-history", {"instId": inst_id, "limit": "30"}),
+            "oi_history": get("/api/v5/rubik/stat/contracts/open-interest-history", {"instId": inst_id, "period": "1D", "limit": "30"}),
+            # Whale L/S ratios require instId in SWAP format (e.g. BTC-USDT-SWAP)
+            "whale_ls": get("/api/v5/rubik/stat/contracts/long-short-account-ratio-contract-top-trader", {"instId": inst_id}),
+            "whale_pos": get("/api/v5/rubik/stat/contracts/long-short-position-ratio-contract-top-trader", {"instId": inst_id}),
+            # Top Trader Sentiment requires ccy (base currency only, e.g. BTC)
+            "top_sentiment": get("/api/v5/rubik/stat/contracts/top-trader-sentiment-index", {"ccy": symbol}),
+            "candles_1d": lambda: self.candle_store.get_candles(inst_id, "1D", 300),
+        }
 
-    def get_market_metrics(self, symbol):
+    def get_market_metrics(self, symbol, raw=None):
         """
         Fetches all necessary market metrics for the new strategy.
         Symbol: "ETH" or "SOL"
+        raw: Optional pre-fetched responses keyed like _metric_requests (used by get_strategy_metrics_many).
         """
-        inst_id = f"{symbol}-USDT-SWAP"
+        if raw is None:
+            raw = {name: fetch() for name, fetch in self._metric_requests(symbol).items()}
+
         metrics = {
             "symbol": symbol,
             "price": None,
@@ -148,7 +155,7 @@ class OKXDataClient:
         }
 
         # 1. Ticker (Price & Current Volume)
-        data = self._request("GET", "/api/v5/market/ticker", {"instId": inst_id})
+        data = raw["ticker"]
         if data:
             ticker = data[0]
             metrics["price"] = float(ticker["last"])
@@ -163,55 +170,20 @@ class OKXDataClient:
                 metrics["change_24h"] = 0.0
         
         # 2. Advanced Technicals (4H Candles)
-        # Fetch 500 candles (approx 83 days) to cover >60 days context + SMA200
-        # OKX limits usually 100-300. We fetch twice.
-        limit_per_req = 300
-        all_candles = []
-        
-        # First Batch (Latest)
-        data1 = self._request("GET", "/api/v5/market/candles", {"instId": inst_id, "bar": "4H", "limit": str(limit_per_req)})
-        if data1:
-            all_candles.extend(data1)
-            # Last candle timestamp
-            last_ts = data1[-1][0]
-            
-            # Rate Limit Safety: Sleep briefly strictly to handle OKX limits (20 req/2s)
-            time.sleep(0.1)
-            
-            # Second Batch (Older)
-            data2 = self._request("GET", "/api/v5/market/candles", {"instId": inst_id, "bar": "4H", "after": last_ts, "limit": "200"})
-            if data2:
-                all_candles.extend(data2)
-        else:
-            # If data1 failed, we have nothing.
-            print(f"⚠️ Warning: First batch of candles for {inst_id} was empty/failed.")
-                
-        data = all_candles
+        data = raw["candles_4h"]
+        if not data:
+            print(f"⚠️ Warning: 4H candles for {symbol} were empty/failed.")
         # Ensure we have enough data for technicals (at least 50 for SMA50/EMAs to warmup)
         if data and len(data) > 50:
             try:
-                # OKX returns [ts, o, h, l, c, vol, volCcy, valCcyQuote, confirm]
-                # Convert to DataFrame
-                df = pd.DataFrame(data, columns=['ts', 'open', 'high', 'low', 'close', 'vol', 'volCcy', 'volCcyQuote', 'confirm'])
-                
-                # Sort ascending (oldest first) for calc
-                df = df.iloc[::-1].reset_index(drop=True)
-                
-                # Prepare input DF
-                df_input = pd.DataFrame()
-                df_input['ts'] = df['ts']
-                df_input['open'] = df['open']
-                df_input['high'] = df['high']
-                df_input['low'] = df['low']
-                df_input['close'] = df['close']
-                df_input['volume'] = df['volCcyQuote'] # Volume in USDT (Quote)
-                
-                # Calculate All Indicators (modifies df_input in place)
-                tech_values = add_all_indicators(df_input)
+                # OKX returns [ts, o, h, l, c, vol, volCcy, valCcyQuote, confirm], newest first.
+                # Indicators come from the incremental state: only candles closed since the last
+                # cycle are folded in, the live candle is previewed (same values as add_all_indicators)
+                view = self.live_indicator_state(symbol, "4H", data)
+                tech_values = view.latest()
                 
                 # --- NEW: Wick Analysis (Exhaustion/Absorption) ---
-                latest = df_input.iloc[-1]
-                o, h, l, c = float(latest['open']), float(latest['high']), float(latest['low']), float(latest['close'])
+                o, h, l, c = (float(x) for x in data[0][1:5])
                 full_range = max(h - l, 1e-9)
                 body = abs(c - o)
                 upper_shadow = h - max(o, c)
@@ -234,16 +206,15 @@ class OKXDataClient:
                 metrics["rsi_4h"] = tech_values.get("rsi_14", 50)
                 
                 # GET HISTORY (60 periods)
-                metrics["history_60d"] = get_signal_history(df_input, limit=60)
+                metrics["history_60d"] = view.signal_history(limit=60)
                 
             except Exception as e:
                 import traceback
                 print(f"⚠️ Tech Calc Failed for {symbol}: {e}")
-                print(f"DEBUG: DF Shape: {df_input.shape if 'df_input' in locals() else 'No DF'}")
                 traceback.print_exc()
 
         # 3. Funding Rate (Current + Z-Score from 30-period history)
-        data = self._request("GET", "/api/v5/public/funding-rate", {"instId": inst_id})
+        data = raw["funding"]
         if data:
             val = float(data[0]["fundingRate"])
             metrics["funding_rate"] = val
@@ -254,8 +225,7 @@ class OKXDataClient:
         
         # Funding Rate Z-Score (requires historical rates)
         try:
-            hist_data = self._request("GET", "/api/v5/public/funding-rate-history",
-                                      {"instId": inst_id, "limit": "30"})
+            hist_data = raw["funding_history"]
             if hist_data and len(hist_data) >= 5:
                 hist_rates = [float(x["fundingRate"]) for x in hist_data]
                 mean_fr = np.mean(hist_rates)
@@ -271,7 +241,7 @@ class OKXDataClient:
 
         # 4. Open Interest (Current)
         # 5. Open Interest History (30 Days) -> Calculate Delta & Avg
-        data = self._request("GET", "/api/v5/rubik/stat/contracts/open-interest-history", {"instId": inst_id, "period": "1D", "limit": "30"})
+        data = raw["oi_history"]
         if data:
             # Data is [ts, oi, oiCcy]. Sorted latest first.
             latest = float(data[0][2]) # OI in Currency (e.g. ETH) 
@@ -303,7 +273,9 @@ class OKXDataClient:
                 print(f"Error calcing OI: {e}")
 
         # 6. Volume History (30 Days) -> Calculate Volume Ratio
-        data = self._request("GET", "/api/v5/market/history-candles", {"instId": inst_id, "bar": "1D", "limit": "30"})
+        # Latest 30 closed daily candles, taken from the same 1D store as the macro context below
+        # (the live day is excluded: its partial volume would drag the average down)
+        data = [k for k in (raw["candles_1d"] or []) if str(k[8]) == "1"][:30]
         if data:
             # [ts, o, h, l, c, vol, volCcy, ...]
             # volCcy is index 6. 
@@ -319,41 +291,39 @@ class OKXDataClient:
                     metrics["volume_ratio"] = metrics["volume_24h"] / avg_vol
         
         # 7. Whale Sentiment (Rubik)
-        # Whale L/S Account Ratio - requires instId in SWAP format (e.g. BTC-USDT-SWAP)
-        ls_data = self._request("GET", "/api/v5/rubik/stat/contracts/long-short-account-ratio-contract-top-trader", {"instId": inst_id})
+        # Whale L/S Account Ratio
+        ls_data = raw["whale_ls"]
         if ls_data:
             metrics["whale_ls_ratio"] = float(ls_data[0][1])
             
-        # Whale L/S Position Ratio - requires instId in SWAP format
-        pos_data = self._request("GET", "/api/v5/rubik/stat/contracts/long-short-position-ratio-contract-top-trader", {"instId": inst_id})
+        # Whale L/S Position Ratio
+        pos_data = raw["whale_pos"]
         if pos_data:
             metrics["whale_pos_ratio"] = float(pos_data[0][1])
 
-        # Top Trader Sentiment (General) - Requires ccy (base currency only, e.g. BTC)
-        sentiment_data = self._request("GET", "/api/v5/rubik/stat/contracts/top-trader-sentiment-index", {"ccy": symbol})
+        # Top Trader Sentiment (General)
+        sentiment_data = raw["top_sentiment"]
         if sentiment_data:
             metrics["top_trader_sentiment"] = float(sentiment_data[0][1])
 
         # 7. 1D Macro Context (SMA50, SMA200, Regime)
         try:
-            # Fetch 300 1D candles
-            data_1d = self._request("GET", "/api/v5/market/candles", {"instId": inst_id, "bar": "1D", "limit": "300"})
+            # 300 1D candles
+            data_1d = raw["candles_1d"]
             if data_1d and len(data_1d) >= 200:
                 # [ts, o, h, l, c, vol, volCcy, ...] index 4 is close
-                closes_1d = [float(c[4]) for c in data_1d]
-                closes_1d.reverse() # Oldest -> Newest
+                closes_1d = np.array([c[4] for c in data_1d], dtype=float)[::-1] # Oldest -> Newest
                 
                 curr_p = closes_1d[-1]
-                sma50_1d = sum(closes_1d[-50:]) / 50
-                sma200_1d = sum(closes_1d[-200:]) / 200
+                sma50_1d = float(closes_1d[-50:].mean())
+                sma200_1d = float(closes_1d[-200:].mean())
                 
                 metrics["sma50_1d"] = sma50_1d
                 metrics["sma200_1d"] = sma200_1d
                 metrics["regime_1d"] = "BULL" if curr_p > sma200_1d else "BEAR"
                 
                 # RSI 1D
-                prices_arr = np.array(closes_1d)
-                metrics["rsi_1d"] = self.calculate_rsi(prices_arr, period=14)
+                metrics["rsi_1d"] = seeded_rsi(closes_1d, period=14)
             else:
                 metrics["sma200_1d"] = 0
                 metrics["regime_1d"] = "NEUTRAL"
@@ -364,6 +334,82 @@ class OKXDataClient:
 
         return metrics
 
+    def live_indicator_state(self, symbol, bar="4H", rows=None):
+        """
+        Incremental IndicatorState of symbol/bar, caught up with `rows` (OKX candles, newest first;
+        default: the latest 500 from the candle store). Only candles closed since the last call are
+        folded in (the state is checkpointed next to the candle store). If the newest row is the live
+        candle, a copy with it folded in is returned. None if there are no candles.
+        """
+        inst_id = f"{symbol}-USDT-SWAP"
+        if rows is None:
+            rows = self.candle_store.get_candles(inst_id, bar, 500)
+        if not rows:
+            return None
+
+        key = (inst_id, bar)
+        path = STORE_DIR / f"{inst_id}_{bar}.state.json"
+        with self._indicator_lock:
+            return self._catch_up_state(key, path, rows)
+
+    def _catch_up_state(self, key, path, rows):
+        inst_id, bar = key
+        state = self.indicator_states.get(key)
+        if state is None and path.exists():
+            try:
+                state = IndicatorState.load(path)
+            except Exception as e:
+                print(f"⚠️ Indicator state unreadable for {inst_id} {bar}: {e}. Rebuilding.")
+
+        # Rebuild if the checkpoint is older than the window we just received (gap in history)
+        oldest_ts = int(rows[-1][0])
+        if state is None or state.last_ts is None or state.last_ts < oldest_ts:
+            state = IndicatorState.from_candles(rows)
+            added = state.n
+        else:
+            added = state.catch_up(rows)
+        self.indicator_states[key] = state
+
+        if added:
+            try:
+                state.save(path)
+            except Exception as e:
+                print(f"⚠️ Failed to persist indicator state for {inst_id} {bar}: {e}")
+
+        if str(rows[0][8]) != "1":
+            return state.with_live(rows[0])
+        return state
+
+    def get_live_indicators(self, symbol, bar="4H"):
+        """
+        Latest technicals from the incremental IndicatorState (see live_indicator_state), cheap
+        enough to poll every minute. Same keys as add_all_indicators; None if there are no candles.
+        """
+        state = self.live_indicator_state(symbol, bar)
+        return state.latest() if state is not None else None
+
+    def get_strategy_metrics_many(self, symbols, max_workers=MAX_FETCH_WORKERS):
+        """
+        Batched get_market_metrics for several symbols.
+        Every endpoint of every symbol is submitted to one bounded thread pool (paced globally by
+        OKX_RATE_LIMITER), so an extra coin costs roughly one more round trip instead of a full
+        serial pass. Returns {symbol: metrics dict, or None on failure}.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = {
+                symbol: {name: instrumentation.submit(pool, fetch) for name, fetch in self._metric_requests(symbol).items()}
+                for symbol in symbols
+            }
+            for symbol, futures in pending.items():
+                try:
+                    raw = {name: future.result() for name, future in futures.items()}
+                    results[symbol] = self.get_market_metrics(symbol, raw=raw)
+                except Exception as e:
+                    print(f"Failed to get market metrics for {symbol}: {e}")
+                    results[symbol] = None
+        return results
+
     def fetch_liquidation_data(self, uly="ETH-USDT", inst_type="SWAP"):
         """
         Fetch recent liquidation orders to gauge market pain.
@@ -440,6 +486,13 @@ def get_strategy_metrics(symbol):
         print(f"Failed to get market metrics for {symbol}: {e}")
         return None
 
+def get_strategy_metrics_many(symbols):
+    """
+    Public wrapper to get metrics for several symbols concurrently.
+    Returns {symbol: metrics dict or None}.
+    """
+    return client.get_strategy_metrics_many(symbols)
+
 if __name__ == "__main__":
     # Self Test
     print("Testing Market Data Module...")
@@ -4,11 +4,11 @@ import time
 import hmac
 import base64
 import hashlib
-import requests
 import datetime
 import math
 from decimal import Decimal, ROUND_HALF_UP
 from dotenv import load_dotenv
+from http_transport import okx_transport
 
 # Load Environment Variables
 load_dotenv()
@@ -90,9 +90,9 @@ class OKXExecutor:
         
         try:
             if method == "GET":
-                response = requests.get(url, headers=headers, timeout=HTTP_TIMEOUT)
+                response = okx_transport.get(url, headers=headers, timeout=HTTP_TIMEOUT)
             else:
-                response = requests.post(url, headers=headers, data=body, timeout=HTTP_TIMEOUT)
+                response = okx_transport.post(url, headers=headers, data=body, timeout=HTTP_TIMEOUT)
                 
             return response.json()
         except Exception as e:
@@ -117,7 +117,7 @@ class OKXExecutor:
 
     def get_market_ticker(self, instId):
         """Get full ticker data (Ask/Bid/Last)"""
-        res = requests.get(f"{self.base_url}/api/v5/market/ticker?instId={instId}", timeout=(5, 10))
+        res = okx_transport.get(f"{self.base_url}/api/v5/market/ticker?instId={instId}", timeout=(5, 10))
         data = res.json()
         if data["code"] == "0":
             return data["data"][0]
@@ -130,7 +130,7 @@ class OKXExecutor:
         if instId in self.instrument_cache:
             return self.instrument_cache[instId]
 
-        res = requests.get(f"{self.base_url}/api/v5/public/instruments?instType=SWAP&instId={instId}", timeout=(5, 10))
+        res = okx_transport.get(f"{self.base_url}/api/v5/public/instruments?instType=SWAP&instId={instId}", timeout=(5, 10))
         data = res.json()
         
         if data["code"] == "0" and data["data"]:
@@ -518,7 +518,6 @@ class OKXExecutor:
                     # --- LOG TRADE HISTORY (Shadow Mode) ---
                     try:
                         from db_client import db
-                        history = db.get_data("trade_history", [])
 
                         pnl_pct = (((limit_px - entry_price)/entry_price) if pos['type']=='long' else ((entry_price - limit_px)/entry_price)) * 100 * leverage_val
                         
@@ -537,8 +536,7 @@ class OKXExecutor:
                             "reason": f"AI Decision (Shadow) - {action}" 
                         }
                         
-                        history.append(trade_record)
-                        db.save_data("trade_history", history)
+                        db.append_data("trade_history", [trade_record])
                         print(f"📝 [SHADOW] Appended trade to history: {trade_record['id']}")
                     except Exception as e:
                         print(f"⚠️ Failed to log shadow trade history: {e}")
@@ -836,9 +834,7 @@ class OKXExecutor:
 
         # 2. Load existing local history to prevent duplicates
         from db_client import db
-        local_history = db.get_data("trade_history", [])
-        
-        existing_ids = set(item['id'] for item in local_history)
+        existing_ids = set(item['id'] for item in db.query("trade_history", projection=["id"]) if 'id' in item)
         new_records = []
 
         # 3. Process OKX Orders -> Frontend Format
@@ -958,12 +954,10 @@ class OKXExecutor:
 
         # 4. Save if any new found
         if new_records:
-            # Append new ones
-            local_history.extend(new_records)
-            # Sort by time desc?
+            # Append new ones (only these are written to MongoDB)
             try:
                 from db_client import db
-                db.save_data("trade_history", local_history)
+                db.upsert_by_key("trade_history", new_records)
                 print(f"✅ [REAL] Synced {len(new_records)} new trades from OKX.")
             except Exception as e:
                 print(f"⚠️ Failed to save synced history: {e}")
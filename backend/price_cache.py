@@ -0,0 +1,78 @@
+import time
+import threading
+import instrumentation
+
+DEFAULT_TTL = 300  # seconds
+
+
+class PriceCache:
+    """
+    Shared USD price cache for the on-chain scanners, keyed by token address.
+    - Per-asset TTL (volatile tokens can expire sooner than majors).
+    - Peg shortcut: pegged assets (e.g. USDT/USDC = 1.0) never hit the provider.
+    - Misses are filled with one bulk request when the provider offers one (fetch_many).
+    Failed lookups (price 0) are not cached, so the next call retries.
+    """
+    def __init__(self, fetch_one, fetch_many=None, ttl=DEFAULT_TTL, ttls=None, pegs=None):
+        self.fetch_one = fetch_one    # address -> price (0 on failure)
+        self.fetch_many = fetch_many  # [addresses] -> {address: price}
+        self.ttl = ttl
+        self.ttls = ttls or {}        # symbol -> ttl override
+        self.pegs = pegs or {}        # symbol -> fixed price
+        self._prices = {}             # address -> (price, expires_at)
+        self._lock = threading.Lock()
+
+    def _cached(self, address):
+        with self._lock:
+            hit = self._prices.get(address)
+        if hit and hit[1] > time.monotonic():
+            instrumentation.count("price_cache.hit")
+            return hit[0]
+        instrumentation.count("price_cache.miss")
+        return None
+
+    def _store(self, address, symbol, price):
+        if price:
+            with self._lock:
+                self._prices[address] = (price, time.monotonic() + self.ttls.get(symbol, self.ttl))
+
+    def get(self, address, symbol=None):
+        """Price for one token (pegged, cached or fetched)."""
+        if symbol in self.pegs:
+            return self.pegs[symbol]
+        price = self._cached(address)
+        if price is None:
+            price = self.fetch_one(address)
+            self._store(address, symbol, price)
+        return price
+
+    def get_many(self, tokens):
+        """Prices for {symbol: address}, with every cache miss fetched in one bulk request. Returns {symbol: price}."""
+        prices = {}
+        missing = {}
+        for symbol, address in tokens.items():
+            if symbol in self.pegs:
+                prices[symbol] = self.pegs[symbol]
+                continue
+            cached = self._cached(address)
+            if cached is None:
+                missing[symbol] = address
+            else:
+                prices[symbol] = cached
+
+        if missing and self.fetch_many is not None:
+            try:
+                fetched = self.fetch_many(list(missing.values()))
+            except Exception as e:
+                print(f"⚠️ Bulk price request failed ({e}). Falling back to single lookups.")
+                fetched = {}
+            for symbol, address in list(missing.items()):
+                price = fetched.get(address)
+                if price:
+                    self._store(address, symbol, price)
+                    prices[symbol] = price
+                    del missing[symbol]
+
+        for symbol, address in missing.items():
+            prices[symbol] = self.get(address, symbol)
+        return {symbol: prices[symbol] for symbol in tokens}
@@ -0,0 +1,124 @@
+import time
+import threading
+from collections import deque
+
+
+class RateLimiter:
+    """
+    Thread-safe sliding-window limiter: at most `max_calls` acquisitions per `period` seconds.
+    Shared by all worker threads that talk to the same API so the budget is global, not per-thread.
+    """
+    def __init__(self, max_calls, period):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call slot is free, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                # Drop timestamps that have left the window
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return
+                wait = self.period - (now - self._calls[0])
+            time.sleep(max(wait, 0.01))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to `capacity` (burst size).
+    Used for APIs quoted as a steady per-second quota (Etherscan, Moralis).
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available, then consume them."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(max(wait, 0.01))
+
+
+class KeyPool:
+    """
+    Schedules requests across several API keys, each with its own token-bucket quota.
+    acquire() hands out the key with the most remaining budget, so load is spread proactively instead
+    of rotating only after a failure. Keys that answer 401/429 are benched for a cooldown.
+    """
+    def __init__(self, keys, rate, capacity=None, max_wait=30.0):
+        self.keys = list(keys)
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.max_wait = max_wait
+        now = time.monotonic()
+        self._tokens = {key: self.capacity for key in self.keys}
+        self._updated = {key: now for key in self.keys}
+        self._benched_until = {key: 0.0 for key in self.keys}
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        for key in self.keys:
+            self._tokens[key] = min(self.capacity, self._tokens[key] + (now - self._updated[key]) * self.rate)
+            self._updated[key] = now
+
+    def acquire(self):
+        """Block until a key has budget and return it; None if no key frees up within max_wait."""
+        deadline = time.monotonic() + self.max_wait
+        while self.keys:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                active = [key for key in self.keys if self._benched_until[key] <= now]
+                if active:
+                    best = max(active, key=self._tokens.get)
+                    if self._tokens[best] >= 1:
+                        self._tokens[best] -= 1
+                        return best
+                    wait = (1 - self._tokens[best]) / self.rate
+                else:
+                    wait = min(self._benched_until.values()) - now
+            if now + wait > deadline:
+                return None
+            time.sleep(max(wait, 0.01))
+        return None
+
+    def bench(self, key, seconds):
+        """Take a key out of rotation (quota exceeded / rate limited) for `seconds`."""
+        with self._lock:
+            self._benched_until[key] = time.monotonic() + seconds
+            self._tokens[key] = 0.0
+
+    def remaining(self):
+        """Current budget per key index (benched keys report 0)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                i: 0.0 if self._benched_until[key] > now else round(self._tokens[key], 2)
+                for i, key in enumerate(self.keys)
+            }
+
+
+# OKX public REST budget (20 requests / 2 seconds), shared by every OKXDataClient in the process
+OKX_RATE_LIMITER = RateLimiter(20, 2.0)
+
+# Etherscan free tier (5 calls / second)
+ETHERSCAN_RATE_LIMITER = TokenBucket(5)
@@ -4,12 +4,18 @@ import os
 import sys
 import threading
 import json
-from flask import Flask, jsonify, send_from_directory
+import importlib
+import traceback
+from flask import Flask, Response, jsonify, send_from_directory, request
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import requests
 from stats_calculator import calculate_stats
-from db_client import db
+from stage_dag import Stage, run_dag, save_reports, LAST_RUNS
+import instrumentation
+from api_cache import api_responses
+import json_store
+from db_client import db, time_ordered_id
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,6 +26,20 @@ load_dotenv(dotenv_path=env_path)
 INTERVAL_HOURS = 2
 INTERVAL_SECONDS = INTERVAL_HOURS * 3600
 PORT = int(os.getenv("PORT", 5001))
+# Fast start: serve the locally cached data right away and connect MongoDB in the background,
+# before the GitHub pull and init_data_files (which hit the network). FAST_START=0 restores the old order.
+FAST_START = os.getenv("FAST_START", "1") != "0"
+# Pipeline stages run in this process by default (heavy imports, DB client and caches are reused
+# across cycles and outputs are passed in memory). Set PIPELINE_ISOLATION=subprocess to fork each stage.
+PIPELINE_ISOLATION = os.getenv("PIPELINE_ISOLATION", "inprocess").lower()
+# Per-stage timeouts (seconds) of the cycle DAG, and where its timing reports are kept
+STAGE_TIMEOUTS = {
+    "crypto_brain": 1200,
+    "update_qlib_data": 900,
+    "inference_qlib_model": 600,
+    "ai_trader": 900,
+}
+PIPELINE_TIMING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline_timing.json")
 VERSION = "2026.03.25.1220" # Version for tracking deployments
 
 # --- DATA INITIALIZATION ---
@@ -30,9 +50,7 @@ def init_data_files():
     if not state:
         initial_val = 3905.0
         try:
-            from okx_executor import OKXExecutor
-            temp_exec = OKXExecutor()
-            eq = temp_exec.get_account_equity()
+            eq = get_executor().get_account_equity()
             if eq > 100:
                 initial_val = eq
         except:
@@ -61,10 +79,16 @@ def init_data_files():
             print("✅ Added start_time to portfolio_state in DB")
 
     # 2. Trade History
+    # An empty MongoDB (fresh cluster) must not clobber the local copy restored by data_pull: seed it instead
     hist = db.get_data("trade_history")
     if not hist:
-        db.save_data("trade_history", [])
-        print("✅ Initialized trade_history in DB")
+        local_hist = db.get_local_data("trade_history", [])
+        if local_hist:
+            db.save_data("trade_history", local_hist)
+            print(f"✅ Seeded trade_history in DB from the local copy ({len(local_hist)} trades)")
+        else:
+            db.save_data("trade_history", [])
+            print("✅ Initialized trade_history in DB")
         
     # 3. Agent Decision Log (agent_decisions is the new primary)
     log = db.get_data("agent_decisions")
@@ -72,8 +96,21 @@ def init_data_files():
         # Fallback to check old log
         log = db.get_data("agent_decision_log")
         
+    local_logs = {}
     if not log:
+        for name in ("agent_decisions", "agent_decision_log"):
+            docs = db.get_local_data(name, [])
+            if isinstance(docs, list) and docs:
+                local_logs[name] = docs
+    if local_logs:
+        for name, docs in local_logs.items():
+            for doc in docs:
+                doc.setdefault("id", time_ordered_id())  # decisions logged before ids existed
+            db.save_data(name, docs)
+        print("✅ Seeded agent_decisions (and log) in DB from the local copy")
+    elif not log:
         dummy_log = [{
+            "id": time_ordered_id(),
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "analysis_summary": {
                 "zh": " Dolores 交易代理已启动。正在等待第一次 4H 周期数据分析...",
@@ -92,17 +129,17 @@ def init_data_files():
         db.save_data("agent_decision_log", dummy_log)
         print("✅ Initialized agent_decisions (and log) in DB")
 
-    # 4. NAV History
-    nav = db.get_data("nav_history", [])
+    # 4. NAV History (time series; the legacy nav_history list is imported once)
+    nav_series = get_nav_series()
+    nav_series.reload()  # columns may have been pulled from GitHub after an early API request loaded them
+    nav_series.seed(lambda: db.get_data("nav_history", []))
     # Re-generate if empty or too short
-    if not nav or len(nav) < 5:
+    if len(nav_series) < 5:
         print("📊 Adjusting baseline: $3905 starting from Feb 22...")
         base_nav = 3905.0
         current_equity = 3905.0
         try:
-             from okx_executor import OKXExecutor
-             temp_exec = OKXExecutor()
-             current_equity = temp_exec.get_account_equity()
+             current_equity = get_executor().get_account_equity()
         except: pass
 
         # Fetch recent BTC candles (approx 10 points for 2 days)
@@ -148,7 +185,7 @@ def init_data_files():
                  "btc_price": btc_px
              })
              
-        db.save_data("nav_history", history)
+        nav_series.append(history)
         
         # Also update portfolio_state initialNav
         state = db.get_data("portfolio_state", {})
@@ -156,31 +193,14 @@ def init_data_files():
         state["start_time"] = "2026-02-22T00:00:00Z"
         db.save_data("portfolio_state", state)
         print(f"✅ Re-generated history: Start 3905 (2026-02-22) -> End {current_equity:.2f}")
-             
-        db.save_data("nav_history", history)
         print(f"✅ Generated nav_history in DB (base: {base_nav} -> current: {current_equity:.2f})")
-        
-    # Auto-fix: Ensure all points have valid btc_price for benchmark
-    final_nav = db.get_data("nav_history", [])
-    if final_nav:
-        fixed = False
-        last_valid_btc = 66000.0 # fallback
-        for h in final_nav:
-            if h.get("btc_price", 0) <= 0:
-                h["btc_price"] = last_valid_btc
-                fixed = True
-            else:
-                last_valid_btc = h["btc_price"]
-        if fixed:
-            db.save_data("nav_history", final_nav)
-            print("✅ Auto-fixed missing BTC prices in nav_history")
 
     # Deployment debug log
     try:
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         with open(os.path.join(project_root, "frontend", "deploy_info.txt"), "w") as f:
             f.write(f"Init Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"History Points: {len(final_nav)}\n")
+            f.write(f"History Points: {len(nav_series)}\n")
             f.write(f"Current Equity: {current_equity if 'current_equity' in locals() else 'N/A'}\n")
     except:
         pass
@@ -190,77 +210,156 @@ def init_data_files():
 app = Flask(__name__)
 CORS(app) # Enable CORS for Vercel
 
+WHALE_ANALYSIS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend", "data", "whale_analysis.json")
+
+def _etag_matches(header, etag):
+    """If-None-Match check (comma-separated list, weak validators and * accepted)."""
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def serve_cached(key, build, source_path=None):
+    """
+    Serve the pre-serialized body of `key` (see api_cache) with ETag / If-None-Match -> 304 and
+    pre-gzipped bytes for clients that accept gzip.
+    """
+    entry = api_responses.get(key, build, source_path=source_path)
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    etag = f'"{entry.etag}-gz"' if use_gzip else f'"{entry.etag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return Response(entry.gzipped if use_gzip else entry.body, mimetype="application/json", headers=headers)
+
+def _load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def build_crypto_data(full_data):
+    """Per-symbol dashboard summary of whale_analysis."""
+    result = {}
+    # Map frontend symbols to backend keys
+    symbols = ["BTC", "ETH", "SOL", "BNB", "DOGE"]
+
+    for sym in symbols:
+        key = sym.lower()
+        if key not in full_data:
+            continue
+
+        coin_data = full_data[key]
+        market = coin_data.get("market", {})
+        stats = coin_data.get("stats", {})
+
+        # Determine Sentiment string from Action Signal or Score
+        sentiment = stats.get("action_signal", "NEUTRAL")
+        # Fallback if signal is missing (e.g. for simple coins)
+        if not sentiment or sentiment == "WAIT":
+            sentiment = "NEUTRAL"
+
+        # Use confidence_score (0-100) or default to 50
+        score = stats.get("confidence_score", 50)
+
+        result[sym] = {
+            "price": market.get("price", 0),
+            "change_24h": market.get("change_24h", 0),
+            "rsi_4h": market.get("rsi_4h", 50),
+            "funding_rate": market.get("funding_rate", 0),
+            "funding_rate_status": market.get("funding_rate_status", "NEUTRAL"),
+            "volume_24h": market.get("volume_24h", 0),
+            "sentiment": sentiment,
+            "sentimentScore": score
+        }
+
+    return {
+        "data": result,
+        "lastUpdated": int(datetime.now().timestamp() * 1000) # Build time as ms (changes only with the data)
+    }
+
+def _agent_decisions():
+    # User requested to pull from 'agent_decisions' collection (online source)
+    decisions = db.query("agent_decisions", sort=[("timestamp", -1)], limit=10, wait=False)
+    if not decisions:
+        # Fallback to local log if online is empty
+        decisions = db.query("agent_decision_log", sort=[("timestamp", -1)], limit=10, wait=False)
+    return decisions  # First 10 (Newest first)
+
+# DB-backed API views: key -> (collection, build). Rebuilt (indexed query) after every write to the collection.
+DB_API_VIEWS = {
+    # Last 50, newest first
+    "history": ("trade_history", lambda: db.query("trade_history", sort=[("exitTime", -1)], limit=50, wait=False)),
+    "agent-decision": ("agent_decisions", _agent_decisions),
+}
+
+def publish_db_views(collection_name, data):
+    """db save listener: re-publish the API bodies derived from this collection."""
+    for key, (collection, build) in DB_API_VIEWS.items():
+        if collection == collection_name:
+            api_responses.publish(key, build())
+
+db.add_save_listener(publish_db_views)
+
+def serve_db_view(key):
+    _, build = DB_API_VIEWS[key]
+    return serve_cached(key, build)
+
+NAV_CHART_POINTS = 1000  # default downsampling target of /api/nav-history
+
+def build_nav_history(start=None, end=None, max_points=NAV_CHART_POINTS):
+    """NAV points for the chart; missing BTC prices are carried forward so the benchmark line has no gaps."""
+    points = get_nav_series().range(start, end, max_points, wait=False)
+    last_valid_btc = 66000.0 # fallback
+    for p in points:
+        if not p.get("btc_price") or p["btc_price"] <= 0:
+            p["btc_price"] = last_valid_btc
+        else:
+            last_valid_btc = p["btc_price"]
+    return points
+
 @app.route('/api/market-stats', methods=['GET'])
 def get_market_stats():
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    whale_path = os.path.join(project_root, "frontend", "data", "whale_analysis.json")
-    
-    if not os.path.exists(whale_path):
+    if not os.path.exists(WHALE_ANALYSIS_PATH):
         return jsonify({"error": "Data file not found"}), 404
-        
+
     try:
-        with open(whale_path, 'r') as f:
-            data = json.load(f)
-        return jsonify(data)
+        return serve_cached("market-stats", lambda: _load_json(WHALE_ANALYSIS_PATH), source_path=WHALE_ANALYSIS_PATH)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/crypto-data', methods=['GET'])
 def get_crypto_data():
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    whale_path = os.path.join(project_root, "frontend", "data", "whale_analysis.json")
-    
-    if not os.path.exists(whale_path):
+    if not os.path.exists(WHALE_ANALYSIS_PATH):
         return jsonify({"error": "Data file not found"}), 404
-        
+
     try:
-        with open(whale_path, 'r') as f:
-            full_data = json.load(f)
-            
-        result = {}
-        # Map frontend symbols to backend keys
-        symbols = ["BTC", "ETH", "SOL", "BNB", "DOGE"]
-        
-        for sym in symbols:
-            key = sym.lower()
-            if key not in full_data:
-                continue
-                
-            coin_data = full_data[key]
-            market = coin_data.get("market", {})
-            stats = coin_data.get("stats", {})
-            
-            # Determine Sentiment string from Action Signal or Score
-            sentiment = stats.get("action_signal", "NEUTRAL")
-            # Fallback if signal is missing (e.g. for simple coins)
-            if not sentiment or sentiment == "WAIT":
-                sentiment = "NEUTRAL"
-            
-            # Use confidence_score (0-100) or default to 50
-            score = stats.get("confidence_score", 50)
-            
-            result[sym] = {
-                "price": market.get("price", 0),
-                "change_24h": market.get("change_24h", 0),
-                "rsi_4h": market.get("rsi_4h", 50),
-                "funding_rate": market.get("funding_rate", 0),
-                "funding_rate_status": market.get("funding_rate_status", "NEUTRAL"),
-                "volume_24h": market.get("volume_24h", 0),
-                "sentiment": sentiment,
-                "sentimentScore": score
-            }
-            
-        return jsonify({
-            "data": result,
-            "lastUpdated":  int(datetime.now().timestamp() * 1000) # Current server time as ms
-        })
+        return serve_cached("crypto-data", lambda: build_crypto_data(_load_json(WHALE_ANALYSIS_PATH)), source_path=WHALE_ANALYSIS_PATH)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-from okx_executor import OKXExecutor
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Shared OKXExecutor, imported and created on first use (keeps startup free of client setup)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from okx_executor import OKXExecutor
+            _executor = OKXExecutor()
+    return _executor
+
+_nav_series = None
 
-# Initialize Executor
-executor = OKXExecutor()
+def get_nav_series():
+    """NAV time series (MongoDB time-series collection + local columns), created on first use."""
+    global _nav_series
+    if _nav_series is None:
+        from timeseries import TimeSeries
+        data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend", "data")
+        _nav_series = TimeSeries("nav_series", ("nav", "btc_price"), data_dir)
+    return _nav_series
 
 # Mute Flask access logs to keep terminal clean
 import logging
@@ -284,8 +383,8 @@ def get_cached(key, fetch_func):
 def get_portfolio_summary():
     try:
         def fetch():
-            current_equity = executor.get_account_equity()
-            state = db.get_data("portfolio_state", {})
+            current_equity = get_executor().get_account_equity()
+            state = db.get_data("portfolio_state", {}, wait=False)
             initial = state.get("initial_equity", state.get("total_equity", 10000.0))
             start_time = state.get("start_time", datetime.now().strftime("%Y-%m-%dT00:00:00Z"))
             pnl = current_equity - initial
@@ -308,7 +407,7 @@ def get_portfolio_summary():
 def get_positions():
     try:
         def fetch():
-            return executor.get_all_positions()
+            return get_executor().get_all_positions()
         return jsonify(get_cached("positions", fetch))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -316,33 +415,35 @@ def get_positions():
 @app.route('/api/history', methods=['GET'])
 def get_trade_history():
     try:
-        history = db.get_data("trade_history", [])
-        # Return last 50, newest first
-        return jsonify(history[-50:][::-1])
+        return serve_db_view("history")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/agent-decision', methods=['GET'])
 def get_agent_decisions():
     try:
-        # User requested to pull from 'agent_decisions' collection (online source)
-        decisions = db.get_data("agent_decisions", [])
-        if not decisions:
-             # Fallback to local log if online is empty
-             decisions = db.get_data("agent_decision_log", [])
-             
-        if isinstance(decisions, list):
-            return jsonify(decisions[:10]) # First 10 (Newest first)
-        else:
-            return jsonify([decisions])
+        return serve_db_view("agent-decision")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-        
+
 @app.route('/api/nav-history', methods=['GET'])
 def get_nav_history():
+    """Optional ?from=&to= (ISO, to exclusive) and ?points=N (downsampling target, default NAV_CHART_POINTS)."""
     try:
-        history = db.get_data("nav_history", [])
-        return jsonify(history)
+        start, end = request.args.get("from"), request.args.get("to")
+        points = request.args.get("points", type=int)
+        if start is None and end is None and points is None:
+            return serve_cached("nav-history", build_nav_history)
+        return jsonify(build_nav_history(start, end, max(1, min(points or NAV_CHART_POINTS, 10000))))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/pipeline-metrics', methods=['GET'])
+def get_pipeline_metrics():
+    """Per-stage instrumentation of the last N cycles (?cycles=N, default 5), the latest DAG timings and DB cache counters."""
+    try:
+        limit = max(1, min(int(request.args.get("cycles", 5)), 100))
+        return jsonify({"cycles": instrumentation.load_cycles(limit), "dag": LAST_RUNS, "db_cache": db.cache_stats})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -414,13 +515,72 @@ def run_script(script_name):
         write_status("CRASHED", str(e))
         return False
 
+# Stage script -> (module, entry function) for in-process runs
+STAGE_ENTRYPOINTS = {
+    "crypto_brain.py": ("crypto_brain", "main"),
+    "update_qlib_data.py": ("update_qlib_data", "main"),
+    "inference_qlib_model.py": ("inference_qlib_model", "main"),
+    "ai_trader.py": ("ai_trader", "run_agent"),
+    "data_sync.py": ("data_sync", "sync_data_to_github"),
+}
+
+def run_stage(script_name, **kwargs):
+    """
+    Run one pipeline stage and return (success, output).
+    In-process: the module is imported once and its entry function called with kwargs; output is its
+    return value. Subprocess isolation (PIPELINE_ISOLATION=subprocess or a stage without an entry
+    point) runs the script via run_script; kwargs are dropped, output is None and the stage reads
+    its inputs from DB / disk as before.
+    """
+    if PIPELINE_ISOLATION == "subprocess" or script_name not in STAGE_ENTRYPOINTS:
+        return run_script(script_name), None
+
+    module_name, func_name = STAGE_ENTRYPOINTS[script_name]
+    print(f"\n🚀 Starting {script_name} (in-process) at {datetime.now().strftime('%H:%M:%S')}...")
+    try:
+        module = importlib.import_module(module_name)
+        output = getattr(module, func_name)(**kwargs)
+        print(f"✅ {script_name} finished successfully.")
+        return True, output
+    except (Exception, SystemExit) as e:
+        traceback.print_exc()
+        print(f"❌ {script_name} failed: {e}")
+        write_status("ERROR", f"Script {script_name} failed.")
+        return False, None
+
+def _required(script_name, **kwargs):
+    """run_stage for use inside the DAG: a failed stage raises so its dependents are skipped."""
+    success, output = run_stage(script_name, **kwargs)
+    if not success:
+        raise RuntimeError(f"{script_name} failed")
+    return output
+
+def cycle_stages():
+    """
+    Stage DAG of one cycle. The Qlib update and ranking only need candles, so they run next to
+    crypto_brain instead of after its LLM narrative; ai_trader waits for both.
+        crypto_brain ------------------------------------+--> ai_trader
+        update_qlib_data --> inference_qlib_model -------+
+    A failed Qlib update still lets the ranking run on the previous data, and a failed ranking
+    still lets ai_trader run on the last payload (same as the serial loop).
+    """
+    return [
+        Stage("crypto_brain", lambda _: _required("crypto_brain.py"), timeout=STAGE_TIMEOUTS["crypto_brain"]),
+        Stage("update_qlib_data", lambda _: _required("update_qlib_data.py"), timeout=STAGE_TIMEOUTS["update_qlib_data"]),
+        Stage("inference_qlib_model", lambda _: _required("inference_qlib_model.py"),
+              after=("update_qlib_data",), timeout=STAGE_TIMEOUTS["inference_qlib_model"]),
+        Stage("ai_trader", lambda inputs: _required(
+                  "ai_trader.py", whale_data=inputs["crypto_brain"], qlib_payload=inputs["inference_qlib_model"]),
+              deps=("crypto_brain",), after=("inference_qlib_model",), timeout=STAGE_TIMEOUTS["ai_trader"]),
+    ]
+
 def background_sync_loop():
     """
     Independent background thread to sync trade history and positions every 10 minutes.
     This ensures the dashboard is always 'fresh' even between 4H AI cycles.
     """
     print("⏳ Background Sync Thread Started (Interval: 10m)")
-    sync_executor = OKXExecutor() # Dedicated executor for this thread
+    sync_executor = get_executor()
     
     while True:
         try:
@@ -459,6 +619,10 @@ def main():
     print(f"🤖 Unified Whale Monitor & AI Trader Started.")
     print(f"⏱️  Interval: Every {INTERVAL_HOURS} hours.")
     
+    if FAST_START:
+        threading.Thread(target=start_web_server, daemon=True).start()
+        db.connect_async()
+
     # -1. Pull historical data from GitHub if it exists to preserve PnL
     try:
         from data_sync import pull_data_from_github
@@ -470,7 +634,8 @@ def main():
     init_data_files()
     
     # 1. Start Web Server
-    threading.Thread(target=start_web_server, daemon=True).start()
+    if not FAST_START:
+        threading.Thread(target=start_web_server, daemon=True).start()
     
     # 1.5 Start Background Sync Thread (10m interval)
     threading.Thread(target=background_sync_loop, daemon=True).start()
@@ -531,26 +696,21 @@ def main():
                 run_script("train_local_brain.py")
                 print("✅ [MONDAY] Qlib Evolution Complete!")
 
-        # 1. Update Market Reality (crypto_brain)
-        print(">> Step 1: Updating Market Reality (crypto_brain)...")
-        success_data = run_script("crypto_brain.py")
-        
-        # 1.25 Run Qlib Database Update (Automated 4H Data Ingestion)
-        if success_data:
-            print(">> Step 1.25: Updating Qlib Database...")
-            # We don't fail the loop if this fails, we just try our best to keep data fresh
-            run_script("update_qlib_data.py")
-        
-        # 1.5 Run Qlib Strategy Ranking
-        if success_data:
-            print(">> Step 1.5: Running Qlib Strategy Ranking...")
-            run_script("inference_qlib_model.py")
-        
-        # 2. Run AI Execution (ai_trader)
+        # 1. Market Reality (crypto_brain) || Qlib Update -> Qlib Ranking, then 2. AI Execution (ai_trader)
+        print(">> Steps 1-2: crypto_brain || update_qlib_data -> inference_qlib_model, then ai_trader...")
+        instrumentation.start_cycle()
+        cycle = run_dag(cycle_stages(), name="cycle")
+        try:
+            save_reports(PIPELINE_TIMING_FILE)
+        except Exception as e:
+            print(f"⚠️ Failed to save pipeline timing: {e}")
+        success_data = cycle.ok("crypto_brain")
+        whale_data = cycle.output("crypto_brain", None)
+
         if success_data:
-            print(">> Step 2: AI Thinking & Execution (ai_trader)...")
-            success_trade = run_script("ai_trader.py")
+            success_trade = cycle.ok("ai_trader")
             if success_trade:
+                executor = get_executor()
                 print(">> Step 2.5: Syncing Trade History (Real/Shadow)...")
                 try:
                     executor.sync_trade_history()
@@ -559,12 +719,12 @@ def main():
 
                 print(">> Step 2.75: Appending NAV History...")
                 try:
-                    nav_history = db.get_data("nav_history", [])
                     current_eq = executor.get_account_equity()
                     
                     # Get latest BTC price for benchmark
                     btc_price = 0
-                    whale_data = db.get_data("whale_analysis", {})
+                    if not whale_data:
+                        whale_data = db.get_data("whale_analysis", {})
                     if whale_data and isinstance(whale_data, dict):
                         btc_price = whale_data.get("btc", {}).get("market", {}).get("price", 0)
                     
@@ -579,17 +739,12 @@ def main():
                         except:
                             pass
                     
-                    nav_history.append({
+                    get_nav_series().append([{
                         "timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
                         "nav": round(current_eq, 2),
                         "btc_price": btc_price
-                    })
-                    
-                    # Keep last 150 points (about 25 days of 4H data)
-                    if len(nav_history) > 150:
-                        nav_history = nav_history[-150:]
-                        
-                    db.save_data("nav_history", nav_history)
+                    }])
+                    api_responses.publish("nav-history", build_nav_history())
                     
                     # --- NEW: Keep current_state in sync with Real OKX ---
                     state = db.get_data("portfolio_state", {})
@@ -633,7 +788,9 @@ def main():
                     print(f"⚠️ Failed to append NAV history: {e}")
 
                 print(">> Step 3: Syncing Data to GitHub (data-history)...")
-                run_script("data_sync.py")
+                json_store.flush()  # Pending local JSON writes must be on disk before they are committed
+                with instrumentation.measure("data_sync"):
+                    run_stage("data_sync.py")
 
                 # print(">> Step 4: Sending 4H Market Report...")
                 # run_script("daily_report.py") # Deactivated redundant simplified report
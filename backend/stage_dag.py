@@ -0,0 +1,196 @@
+"""
+Minimal stage DAG scheduler for the 4H cycle.
+Stages declare their dependencies; every stage whose inputs are ready runs at once on its own
+(daemon) thread, so independent I/O overlaps. Each run records per-stage timings and the critical
+path (the chain of stages that actually determined the total duration); every stage is also
+measured by instrumentation (CPU, process RSS, HTTP, LLM usage), nested under the stage that started the DAG.
+"""
+import contextvars
+import queue
+import threading
+import time
+import traceback
+import instrumentation
+import json_store
+
+# Last report per DAG name (run_loop persists these after each cycle)
+LAST_RUNS = {}
+
+
+class Stage:
+    """
+    One unit of work. fn(inputs) gets {name: output} for every stage in deps and after.
+    deps: must succeed first (otherwise this stage is skipped).
+    after: only ordering; the output is None if that stage failed.
+    timeout: seconds after start before the stage is abandoned (threads cannot be killed, so a
+    timed-out stage keeps running in the background but its result is ignored).
+    """
+    def __init__(self, name, fn, deps=(), after=(), timeout=None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.after = tuple(after)
+        self.timeout = timeout
+
+
+class DagRun:
+    """Outcome of run_dag: status ("ok", "failed", "timeout", "skipped"), outputs and timings."""
+    def __init__(self, name, stages):
+        self.name = name
+        self.stages = {s.name: s for s in stages}
+        self.status = {}
+        self.outputs = {}
+        self.errors = {}
+        self.started = {}   # name -> seconds since the run started
+        self.finished = {}
+        self.total = 0.0
+
+    def ok(self, name):
+        return self.status.get(name) == "ok"
+
+    def output(self, name, *default):
+        """Output of a stage; the default (if given) when it did not succeed, else RuntimeError."""
+        if self.ok(name):
+            return self.outputs[name]
+        if default:
+            return default[0]
+        raise RuntimeError(f"Stage {name} {self.status.get(name, 'did not run')}: {self.errors.get(name, '')}")
+
+    def critical_path(self):
+        """Stages ending at the last finisher, each preceded by its latest-finishing prerequisite."""
+        if not self.finished:
+            return []
+        name = max(self.finished, key=self.finished.get)
+        path = [name]
+        while True:
+            stage = self.stages[name]
+            prior = [r for r in stage.deps + stage.after if r in self.finished]
+            if not prior:
+                break
+            name = max(prior, key=self.finished.get)
+            path.append(name)
+        return path[::-1]
+
+    def report(self):
+        return {
+            "name": self.name,
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "total_s": round(self.total, 3),
+            "critical_path": self.critical_path(),
+            "stages": {
+                name: {
+                    "status": self.status.get(name, "skipped"),
+                    "start_s": round(self.started[name], 3) if name in self.started else None,
+                    "duration_s": round(self.finished[name] - self.started[name], 3) if name in self.finished else None,
+                    **({"error": self.errors[name]} if name in self.errors else {})
+                }
+                for name in self.stages
+            }
+        }
+
+    def print_report(self):
+        print(f"⏱️ [{self.name}] {self.total:.1f}s total")
+        for name, info in self.report()["stages"].items():
+            start = f"+{info['start_s']:.1f}s" if info["start_s"] is not None else "-"
+            duration = f"{info['duration_s']:.1f}s" if info["duration_s"] is not None else "-"
+            print(f"   {name:<24} {info['status']:<8} start {start:<8} took {duration}")
+        print(f"   Critical path: {' -> '.join(self.critical_path())}")
+
+
+def _check(stages):
+    names = {s.name for s in stages}
+    if len(names) != len(stages):
+        raise ValueError("Duplicate stage names")
+    for s in stages:
+        missing = set(s.deps + s.after) - names
+        if missing:
+            raise ValueError(f"Stage {s.name} depends on unknown stages {sorted(missing)}")
+    # Cycle check (Kahn)
+    remaining = {s.name: set(s.deps + s.after) for s in stages}
+    while remaining:
+        ready = [name for name, reqs in remaining.items() if not reqs]
+        if not ready:
+            raise ValueError(f"Dependency cycle among {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for reqs in remaining.values():
+            reqs.difference_update(ready)
+
+
+def run_dag(stages, name="pipeline", verbose=True):
+    """Run all stages respecting dependencies and timeouts. Returns a DagRun (never raises for stage errors)."""
+    _check(stages)
+    run = DagRun(name, stages)
+    pending = {s.name: s for s in stages}
+    running = {}  # name -> deadline (monotonic) or None
+    done = queue.Queue()
+    t0 = time.monotonic()
+
+    def worker(stage, inputs):
+        try:
+            with instrumentation.measure(stage.name):
+                output = stage.fn(inputs)
+            done.put((stage.name, "ok", output, None))
+        except BaseException as e:  # SystemExit from a stage must not kill the scheduler
+            traceback.print_exc()
+            done.put((stage.name, "failed", None, f"{type(e).__name__}: {e}"))
+
+    def finish(stage_name, status, output=None, error=None):
+        run.status[stage_name] = status
+        run.finished[stage_name] = time.monotonic() - t0
+        if status == "ok":
+            run.outputs[stage_name] = output
+        if error:
+            run.errors[stage_name] = error
+            print(f"❌ Stage {stage_name} {status}: {error}")
+
+    while pending or running:
+        # 1. Launch (or skip) every stage whose prerequisites are settled
+        launched = True
+        while launched:
+            launched = False
+            for stage in list(pending.values()):
+                reqs = stage.deps + stage.after
+                if any(r in pending or r in running for r in reqs):
+                    continue
+                del pending[stage.name]
+                launched = True
+                if not all(run.ok(d) for d in stage.deps):
+                    run.status[stage.name] = "skipped"
+                    continue
+                inputs = {r: run.outputs.get(r) for r in reqs}
+                run.started[stage.name] = time.monotonic() - t0
+                running[stage.name] = time.monotonic() + stage.timeout if stage.timeout else None
+                # Copy the context so the stage is measured under the caller's stage
+                threading.Thread(target=contextvars.copy_context().run, args=(worker, stage, inputs),
+                                 name=f"stage-{stage.name}", daemon=True).start()
+
+        if not running:
+            continue
+
+        # 2. Wait for the next completion or the nearest deadline
+        deadlines = [d for d in running.values() if d is not None]
+        wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        try:
+            stage_name, status, output, error = done.get(timeout=wait)
+        except queue.Empty:
+            now = time.monotonic()
+            for stage_name, deadline in list(running.items()):
+                if deadline is not None and deadline <= now:
+                    del running[stage_name]
+                    finish(stage_name, "timeout", error=f"exceeded {run.stages[stage_name].timeout}s")
+            continue
+        if stage_name in running:  # late results of timed-out stages are dropped
+            del running[stage_name]
+            finish(stage_name, status, output, error)
+
+    run.total = time.monotonic() - t0
+    LAST_RUNS[name] = run.report()
+    if verbose:
+        run.print_report()
+    return run
+
+
+def save_reports(path):
+    """Persist the latest report of every DAG run in this process."""
+    json_store.write_json(path, LAST_RUNS)
@@ -0,0 +1,79 @@
+"""
+Startup-time benchmark.
+Imports each entry module in a fresh interpreter with `-X importtime` and reports its slowest
+direct imports (cumulative time, so a heavy dependency is charged to the import that pulled it in), the total import time, and for run_loop the time until the
+Flask app has answered its first /api/market-stats request.
+
+Usage: python startup_benchmark.py [module ...] [--top N]
+"""
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODULES = ["run_loop", "crypto_brain", "ai_trader", "market_data", "inference_qlib_model"]
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Runs in the child: import, then (run_loop only) serve one request from the cached files
+PROBE = """
+import time
+t0 = time.perf_counter()
+import {module} as m
+t1 = time.perf_counter()
+print(f"IMPORT_S={{t1 - t0:.3f}}")
+if hasattr(m, "app"):
+    m.app.test_client().get("/api/market-stats")
+    print(f"FIRST_RESPONSE_S={{time.perf_counter() - t0:.3f}}")
+"""
+
+
+def bench(module, top=10):
+    """Returns {"module", "ok", "import_s", "first_response_s", "top": [(name, cumulative_ms), ...]}."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module)],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+        env={**os.environ, "FAST_START": "1"}
+    )
+    imports = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        depth = (len(match.group(3)) - 1) // 2
+        # Children are printed before their parent: keep the depth-1 entries preceding the module itself
+        if depth == 0 and match.group(4) != module:
+            imports = []
+        elif depth == 1:
+            imports.append((match.group(4), int(match.group(2)) / 1000))
+    values = dict(re.findall(r"^(\w+)=([\d.]+)$", proc.stdout, re.MULTILINE))
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "import_s": float(values["IMPORT_S"]) if "IMPORT_S" in values else None,
+        "first_response_s": float(values["FIRST_RESPONSE_S"]) if "FIRST_RESPONSE_S" in values else None,
+        "top": sorted(imports, key=lambda x: x[1], reverse=True)[:top]
+    }
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    top = 10
+    if "--top" in args:
+        i = args.index("--top")
+        top = int(args[i + 1])
+        del args[i:i + 2]
+
+    for module in args or DEFAULT_MODULES:
+        result = bench(module, top)
+        if not result["ok"]:
+            print(f"❌ {module}: {result['error']}\n")
+            continue
+        line = f"⏱️ {module}: import {result['import_s']:.2f}s"
+        if result["first_response_s"] is not None:
+            line += f", first API response {result['first_response_s']:.2f}s"
+        print(line)
+        for name, ms in result["top"]:
+            print(f"   {ms:8.1f} ms  {name}")
+        print()
@@ -0,0 +1,282 @@
+"""
+Time-series storage for NAV and macro history.
+Each series is a MongoDB time-series collection (timeField "ts") when connected, and always an
+append-only copy on disk: <name>.f64, fixed-width float64 records (epoch seconds, *fields), held in
+memory as columns. One file means a sync/pull moves all columns together; a torn last record is
+dropped on load. Range and nearest-point lookups are binary searches over the columns.
+Reads prefer MongoDB (with server-side downsampling) unless it holds fewer points than the local
+copy. The first append of a process and the one after a failed insert reconcile the two copies
+(points missing on either side are copied over).
+"""
+import math
+import os
+import threading
+from datetime import datetime, timezone
+import numpy as np
+from db_client import db
+import json_store
+from tx_window import to_epoch
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"  # naive UTC, as used by nav_history
+
+
+def format_epoch(epoch):
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime(TIME_FORMAT)
+
+
+def _to_epoch_dt(dt):
+    """BSON dates come back naive (UTC)."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+class TimeSeries:
+    """
+    points are dicts {"timestamp": ISO string (naive = UTC), field: number or None, ...}.
+    Missing values are stored as NaN and returned as None.
+    """
+    def __init__(self, name, fields, local_dir, granularity="hours"):
+        self.name = name
+        self.fields = tuple(fields)
+        self.path = os.path.join(local_dir, f"{name}.f64")
+        self.legacy_dir = os.path.join(local_dir, f"{name}.cols")  # one file per column (older layout)
+        self.granularity = granularity
+        self._lock = threading.Lock()
+        self._mongo_ready = False
+        self._needs_reconcile = True  # on startup and after a failed insert
+        self._cols = self._load()
+
+    # --- Local records ---
+    @property
+    def _columns(self):
+        return ("ts",) + self.fields
+
+    def _load(self):
+        width = len(self._columns)
+        if not os.path.exists(self.path) and os.path.isdir(self.legacy_dir):
+            self._migrate_legacy_dir()
+        data = np.fromfile(self.path, dtype=np.float64) if os.path.exists(self.path) else np.empty(0)
+        # A crash mid-append leaves a partial last record: keep the complete ones
+        n = len(data) // width
+        rows = data[:n * width].reshape(n, width)
+        cols = {column: rows[:, i].copy() for i, column in enumerate(self._columns)}
+        if n and np.any(np.diff(cols["ts"]) < 0):  # out-of-order appends (backfills)
+            order = np.argsort(cols["ts"], kind="stable")
+            cols = {k: v[order] for k, v in cols.items()}
+        return cols
+
+    def _migrate_legacy_dir(self):
+        cols = []
+        for column in self._columns:
+            path = os.path.join(self.legacy_dir, f"{column}.f64")
+            cols.append(np.fromfile(path, dtype=np.float64) if os.path.exists(path) else np.empty(0))
+        n = min(len(c) for c in cols)
+        if n:
+            rows = np.column_stack([c[:n] for c in cols])
+            with json_store.atomic_write(self.path) as f:
+                f.write(rows.tobytes())
+            print(f"✅ [{self.name}] Migrated {n} points from {self.legacy_dir}")
+
+    def _append_local(self, rows):
+        if not rows:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        block = np.array(rows, dtype=np.float64).reshape(len(rows), len(self._columns))
+        with self._lock:
+            with open(self.path, "ab") as f:
+                f.write(block.tobytes())
+            cols = {k: np.concatenate([self._cols[k], block[:, i]]) for i, k in enumerate(self._columns)}
+            if len(self._cols["ts"]) and block[:, 0].min() < self._cols["ts"][-1]:
+                order = np.argsort(cols["ts"], kind="stable")
+                cols = {k: v[order] for k, v in cols.items()}
+            self._cols = cols
+
+    def reload(self):
+        """Re-read the columns from disk (e.g. after they were replaced by a data pull)."""
+        cols = self._load()
+        with self._lock:
+            self._cols = cols
+
+    def __len__(self):
+        return len(self._cols["ts"])
+
+    # --- MongoDB ---
+    def _collection(self, wait=True):
+        """The time-series collection (created on first use), or None when MongoDB is unavailable."""
+        if not db.connect(wait=wait):
+            return None
+        database = db.db
+        if not self._mongo_ready:
+            if self.name not in database.list_collection_names():
+                database.create_collection(self.name, timeseries={"timeField": "ts", "granularity": self.granularity})
+            self._mongo_ready = True
+        return database[self.name]
+
+    def _row(self, point):
+        return [float(to_epoch(point["timestamp"]))] + [np.nan if point.get(f) is None else float(point[f]) for f in self.fields]
+
+    def _doc(self, row):
+        return {"ts": datetime.fromtimestamp(row[0], tz=timezone.utc),
+                **{f: v for f, v in zip(self.fields, row[1:]) if not math.isnan(v)}}
+
+    def reconcile(self, collection):
+        """
+        Copy points missing on either side (by timestamp): local -> MongoDB (e.g. an earlier insert
+        failed) and MongoDB -> local (e.g. written by another host). Cheap when the counts match.
+        Returns (sent, received).
+        """
+        if collection.count_documents({}) == len(self):
+            return 0, 0
+        remote = {}
+        for doc in collection.find({}, {"_id": 0}):
+            remote.setdefault(_to_epoch_dt(doc["ts"]), doc)
+        cols = self._cols
+        local_ts = cols["ts"].astype(np.int64).tolist()
+        missing_remote = [
+            [float(t)] + [float(cols[f][i]) for f in self.fields]
+            for i, t in enumerate(local_ts) if t not in remote
+        ]
+        local_set = set(local_ts)
+        missing_local = [
+            [float(t)] + [np.nan if doc.get(f) is None else float(doc[f]) for f in self.fields]
+            for t, doc in remote.items() if t not in local_set
+        ]
+        if missing_remote:
+            collection.insert_many([self._doc(row) for row in missing_remote], ordered=False)
+        self._append_local(missing_local)
+        if missing_remote or missing_local:
+            print(f"🔁 [{self.name}] Reconciled: {len(missing_remote)} points re-sent to MongoDB, {len(missing_local)} pulled to local")
+        return len(missing_remote), len(missing_local)
+
+    # --- Public API ---
+    def append(self, points):
+        """Append points (any order; normally newer than everything stored)."""
+        rows = [self._row(p) for p in points if to_epoch(p.get("timestamp")) is not None]
+        if not rows:
+            return 0
+        # 1. Local file (always)
+        self._append_local(rows)
+
+        # 2. MongoDB time-series collection, then catch up anything a previous failure (or another
+        #    writer) left behind; a full reconcile only runs on startup and after a failure
+        try:
+            collection = self._collection()
+            if collection is not None:
+                collection.insert_many([self._doc(row) for row in rows], ordered=False)
+                if self._needs_reconcile:
+                    self.reconcile(collection)
+                    self._needs_reconcile = False
+        except Exception as e:
+            self._needs_reconcile = True
+            print(f"⚠️ [MongoDB Sync Error] {self.name}: {e} (re-sent on the next append)")
+        return len(rows)
+
+    def range(self, start=None, end=None, max_points=None, wait=True):
+        """
+        Points with start <= timestamp < end (ISO strings or epoch seconds; None = unbounded), oldest first.
+        max_points: downsample to at most that many points (last value of each equal-width time bucket).
+        """
+        start = to_epoch(start) if isinstance(start, str) else start
+        end = to_epoch(end) if isinstance(end, str) else end
+        try:
+            collection = self._collection(wait=wait)
+            if collection is not None:
+                behind = len(self) - collection.estimated_document_count()
+                if behind > 0:
+                    print(f"⚠️ [{self.name}] MongoDB is missing {behind} points; serving the local copy")
+                else:
+                    return self._range_mongo(collection, start, end, max_points)
+        except Exception as e:
+            print(f"⚠️ [MongoDB Query Error] {self.name}: {e}. Falling back to local.")
+        return self._range_local(start, end, max_points)
+
+    def _bucket_seconds(self, first, last, count, max_points):
+        if not max_points or count <= max_points:
+            return None
+        # Buckets are aligned to the epoch, so the range can touch one more bucket than span / width
+        return max(1, math.ceil((last - first + 1) / max(1, max_points - 1)))
+
+    def _range_local(self, start, end, max_points):
+        cols = self._cols
+        ts = cols["ts"]
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, end, side="left"))
+        idx = np.arange(lo, hi)
+        if len(idx):
+            bucket = self._bucket_seconds(ts[lo], ts[hi - 1], len(idx), max_points)
+            if bucket:
+                keys = (ts[idx] // bucket).astype(np.int64)
+                idx = idx[np.append(np.flatnonzero(np.diff(keys)), len(idx) - 1)]  # last of each bucket
+        rows = zip(ts[idx].tolist(), *(cols[f][idx].tolist() for f in self.fields))
+        return [
+            {"timestamp": format_epoch(row[0]),
+             **{f: (None if math.isnan(v) else v) for f, v in zip(self.fields, row[1:])}}
+            for row in rows
+        ]
+
+    def _range_mongo(self, collection, start, end, max_points):
+        bounds = {}
+        if start is not None:
+            bounds["$gte"] = datetime.fromtimestamp(start, tz=timezone.utc)
+        if end is not None:
+            bounds["$lt"] = datetime.fromtimestamp(end, tz=timezone.utc)
+        match = {"ts": bounds} if bounds else {}
+
+        bucket = None
+        if max_points:
+            count = collection.count_documents(match)
+            if count > max_points:
+                first = collection.find_one(match, sort=[("ts", 1)])["ts"]
+                last = collection.find_one(match, sort=[("ts", -1)])["ts"]
+                bucket = self._bucket_seconds(_to_epoch_dt(first), _to_epoch_dt(last), count, max_points)
+
+        pipeline = [{"$match": match}, {"$sort": {"ts": 1}}]
+        if bucket:
+            pipeline += [
+                {"$group": {
+                    "_id": {"$dateTrunc": {"date": "$ts", "unit": "second", "binSize": bucket}},
+                    "ts": {"$last": "$ts"},
+                    **{f: {"$last": f"${f}"} for f in self.fields}
+                }},
+                {"$sort": {"_id": 1}}
+            ]
+        points = []
+        for doc in collection.aggregate(pipeline):
+            points.append({"timestamp": format_epoch(_to_epoch_dt(doc["ts"])), **{f: doc.get(f) for f in self.fields}})
+        return points
+
+    def nearest(self, timestamp, within=None):
+        """Local point closest to timestamp (ISO or epoch), optionally at most `within` seconds away; None if none."""
+        target = to_epoch(timestamp) if isinstance(timestamp, str) else timestamp
+        ts = self._cols["ts"]
+        if target is None or not len(ts):
+            return None
+        i = int(np.searchsorted(ts, target))
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(ts)]
+        j = min(candidates, key=lambda k: abs(ts[k] - target))
+        if within is not None and abs(ts[j] - target) >= within:
+            return None
+        point = {"timestamp": format_epoch(ts[j])}
+        for f in self.fields:
+            v = float(self._cols[f][j])
+            point[f] = None if math.isnan(v) else v
+        return point
+
+    def seed(self, legacy_points):
+        """One-time import into an empty series: pulls MongoDB's copy into the local file if there is one, else legacy_points()."""
+        if len(self):
+            return
+        try:
+            collection = self._collection()
+            if collection is not None and collection.estimated_document_count():
+                points = self._range_mongo(collection, None, None, None)
+                self._append_local([self._row(p) for p in points])
+                print(f"✅ [{self.name}] Pulled {len(points)} points from MongoDB")
+                return
+        except Exception as e:
+            print(f"⚠️ [{self.name}] Seeding from MongoDB failed: {e}")
+        points = legacy_points() or []
+        if points:
+            self.append(points)
+            print(f"✅ [{self.name}] Imported {len(points)} legacy points")
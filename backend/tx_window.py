@@ -0,0 +1,174 @@
+import json
+import os
+import heapq
+import time
+from collections import deque
+from datetime import datetime, timezone
+import numpy as np
+import json_store
+
+WINDOW_SECONDS = 168 * 3600  # 7 days
+
+# Persisted columns. Addresses, labels, signals etc. are interned into one UTF-8 table (int32 codes,
+# -1 = missing); hashes and timestamps are ASCII byte arrays; any other key goes to a per-row JSON "extra" column.
+INTERNED_FIELDS = ("symbol", "from", "to", "from_label", "to_label", "signal", "chain", "pattern")
+BYTES_FIELDS = ("hash", "timestamp")
+FLOAT_FIELDS = {"amount": np.float32, "amount_usd": np.float64}  # token amount is display-only
+TX_FIELDS = BYTES_FIELDS + tuple(FLOAT_FIELDS) + INTERNED_FIELDS
+
+
+def to_epoch(ts):
+    """ISO timestamp ('...Z', with or without millis; naive = UTC) -> epoch seconds. None if unparseable."""
+    try:
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+class TxWindow:
+    """
+    Rolling 7-day store of whale transactions.
+    A time-ordered deque of (epoch, key) plus a {(hash, symbol): tx} index gives O(1) dedup,
+    O(new) insertion (new txs are normally the newest) and O(expired) eviction.
+    Persisted as compact columns in one .npz (see INTERNED_FIELDS), oldest first.
+    """
+    def __init__(self, path=None, window_seconds=WINDOW_SECONDS):
+        self.path = path
+        self.window_seconds = window_seconds
+        self._order = deque()  # (epoch, key), ascending
+        self._index = {}       # key -> tx dict
+        self._epochs = {}      # key -> epoch used in _order
+        if path:
+            self._load()
+
+    def __len__(self):
+        return len(self._index)
+
+    @staticmethod
+    def _key(tx):
+        return (tx["hash"], tx.get("symbol", "UNKNOWN"))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                cols = {k: data[k] for k in data.files}
+            self._insert(zip(self._decode(cols), cols["epoch"].tolist()))
+        except Exception as e:
+            print(f"⚠️ Failed to load tx window {self.path}: {e}")
+
+    @staticmethod
+    def _decode(cols):
+        """Columns -> list of tx dicts (oldest first)."""
+        strings = np.char.decode(cols["strings"], "utf-8").tolist()
+        fields = {}
+        for k in BYTES_FIELDS:
+            fields[k] = np.char.decode(cols[k], "ascii").tolist()
+        for k in FLOAT_FIELDS:
+            fields[k] = cols[k].astype(float).tolist()
+        for k in INTERNED_FIELDS:
+            fields[k] = [strings[i] if i >= 0 else None for i in cols[k].tolist()]
+        extras = np.char.decode(cols["extra"], "utf-8").tolist()
+
+        txs = []
+        names = list(fields)
+        for i, values in enumerate(zip(*fields.values())):
+            tx = {k: v for k, v in zip(names, values) if v is not None}
+            if extras[i]:
+                tx.update(json.loads(extras[i]))
+            txs.append(tx)
+        return txs
+
+    def _encode(self):
+        txs = [self._index[key] for _, key in self._order]
+        table = {}
+
+        def intern(value):
+            return -1 if value is None else table.setdefault(value, len(table))
+
+        cols = {"epoch": np.array([epoch for epoch, _ in self._order], dtype=np.int64)}
+        for k in BYTES_FIELDS:
+            cols[k] = np.array([str(tx.get(k, "")).encode("ascii", "replace") for tx in txs], dtype=bytes)
+        for k, dtype in FLOAT_FIELDS.items():
+            cols[k] = np.array([tx.get(k, 0.0) for tx in txs], dtype=dtype)
+        for k in INTERNED_FIELDS:
+            cols[k] = np.array([intern(tx.get(k)) for tx in txs], dtype=np.int32)
+        cols["extra"] = np.array([
+            json.dumps({k: v for k, v in tx.items() if k not in TX_FIELDS}).encode() if set(tx) - set(TX_FIELDS) else b""
+            for tx in txs
+        ], dtype=bytes)
+        cols["strings"] = np.array([value.encode() for value in table], dtype=bytes)
+        return cols
+
+    def save(self):
+        with json_store.atomic_write(self.path) as f:
+            np.savez_compressed(f, **self._encode())
+
+    def add(self, txs):
+        """
+        Insert txs (any order). Existing (hash, symbol) keys are overwritten in place.
+        Returns the txs whose key was not in the window yet.
+        """
+        now = int(time.time())
+        # Unparseable timestamps are kept (treated as now) rather than dropped
+        return self._insert((tx, to_epoch(tx.get("timestamp")) or now) for tx in txs)
+
+    def _insert(self, pairs):
+        added = []
+        batch = []
+        for tx, epoch in pairs:
+            key = self._key(tx)
+            if key in self._index:
+                self._index[key] = tx
+                if self._epochs[key] != epoch:
+                    # Rare: same tx re-reported with another timestamp, move it
+                    old = (self._epochs[key], key)
+                    if old in batch:
+                        batch.remove(old)
+                    else:
+                        self._order.remove(old)
+                    self._epochs[key] = epoch
+                    batch.append((epoch, key))
+                continue
+            self._index[key] = tx
+            self._epochs[key] = epoch
+            batch.append((epoch, key))
+            added.append(tx)
+
+        if batch:
+            batch.sort()
+            if not self._order or batch[0][0] >= self._order[-1][0]:
+                self._order.extend(batch)
+            else:
+                # Late arrivals: one linear merge instead of a full re-sort
+                self._order = deque(heapq.merge(self._order, batch))
+        return added
+
+    def evict(self, now=None):
+        """Drop txs older than the window. Returns how many were removed."""
+        cutoff = (time.time() if now is None else now) - self.window_seconds
+        removed = 0
+        while self._order and self._order[0][0] <= cutoff:
+            _, key = self._order.popleft()
+            self._index.pop(key, None)
+            self._epochs.pop(key, None)
+            removed += 1
+        return removed
+
+    def latest(self, limit=None):
+        """Txs newest first (optionally only the first `limit`)."""
+        out = []
+        for _, key in reversed(self._order):
+            if limit is not None and len(out) >= limit:
+                break
+            out.append(self._index[key])
+        return out
+
+    def latest_epochs(self, limit=None):
+        """Epoch seconds aligned with latest(limit)."""
+        epochs = [epoch for epoch, _ in reversed(self._order)]
+        return epochs if limit is None else epochs[:limit]
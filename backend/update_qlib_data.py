@@ -1,12 +1,9 @@
 import os
 import pandas as pd
-import numpy as np
 import datetime
-import time
-import json
 from pathlib import Path
-from market_data import OKXDataClient
-from technical_analysis import add_all_indicators
+import market_data
+from indicator_engine import stack_ohlcv, compute_indicators, qlib_features
 
 # Configuration
 BASE_DIR = Path(__file__).resolve().parent
@@ -28,23 +25,24 @@ def get_last_date_from_csv():
         return None
 
 def fetch_and_process_missing_data(start_date):
-    client = OKXDataClient()
+    # Shared client: same candle store as crypto_brain's market fetch, which runs concurrently
+    client = market_data.client
     all_new_rows = []
     
     now = datetime.datetime.now()
     print(f"🚀 Updating Qlib Data from {start_date} to {now}...")
 
+    # 1. Fetch OHLCV (4H) for every symbol first so indicators run in one vectorized pass
+    frames = {}
     for symbol in SYMBOLS:
         print(f"  Fetching {symbol}...")
         inst_id = f"{symbol}-USDT-SWAP"
         
-        # 1. Fetch OHLCV (4H)
         # We need to fetch enough history for indicators (SMA200 needs 200 bars)
-        # To be safe, we fetch 500 bars including the missing ones.
         # But for appending, we only keep the ones AFTER start_date.
-        
+        # Served from the local candle store shared with market_data (only new candles hit OKX)
         limit = 300
-        data = client._request("GET", "/api/v5/market/candles", {"instId": inst_id, "bar": "4H", "limit": str(limit)})
+        data = client.candle_store.get_candles(inst_id, "4H", limit)
         if not data:
             print(f"  ⚠️ No data returned for {symbol}!")
             continue
@@ -55,76 +53,24 @@ def fetch_and_process_missing_data(start_date):
         df = df.iloc[::-1].reset_index(drop=True)
         df['datetime'] = pd.to_datetime(df['ts'].astype(int), unit='ms')
         
-        # Prepare for Technical Indicators
         df_input = df[['datetime', 'open', 'high', 'low', 'close', 'volCcyQuote']].copy()
         df_input.columns = ['datetime', 'open', 'high', 'low', 'close', 'volume']
-        
-        # 2. Calculate Indicators (Matching multi_coin_features.csv schema)
-        # Using technical_analysis.py's add_all_indicators
-        # We need to ensure we have all required columns: ma_5, ma_20, ma_60, momentum_12, etc.
-        
-        # Note: multi_coin_features.csv has some specific column names: ma_5, ma_20, ma_60
-        # technical_analysis calculates sma_50, sma_200 etc. Let's adapt.
-        
-        df_feats = df_input.copy()
         for col in ['open', 'high', 'low', 'close', 'volume']:
-            df_feats[col] = df_feats[col].astype(float)
-            
-        # Ma
-        df_feats['ma_5'] = df_feats['close'].rolling(5).mean()
-        df_feats['ma_20'] = df_feats['close'].rolling(20).mean()
-        df_feats['ma_60'] = df_feats['close'].rolling(60).mean()
-        df_feats['ma_cross'] = np.where(df_feats['ma_5'] > df_feats['ma_20'], 1, -1)
-        
-        # Returns
-        df_feats['ret'] = df_feats['close'].pct_change()
-        df_feats['log_return'] = np.log(df_feats['close'] / df_feats['close'].shift(1))
-        
-        # Momentum
-        df_feats['momentum_12'] = df_feats['close'].pct_change(12)
-        
-        # MACD
-        exp1 = df_feats['close'].ewm(span=12, adjust=False).mean()
-        exp2 = df_feats['close'].ewm(span=26, adjust=False).mean()
-        df_feats['macd'] = exp1 - exp2
-        df_feats['macd_signal'] = df_feats['macd'].ewm(span=9, adjust=False).mean()
-        df_feats['macd_hist'] = df_feats['macd'] - df_feats['macd_signal']
-        
-        # ATR
-        tr0 = abs(df_feats['high'] - df_feats['low'])
-        tr1 = abs(df_feats['high'] - df_feats['close'].shift())
-        tr2 = abs(df_feats['low'] - df_feats['close'].shift())
-        tr = pd.concat([tr0, tr1, tr2], axis=1).max(axis=1)
-        df_feats['atr_14'] = tr.rolling(14).mean()
-        df_feats['natr_14'] = (df_feats['atr_14'] / df_feats['close']) * 100
-        
-        # Bollinger
-        df_feats['ma_20_std'] = df_feats['close'].rolling(20).std()
-        df_feats['bb_width_20'] = (df_feats['ma_20_std'] * 4) / df_feats['ma_20']
-        df_feats['bb_pos_20'] = (df_feats['close'] - (df_feats['ma_20'] - 2*df_feats['ma_20_std'])) / (4*df_feats['ma_20_std'])
-        df_feats['volatility_20'] = df_feats['ma_20_std'] / df_feats['ma_20']
-        
-        # RSI
-        delta = df_feats['close'].diff()
-        up = delta.clip(lower=0)
-        down = -1 * delta.clip(upper=0)
-        ema_up = up.ewm(alpha=1/14, adjust=False).mean()
-        ema_down = down.ewm(alpha=1/14, adjust=False).mean()
-        rs = ema_up / ema_down
-        df_feats['rsi_14'] = 100 - (100 / (1 + rs))
-        
-        # Volume
-        df_feats['volume_ma_20'] = df_feats['volume'].rolling(20).mean()
-        df_feats['rel_volume_20'] = df_feats['volume'] / df_feats['volume_ma_20']
-        
-        # Range Pos
-        roll_min = df_feats['low'].rolling(20).min()
-        roll_max = df_feats['high'].rolling(20).max()
-        df_feats['price_position_20'] = (df_feats['close'] - roll_min) / (roll_max - roll_min + 1e-9)
-        
-        # Stars (mock or simplified)
-        df_feats['buy_stars'] = 0
-        df_feats['sell_stars'] = 0
+            df_input[col] = df_input[col].astype(float)
+        frames[symbol] = df_input
+
+    if not frames:
+        return None
+
+    # 2. Calculate Indicators (live strategy definitions, except where the model was trained on others; see indicator_engine)
+    ohlcv = stack_ohlcv(list(frames.values()))
+    ind = compute_indicators(ohlcv)
+
+    for i, (symbol, df_feats) in enumerate(frames.items()):
+        inst_id = f"{symbol}-USDT-SWAP"
+        n = len(df_feats)
+        for col, values in qlib_features(ind, ohlcv, i).items():
+            df_feats[col] = values[-n:]
         
         # Funding & OI with REAL DATA
         try:
@@ -137,31 +137,31 @@ export async function fetchPositions(): Promise<Position[]> {
 }
 
 export async function fetchHistory(): Promise<TradeHistory[]> {
-    const res = await fetch(`${API_BASE_URL}/history`, { cache: 'no-store' });
+    const res = await fetch(`${API_BASE_URL}/history`, { cache: 'no-cache' });
     if (!res.ok) throw new Error('Failed to fetch history');
     return res.json();
 }
 
 export async function fetchAgentDecision(): Promise<AgentDecision[]> {
-    const res = await fetch(`${API_BASE_URL}/agent-decision`, { cache: 'no-store' });
+    const res = await fetch(`${API_BASE_URL}/agent-decision`, { cache: 'no-cache' });
     if (!res.ok) throw new Error('Failed to fetch agent decision');
     return res.json();
 }
 
 export async function fetchNavHistory(): Promise<NavPoint[]> {
-    const res = await fetch(`${API_BASE_URL}/nav-history`, { cache: 'no-store' });
+    const res = await fetch(`${API_BASE_URL}/nav-history`, { cache: 'no-cache' });
     if (!res.ok) throw new Error('Failed to fetch nav history');
     return res.json();
 }
 
 export async function fetchMarketStats(): Promise<MarketStats> {
-    const res = await fetch(`${API_BASE_URL}/market-stats`, { cache: 'no-store' });
+    const res = await fetch(`${API_BASE_URL}/market-stats`, { cache: 'no-cache' });
     if (!res.ok) throw new Error('Failed to fetch market stats');
     return res.json();
 }
 
 export async function fetchCryptoData(): Promise<CryptoDataResponse> {
-    const res = await fetch(`${API_BASE_URL}/crypto-data`, { cache: 'no-store' });
+    const res = await fetch(`${API_BASE_URL}/crypto-data`, { cache: 'no-cache' });
     if (!res.ok) throw new Error('Failed to fetch crypto data');
     return res.json();
 }